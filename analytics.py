@@ -0,0 +1,319 @@
+import sqlite3
+from datetime import date, timedelta
+from config import DB_PATH
+
+# Loan_id up to which new loans have been counted in the rollups
+WATERMARK_NAME = 'BOOK_LOANS.Loan_id'
+
+
+def update_rollups():
+    """
+    Fold new circulation activity into the rollup tables.
+
+    Checkouts are counted from BOOK_LOANS rows above the Loan_id watermark.
+    Every counted loan is also placed in ROLLUP_PENDING_RETURNS; once its
+    Date_in is set, its return (loan length, overdue or not) is counted
+    and it leaves the pending set. Each run therefore only touches new
+    loans and currently open ones, never the full history.
+
+    Returns:
+        tuple: (new_loans: int, new_returns: int)
+    """
+    conn = sqlite3.connect(DB_PATH)
+    cur = conn.cursor()
+
+    cur.execute("SELECT Value FROM ROLLUP_WATERMARK WHERE Name = ?", (WATERMARK_NAME,))
+    row = cur.fetchone()
+    watermark = row[0] if row else 0
+
+    cur.execute("SELECT COALESCE(MAX(Loan_id), 0) FROM BOOK_LOANS")
+    high = cur.fetchone()[0]
+
+    new_loans = 0
+    if high > watermark:
+        # Checkouts per day, per ISBN, per author and per borrower
+        cur.execute("""
+            INSERT INTO ROLLUP_DAILY (Day, Checkouts)
+            SELECT Date_out, COUNT(*) FROM BOOK_LOANS
+            WHERE Loan_id > ? AND Loan_id <= ?
+            GROUP BY Date_out
+            ON CONFLICT (Day) DO UPDATE SET Checkouts = Checkouts + excluded.Checkouts
+        """, (watermark, high))
+        cur.execute("""
+            INSERT INTO ROLLUP_ISBN_DAILY (Day, Isbn, Checkouts)
+            SELECT Date_out, Isbn, COUNT(*) FROM BOOK_LOANS
+            WHERE Loan_id > ? AND Loan_id <= ?
+            GROUP BY Date_out, Isbn
+            ON CONFLICT (Day, Isbn) DO UPDATE SET Checkouts = Checkouts + excluded.Checkouts
+        """, (watermark, high))
+        cur.execute("""
+            INSERT INTO ROLLUP_AUTHOR_DAILY (Day, Author_id, Checkouts)
+            SELECT bl.Date_out, ba.Author_id, COUNT(*)
+            FROM BOOK_LOANS bl
+            JOIN BOOK_AUTHORS ba ON bl.Isbn = ba.Isbn
+            WHERE bl.Loan_id > ? AND bl.Loan_id <= ?
+            GROUP BY bl.Date_out, ba.Author_id
+            ON CONFLICT (Day, Author_id) DO UPDATE SET Checkouts = Checkouts + excluded.Checkouts
+        """, (watermark, high))
+        cur.execute("""
+            INSERT INTO ROLLUP_BORROWER_DAILY (Day, Card_id, Checkouts)
+            SELECT Date_out, Card_id, COUNT(*) FROM BOOK_LOANS
+            WHERE Loan_id > ? AND Loan_id <= ?
+            GROUP BY Date_out, Card_id
+            ON CONFLICT (Day, Card_id) DO UPDATE SET Checkouts = Checkouts + excluded.Checkouts
+        """, (watermark, high))
+        cur.execute("""
+            INSERT OR IGNORE INTO ROLLUP_PENDING_RETURNS (Loan_id)
+            SELECT Loan_id FROM BOOK_LOANS
+            WHERE Loan_id > ? AND Loan_id <= ?
+        """, (watermark, high))
+        new_loans = cur.rowcount
+
+        cur.execute("""
+            INSERT INTO ROLLUP_WATERMARK (Name, Value) VALUES (?, ?)
+            ON CONFLICT (Name) DO UPDATE SET Value = excluded.Value
+        """, (WATERMARK_NAME, high))
+
+    # Returns of loans that were still open at the previous run (or are new and already closed)
+    returned = """
+        SELECT bl.Loan_id, bl.Card_id, bl.Date_out, bl.Due_date, bl.Date_in
+        FROM ROLLUP_PENDING_RETURNS p
+        JOIN BOOK_LOANS bl ON p.Loan_id = bl.Loan_id
+        WHERE bl.Date_in IS NOT NULL
+    """
+    cur.execute(f"""
+        INSERT INTO ROLLUP_DAILY (Day, Returns, Loan_days, Overdue_returns)
+        SELECT Date_in, COUNT(*),
+               SUM(julianday(Date_in) - julianday(Date_out)),
+               SUM(Date_in > Due_date)
+        FROM ({returned})
+        WHERE true
+        GROUP BY Date_in
+        ON CONFLICT (Day) DO UPDATE SET
+            Returns = Returns + excluded.Returns,
+            Loan_days = Loan_days + excluded.Loan_days,
+            Overdue_returns = Overdue_returns + excluded.Overdue_returns
+    """)
+    cur.execute(f"""
+        INSERT INTO ROLLUP_BORROWER_DAILY (Day, Card_id, Overdue_returns)
+        SELECT Date_in, Card_id, COUNT(*)
+        FROM ({returned})
+        WHERE Date_in > Due_date
+        GROUP BY Date_in, Card_id
+        ON CONFLICT (Day, Card_id) DO UPDATE SET
+            Overdue_returns = Overdue_returns + excluded.Overdue_returns
+    """)
+    cur.execute(f"""
+        DELETE FROM ROLLUP_PENDING_RETURNS
+        WHERE Loan_id IN (SELECT Loan_id FROM ({returned}))
+    """)
+    new_returns = cur.rowcount
+
+    conn.commit()
+    conn.close()
+    return new_loans, new_returns
+
+
+def _default_range(start, end):
+    if isinstance(end, str):
+        end = date.fromisoformat(end)
+    end = end or date.today()
+    start = start or end - timedelta(days=30)
+    return str(start), str(end)
+
+
+def daily_stats(start=None, end=None):
+    """
+    Get per-day circulation statistics from the rollups.
+
+    Args:
+        start: First day (date or 'YYYY-MM-DD'; default 30 days before end)
+        end: Last day (date or 'YYYY-MM-DD'; default today)
+
+    Returns:
+        list: Dictionaries with keys Day, Checkouts, Returns, Avg_loan_days, Overdue_rate
+    """
+    start, end = _default_range(start, end)
+    conn = sqlite3.connect(DB_PATH)
+    conn.row_factory = sqlite3.Row
+    cur = conn.cursor()
+
+    cur.execute("""
+        SELECT Day, Checkouts, Returns, Loan_days, Overdue_returns
+        FROM ROLLUP_DAILY
+        WHERE Day BETWEEN ? AND ?
+        ORDER BY Day
+    """, (start, end))
+
+    stats = []
+    for row in cur.fetchall():
+        stats.append({
+            'Day': row['Day'],
+            'Checkouts': row['Checkouts'],
+            'Returns': row['Returns'],
+            'Avg_loan_days': row['Loan_days'] / row['Returns'] if row['Returns'] else None,
+            'Overdue_rate': row['Overdue_returns'] / row['Returns'] if row['Returns'] else None
+        })
+
+    conn.close()
+    return stats
+
+
+def summary(start=None, end=None):
+    """
+    Get totals for a date range: checkouts, returns, average loan length and overdue rate.
+
+    Returns:
+        dict: Keys Start, End, Checkouts, Returns, Avg_loan_days, Overdue_rate
+    """
+    start, end = _default_range(start, end)
+    conn = sqlite3.connect(DB_PATH)
+    cur = conn.cursor()
+
+    cur.execute("""
+        SELECT COALESCE(SUM(Checkouts), 0), COALESCE(SUM(Returns), 0),
+               COALESCE(SUM(Loan_days), 0), COALESCE(SUM(Overdue_returns), 0)
+        FROM ROLLUP_DAILY
+        WHERE Day BETWEEN ? AND ?
+    """, (start, end))
+    checkouts, returns, loan_days, overdue = cur.fetchone()
+    conn.close()
+
+    return {
+        'Start': start,
+        'End': end,
+        'Checkouts': checkouts,
+        'Returns': returns,
+        'Avg_loan_days': loan_days / returns if returns else None,
+        'Overdue_rate': overdue / returns if returns else None
+    }
+
+
+def top_isbns(start=None, end=None, limit=10):
+    """
+    Get the most-borrowed books in a date range.
+
+    Returns:
+        list: Dictionaries with keys ISBN, Title, Checkouts
+    """
+    start, end = _default_range(start, end)
+    conn = sqlite3.connect(DB_PATH)
+    conn.row_factory = sqlite3.Row
+    cur = conn.cursor()
+
+    cur.execute("""
+        SELECT r.Isbn, b.Title, SUM(r.Checkouts) as Checkouts
+        FROM ROLLUP_ISBN_DAILY r
+        JOIN BOOK b ON r.Isbn = b.Isbn
+        WHERE r.Day BETWEEN ? AND ?
+        GROUP BY r.Isbn, b.Title
+        ORDER BY Checkouts DESC, r.Isbn
+        LIMIT ?
+    """, (start, end, limit))
+    results = [{'ISBN': row['Isbn'], 'Title': row['Title'], 'Checkouts': row['Checkouts']}
+               for row in cur.fetchall()]
+
+    conn.close()
+    return results
+
+
+def top_authors(start=None, end=None, limit=10):
+    """
+    Get the most-borrowed authors in a date range.
+
+    Returns:
+        list: Dictionaries with keys Author_id, Name, Checkouts
+    """
+    start, end = _default_range(start, end)
+    conn = sqlite3.connect(DB_PATH)
+    conn.row_factory = sqlite3.Row
+    cur = conn.cursor()
+
+    cur.execute("""
+        SELECT r.Author_id, a.Name, SUM(r.Checkouts) as Checkouts
+        FROM ROLLUP_AUTHOR_DAILY r
+        JOIN AUTHORS a ON r.Author_id = a.Author_id
+        WHERE r.Day BETWEEN ? AND ?
+        GROUP BY r.Author_id, a.Name
+        ORDER BY Checkouts DESC, r.Author_id
+        LIMIT ?
+    """, (start, end, limit))
+    results = [{'Author_id': row['Author_id'], 'Name': row['Name'], 'Checkouts': row['Checkouts']}
+               for row in cur.fetchall()]
+
+    conn.close()
+    return results
+
+
+def top_borrowers(start=None, end=None, limit=10):
+    """
+    Get the borrowers with the most checkouts in a date range.
+
+    Returns:
+        list: Dictionaries with keys Card_id, Bname, Checkouts, Overdue_returns
+    """
+    start, end = _default_range(start, end)
+    conn = sqlite3.connect(DB_PATH)
+    conn.row_factory = sqlite3.Row
+    cur = conn.cursor()
+
+    cur.execute("""
+        SELECT r.Card_id, br.Bname, SUM(r.Checkouts) as Checkouts, SUM(r.Overdue_returns) as Overdue_returns
+        FROM ROLLUP_BORROWER_DAILY r
+        JOIN BORROWER br ON r.Card_id = br.Card_id
+        WHERE r.Day BETWEEN ? AND ?
+        GROUP BY r.Card_id, br.Bname
+        ORDER BY Checkouts DESC, r.Card_id
+        LIMIT ?
+    """, (start, end, limit))
+    results = [dict(row) for row in cur.fetchall()]
+
+    conn.close()
+    return results
+
+
+def format_report(start=None, end=None, limit=10):
+    """
+    Build a plain-text circulation report from the rollups.
+
+    Returns:
+        str: Report text
+    """
+    totals = summary(start, end)
+    avg_days = f"{totals['Avg_loan_days']:.1f}" if totals['Avg_loan_days'] is not None else "n/a"
+    overdue = f"{totals['Overdue_rate']:.1%}" if totals['Overdue_rate'] is not None else "n/a"
+
+    lines = [
+        f"Circulation Report: {totals['Start']} to {totals['End']}",
+        "=" * 80,
+        f"Checkouts: {totals['Checkouts']}    Returns: {totals['Returns']}    "
+        f"Avg loan length: {avg_days} days    Overdue returns: {overdue}",
+        "",
+        f"{'DAY':<12} {'CHECKOUTS':>10} {'RETURNS':>10} {'AVG DAYS':>10} {'OVERDUE':>10}",
+        "-" * 80,
+    ]
+    for day in daily_stats(totals['Start'], totals['End']):
+        day_avg = f"{day['Avg_loan_days']:.1f}" if day['Avg_loan_days'] is not None else "-"
+        day_overdue = f"{day['Overdue_rate']:.0%}" if day['Overdue_rate'] is not None else "-"
+        lines.append(f"{day['Day']:<12} {day['Checkouts']:>10} {day['Returns']:>10} {day_avg:>10} {day_overdue:>10}")
+
+    lines += ["", "Most Borrowed Books", "-" * 80]
+    for idx, book in enumerate(top_isbns(totals['Start'], totals['End'], limit), 1):
+        lines.append(f"{idx:<4} {book['ISBN']:<15} {book['Title'][:49]:<50} {book['Checkouts']:>6}")
+
+    lines += ["", "Most Borrowed Authors", "-" * 80]
+    for idx, author in enumerate(top_authors(totals['Start'], totals['End'], limit), 1):
+        lines.append(f"{idx:<4} {author['Name'][:64]:<65} {author['Checkouts']:>6}")
+
+    lines += ["", "Most Active Borrowers", "-" * 80]
+    for idx, borrower in enumerate(top_borrowers(totals['Start'], totals['End'], limit), 1):
+        lines.append(f"{idx:<4} {borrower['Card_id']:<12} {borrower['Bname'][:39]:<40} "
+                     f"{borrower['Checkouts']:>6} checkouts {borrower['Overdue_returns']:>4} late")
+
+    return "\n".join(lines) + "\n"
+
+
+if __name__ == "__main__":
+    new_loans, new_returns = update_rollups()
+    print(f"Rolled up {new_loans} new loan(s) and {new_returns} return(s).")
+    print(format_report())
@@ -0,0 +1,192 @@
+import sqlite3
+import sys
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+from config import DB_PATH, BACKUP_DIR, BACKUP_INTERVAL_HOURS, BACKUP_RETAIN
+
+PAGES_PER_STEP = 256      # pages copied per backup step (1 MB with 4 KB pages)
+STEP_SLEEP_MS = 50        # sleep after each step so desk writes get the database
+MAX_RESTARTS = 5          # after this many restarts, copy the rest in one step
+BACKUP_PREFIX = "library-"
+
+
+class _TooManyRestarts(Exception):
+    pass
+
+
+def backup_path(backup_dir=None, when=None):
+    """Return the file name for a backup taken at `when` (default: now)"""
+    when = when or datetime.now()
+    return Path(backup_dir or BACKUP_DIR) / f"{BACKUP_PREFIX}{when.strftime('%Y%m%d-%H%M%S')}.db"
+
+
+def list_backups(backup_dir=None):
+    """Return the backup files in backup_dir, oldest first"""
+    directory = Path(backup_dir or BACKUP_DIR)
+    if not directory.exists():
+        return []
+    return sorted(directory.glob(f"{BACKUP_PREFIX}*.db"))
+
+
+def verify_backup(path):
+    """
+    Check that a backup file is a sound SQLite database with the library tables.
+
+    Returns:
+        tuple: (success: bool, message: str)
+    """
+    try:
+        conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+        result = conn.execute("PRAGMA integrity_check").fetchone()[0]
+        tables = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+        conn.close()
+    except sqlite3.Error as e:
+        return False, f"Database error: {str(e)}"
+
+    if result != "ok":
+        return False, f"Error: Integrity check failed: {result}"
+    missing = {"BOOK", "BORROWER", "BOOK_LOANS", "FINES"} - tables
+    if missing:
+        return False, f"Error: Backup is missing tables: {', '.join(sorted(missing))}"
+    return True, "Backup verified."
+
+
+def rotate_backups(backup_dir=None, retain=BACKUP_RETAIN):
+    """Delete all but the newest `retain` backups. Returns the deleted paths."""
+    backups = list_backups(backup_dir)
+    expired = backups[:-retain] if retain > 0 else backups
+    for path in expired:
+        path.unlink()
+    return expired
+
+
+def backup(dest=None, pages_per_step=PAGES_PER_STEP, step_sleep_ms=STEP_SLEEP_MS,
+           verify=True, retain=BACKUP_RETAIN, db_path=None):
+    """
+    Copy the live database with the SQLite online backup API.
+
+    The copy is made a few pages at a time, sleeping step_sleep_ms after
+    each step (from the progress callback), so checkouts and check-ins on
+    other connections keep going while it runs.
+    A write from another connection makes SQLite restart the copy; after
+    MAX_RESTARTS restarts the remainder is copied in a single step so a
+    busy desk cannot starve the backup. The copy is written to a .partial
+    file, verified, and only then renamed into place, after which old
+    backups beyond `retain` are deleted.
+
+    Args:
+        dest (str): Backup file (default: BACKUP_DIR/library-<timestamp>.db)
+        pages_per_step (int): Pages copied per step
+        step_sleep_ms (int): Pause between steps in milliseconds
+        verify (bool): Run an integrity check on the copy
+        retain (int): Number of backups to keep in the backup directory
+        db_path (str): Database to back up (default: config.DB_PATH)
+
+    Returns:
+        tuple: (success: bool, message: str, stats: dict)
+               stats has keys Path, Pages, Steps, Restarts, Seconds
+    """
+    dest = Path(dest) if dest else backup_path()
+    dest.parent.mkdir(parents=True, exist_ok=True)
+    partial = dest.with_name(dest.name + ".partial")
+    stats = {'Path': str(dest), 'Pages': 0, 'Steps': 0, 'Restarts': 0, 'Seconds': 0.0}
+    start = time.perf_counter()
+
+    last_remaining = None
+
+    def progress(status, remaining, total):
+        nonlocal last_remaining
+        stats['Steps'] += 1
+        stats['Pages'] = total
+        if last_remaining is not None and remaining > last_remaining:
+            stats['Restarts'] += 1
+            if stats['Restarts'] > MAX_RESTARTS:
+                raise _TooManyRestarts()
+        last_remaining = remaining
+        # Connection.backup's own sleep only applies after SQLITE_BUSY/LOCKED;
+        # pause here so every step hands the database back to the desk
+        if remaining and step_sleep_ms:
+            time.sleep(step_sleep_ms / 1000)
+
+    source = sqlite3.connect(db_path or DB_PATH)
+    try:
+        target = sqlite3.connect(partial)
+        try:
+            try:
+                source.backup(target, pages=pages_per_step, progress=progress)
+            except _TooManyRestarts:
+                source.backup(target, pages=-1)
+                stats['Steps'] += 1
+        finally:
+            target.close()
+    except sqlite3.Error as e:
+        source.close()
+        partial.unlink(missing_ok=True)
+        return False, f"Database error: {str(e)}", stats
+    source.close()
+
+    if verify:
+        ok, message = verify_backup(partial)
+        if not ok:
+            partial.unlink(missing_ok=True)
+            return False, message, stats
+
+    partial.replace(dest)
+    if dest.parent == Path(BACKUP_DIR):
+        rotate_backups(dest.parent, retain)
+
+    stats['Seconds'] = time.perf_counter() - start
+    return True, (f"Backed up {stats['Pages']} pages to {dest} in {stats['Seconds']:.2f}s "
+                  f"({stats['Steps']} steps, {stats['Restarts']} restarts)."), stats
+
+
+class BackupScheduler:
+    """
+    Background thread that takes a backup whenever the newest one is older
+    than the interval. Checks once a minute, so a terminal that was closed
+    past the due time backs up shortly after it starts again.
+    """
+
+    def __init__(self, interval_hours=BACKUP_INTERVAL_HOURS, check_seconds=60, on_result=None):
+        self.interval = interval_hours * 3600
+        self.check_seconds = check_seconds
+        self.on_result = on_result
+        self.stopping = threading.Event()
+        self.thread = None
+
+    def start(self):
+        if self.thread and self.thread.is_alive():
+            return self
+        self.stopping.clear()
+        self.thread = threading.Thread(target=self.run, name="backup-scheduler", daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.stopping.set()
+        if self.thread:
+            self.thread.join()
+
+    def due(self):
+        backups = list_backups()
+        return not backups or time.time() - backups[-1].stat().st_mtime >= self.interval
+
+    def run(self):
+        while not self.stopping.is_set():
+            if self.due():
+                result = backup()
+                if self.on_result:
+                    self.on_result(result)
+            self.stopping.wait(self.check_seconds)
+
+
+if __name__ == "__main__":
+    # Usage: python backup.py [destination] | --verify <file>
+    if len(sys.argv) > 2 and sys.argv[1] == "--verify":
+        success, message = verify_backup(sys.argv[2])
+    else:
+        success, message, stats = backup(sys.argv[1] if len(sys.argv) > 1 else None)
+    print(message)
+    sys.exit(0 if success else 1)
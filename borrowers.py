@@ -0,0 +1,245 @@
+import sqlite3
+import csv
+import sys
+from itertools import islice
+from config import DB_PATH
+
+CARD_ID_PREFIX = "ID"
+CARD_ID_DIGITS = 6
+
+IMPORT_COLUMNS = ["Bname", "Address", "Phone", "Ssn"]
+IMPORT_CHUNK_SIZE = 5000
+SSN_LOOKUP_BATCH = 500
+
+
+def format_card_id(number):
+    """Format a sequence number as a Card_id, e.g. 42 -> 'ID000042'."""
+    return f"{CARD_ID_PREFIX}{number:0{CARD_ID_DIGITS}d}"
+
+
+def seed_card_id_sequence(cur):
+    """
+    Create the Card_id sequence row from the highest existing card number.
+
+    Only needed once per database (init_db calls it after loading
+    borrower.csv); later allocations never look at BORROWER.
+    """
+    cur.execute("""
+        SELECT MAX(CAST(SUBSTR(Card_id, ?) AS INTEGER))
+        FROM BORROWER
+        WHERE Card_id LIKE ?
+    """, (len(CARD_ID_PREFIX) + 1, f"{CARD_ID_PREFIX}%"))
+    highest = cur.fetchone()[0] or 0
+    cur.execute("""
+        INSERT INTO CARD_ID_SEQUENCE (Name, Next_value)
+        VALUES ('BORROWER', ?)
+        ON CONFLICT (Name) DO UPDATE SET Next_value = MAX(Next_value, excluded.Next_value)
+    """, (highest + 1,))
+
+
+def allocate_card_ids(cur, count=1):
+    """
+    Reserve a block of consecutive card numbers inside the caller's transaction.
+
+    The UPDATE takes the database write lock, so concurrent terminals are
+    serialized on this single row and can never receive the same number.
+    If the transaction rolls back, the numbers are released again.
+
+    Args:
+        cur: Cursor on the connection that owns the current transaction
+        count (int): Number of card IDs to reserve
+
+    Returns:
+        int: First reserved number (the block is first .. first + count - 1)
+    """
+    cur.execute("""
+        UPDATE CARD_ID_SEQUENCE
+        SET Next_value = Next_value + ?
+        WHERE Name = 'BORROWER'
+        RETURNING Next_value - ?
+    """, (count, count))
+    row = cur.fetchone()
+    if row is None:
+        seed_card_id_sequence(cur)
+        return allocate_card_ids(cur, count)
+    return row[0]
+
+
+def create_borrower(bname, address, phone, ssn):
+    """
+    Create a new borrower with the next available card ID.
+
+    Args:
+        bname (str): Borrower name
+        address (str): Borrower address
+        phone (str): Borrower phone number
+        ssn (str): Borrower SSN (must be unique)
+
+    Returns:
+        tuple: (success: bool, message: str, card_id: str or None)
+    """
+    bname = bname.strip() if bname else ""
+    address = address.strip() if address else ""
+    phone = phone.strip() if phone else ""
+    ssn = ssn.strip() if ssn else ""
+
+    if not all([bname, address, phone, ssn]):
+        return False, "Error: Name, address, phone and SSN are all required.", None
+
+    conn = sqlite3.connect(DB_PATH)
+    cur = conn.cursor()
+
+    try:
+        # SSN lookup goes through the UNIQUE index on BORROWER.Ssn
+        cur.execute("SELECT Card_id FROM BORROWER WHERE Ssn = ?", (ssn,))
+        existing = cur.fetchone()
+        if existing:
+            conn.close()
+            return False, f"Error: A borrower with this SSN already exists (card ID '{existing[0]}').", None
+
+        card_id = format_card_id(allocate_card_ids(cur))
+        cur.execute("""
+            INSERT INTO BORROWER (Card_id, Bname, Address, Phone, Ssn)
+            VALUES (?, ?, ?, ?, ?)
+        """, (card_id, bname, address, phone, ssn))
+
+        conn.commit()
+        conn.close()
+
+        return True, f"Successfully created borrower '{bname}'.", card_id
+
+    except sqlite3.IntegrityError:
+        # Another terminal registered the same SSN after our lookup
+        conn.rollback()
+        conn.close()
+        return False, "Error: A borrower with this SSN already exists.", None
+
+    except sqlite3.Error as e:
+        conn.close()
+        return False, f"Database error: {str(e)}", None
+
+
+def get_borrower(card_id):
+    """
+    Get a borrower by card ID.
+
+    Args:
+        card_id (str): Borrower card ID
+
+    Returns:
+        dict: Borrower information (Card_id, Bname, Address, Phone, Ssn), or None if not found
+    """
+    conn = sqlite3.connect(DB_PATH)
+    conn.row_factory = sqlite3.Row
+    cur = conn.cursor()
+
+    cur.execute("SELECT Card_id, Bname, Address, Phone, Ssn FROM BORROWER WHERE Card_id = ?", (card_id,))
+    row = cur.fetchone()
+    conn.close()
+
+    return dict(row) if row else None
+
+
+def _existing_ssns(cur, ssns):
+    """Return the subset of ssns already in BORROWER, using the UNIQUE index on Ssn."""
+    found = set()
+    ssns = list(ssns)
+    for start in range(0, len(ssns), SSN_LOOKUP_BATCH):
+        batch = ssns[start:start + SSN_LOOKUP_BATCH]
+        placeholders = ",".join(["?"] * len(batch))
+        cur.execute(f"SELECT Ssn FROM BORROWER WHERE Ssn IN ({placeholders})", batch)
+        found.update(row[0] for row in cur.fetchall())
+    return found
+
+
+def _import_chunk(conn, rows, reject):
+    """Validate and insert one chunk of CSV rows in a single transaction."""
+    cur = conn.cursor()
+    valid = []
+    seen = set()
+
+    for row in rows:
+        values = [(row.get(col) or "").strip() for col in IMPORT_COLUMNS]
+        missing = [col for col, value in zip(IMPORT_COLUMNS, values) if not value]
+        if missing:
+            reject(row, f"Missing {', '.join(missing)}")
+            continue
+        ssn = values[3]
+        if ssn in seen:
+            reject(row, "Duplicate SSN in import file")
+            continue
+        seen.add(ssn)
+        valid.append((row, values))
+
+    existing = _existing_ssns(cur, seen)
+    insert_rows = []
+    for row, values in valid:
+        if values[3] in existing:
+            reject(row, "SSN already registered")
+            continue
+        insert_rows.append(values)
+
+    if insert_rows:
+        first = allocate_card_ids(cur, len(insert_rows))
+        cur.executemany("""
+            INSERT INTO BORROWER (Card_id, Bname, Address, Phone, Ssn)
+            VALUES (?, ?, ?, ?, ?)
+        """, ((format_card_id(first + i), *values) for i, values in enumerate(insert_rows)))
+    conn.commit()
+
+    return len(insert_rows)
+
+
+def import_borrowers(csv_file, rejects_file=None, chunk_size=IMPORT_CHUNK_SIZE):
+    """
+    Bulk-import borrowers from a CSV file without touching existing data.
+
+    The file is streamed in chunks. For each chunk, SSNs are checked
+    against the UNIQUE index in batches, a block of card IDs is reserved
+    from the sequence, and the valid rows are inserted with executemany
+    in one transaction. Rejected rows are written to the rejects file
+    with a Reason column.
+
+    Args:
+        csv_file (str): CSV with columns Bname, Address, Phone, Ssn
+        rejects_file (str): Where to write rejected rows (default: <csv_file>.rejects.csv)
+        chunk_size (int): Number of rows per transaction
+
+    Returns:
+        tuple: (imported: int, rejected: int)
+    """
+    rejects_file = rejects_file or f"{csv_file}.rejects.csv"
+    imported = 0
+    rejected = 0
+
+    conn = sqlite3.connect(DB_PATH)
+
+    with open(csv_file, newline='', encoding='utf-8') as f, \
+         open(rejects_file, 'w', newline='', encoding='utf-8') as rf:
+        reader = csv.DictReader(f)
+        fieldnames = list(reader.fieldnames or IMPORT_COLUMNS)
+        reject_writer = csv.DictWriter(rf, fieldnames=fieldnames + ['Reason'], extrasaction='ignore')
+        reject_writer.writeheader()
+
+        def reject(row, reason):
+            nonlocal rejected
+            reject_writer.writerow({**row, 'Reason': reason})
+            rejected += 1
+
+        while True:
+            rows = list(islice(reader, chunk_size))
+            if not rows:
+                break
+            imported += _import_chunk(conn, rows, reject)
+
+    conn.close()
+    return imported, rejected
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        imported, rejected = import_borrowers(sys.argv[1])
+        print(f"Imported {imported} borrower(s); {rejected} rejected.")
+    else:
+        # Test borrower lookup
+        print(get_borrower("ID000001"))
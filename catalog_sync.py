@@ -0,0 +1,232 @@
+import sqlite3
+import hashlib
+import os
+import sys
+from datetime import datetime
+from config import DB_PATH
+import ingest
+import fuzzy
+
+# (csv file, table, csv column -> table column, number of leading key columns)
+SYNC_TABLES = [
+    ("book.csv", "BOOK", {"ISBN13": "Isbn", "Title": "Title"}, 1),
+    ("authors.csv", "AUTHORS", {"Author_id": "Author_id", "Author": "Name"}, 1),
+    ("book_authors.csv", "BOOK_AUTHORS", {"ISBN13": "Isbn", "Author_id": "Author_id"}, 2),
+]
+KEY_SEPARATOR = "\x1f"
+HASH_BATCH = 500
+
+
+def _keys_and_hashes(rows, key_count):
+    """
+    Yield (row key, 16-byte content hash, row) for rows of strings.
+
+    This is the per-row hot loop of a sync, so it avoids helper calls.
+    """
+    blake2b = hashlib.blake2b
+    join = KEY_SEPARATOR.join
+    for row in rows:
+        key = row[0] if key_count == 1 else join(row[:key_count])
+        yield key, blake2b(join(row).encode('utf-8'), digest_size=16).digest(), row
+
+
+def _file_hash(path):
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _stored_hashes(cur, table, columns, key_count):
+    """
+    Return {row key: hash} for a table from CATALOG_HASHES.
+
+    The first sync of a database loaded by init_db has no hashes yet, so
+    they are computed from the table itself and stored.
+    """
+    cur.execute("SELECT Row_key, Content_hash FROM CATALOG_HASHES WHERE Tbl = ?", (table,))
+    hashes = dict(cur.fetchall())
+    if hashes:
+        return hashes
+
+    # Stored values are compared as the CSV text they were loaded from
+    cur.execute(f"SELECT {', '.join(f'CAST({col} AS TEXT)' for col in columns)} FROM {table}")
+    for key, digest, row in _keys_and_hashes(cur.fetchall(), key_count):
+        hashes[key] = digest
+    cur.executemany("INSERT INTO CATALOG_HASHES (Tbl, Row_key, Content_hash) VALUES (?, ?, ?)",
+                    [(table, key, digest) for key, digest in hashes.items()])
+    return hashes
+
+
+def _books_in_circulation(cur, isbns):
+    """Return the ISBNs that have loan history or active holds, which must not be deleted"""
+    found = set()
+    isbns = list(isbns)
+    for start in range(0, len(isbns), HASH_BATCH):
+        batch = isbns[start:start + HASH_BATCH]
+        placeholders = ",".join(["?"] * len(batch))
+        cur.execute(f"""
+            SELECT Isbn FROM BOOK_LOANS WHERE Isbn IN ({placeholders})
+            UNION
+            SELECT Isbn FROM HOLDS WHERE Isbn IN ({placeholders}) AND Status IN ('WAITING', 'READY')
+        """, batch + batch)
+        found.update(row[0] for row in cur.fetchall())
+    return found
+
+
+def sync_table(cur, path, table, col_map, key_count, workers=0):
+    """
+    Apply the difference between one CSV file and its table inside the caller's transaction.
+
+    Reading and hashing the file is linear in its size; everything written
+    to the database is proportional to the number of changed rows.
+
+    Returns:
+        dict: Counts Inserted, Updated, Deleted, Retained
+    """
+    columns = list(col_map.values())
+    keys = columns[:key_count]
+    content = columns[key_count:]
+    stats = {'Inserted': 0, 'Updated': 0, 'Deleted': 0, 'Retained': 0}
+
+    old = _stored_hashes(cur, table, columns, key_count)
+    seen = set()
+    upserts = []
+    for key, digest, row in _keys_and_hashes(ingest.read_rows(path, list(col_map), workers), key_count):
+        seen.add(key)
+        previous = old.get(key)
+        if previous != digest:
+            upserts.append((key, digest, row))
+            stats['Inserted' if previous is None else 'Updated'] += 1
+    deletes = [key for key in old if key not in seen]
+
+    # Inserts and updates in one statement: an upsert on the table's key
+    placeholders = ",".join(["?"] * len(columns))
+    if content:
+        conflict = "DO UPDATE SET " + ", ".join(f"{col} = excluded.{col}" for col in content)
+    else:
+        conflict = "DO NOTHING"
+    cur.executemany(f"""
+        INSERT INTO {table} ({', '.join(columns)}) VALUES ({placeholders})
+        ON CONFLICT ({', '.join(keys)}) {conflict}
+    """, [row for key, digest, row in upserts])
+
+    if table == "BOOK":
+        # New titles start with one copy at the default branch, as in init_db
+        new_isbns = [(row[0], row[0]) for key, digest, row in upserts if key not in old]
+        cur.executemany("""
+            INSERT INTO BOOK_COPIES (Isbn)
+            SELECT ? WHERE NOT EXISTS (SELECT 1 FROM BOOK_COPIES WHERE Isbn = ?)
+        """, new_isbns)
+        cur.executemany("""
+            INSERT OR IGNORE INTO BOOK_AVAILABILITY (Isbn, Copies, Available)
+            SELECT Isbn, COUNT(*), SUM(On_loan = 0) FROM BOOK_COPIES WHERE Isbn = ?
+        """, [(isbn,) for isbn, _ in new_isbns])
+
+        # Titles with loan history or active holds stay, so circulation data keeps its book
+        retained = _books_in_circulation(cur, deletes)
+        stats['Retained'] = len(retained)
+        deletes = [key for key in deletes if key not in retained]
+        cur.executemany("DELETE FROM BOOK_AVAILABILITY WHERE Isbn = ?", [(key,) for key in deletes])
+        cur.executemany("DELETE FROM BOOK_COPIES WHERE Isbn = ?", [(key,) for key in deletes])
+        cur.executemany("DELETE FROM HOLDS WHERE Isbn = ?", [(key,) for key in deletes])
+
+    # Keep the typo-tolerant search indexes in step
+    if table == "BOOK":
+        fuzzy.update_titles(cur, [row for key, digest, row in upserts],
+                            [key for key, digest, row in upserts if key in old] + deletes)
+    elif table == "AUTHORS":
+        fuzzy.update_authors(cur, [row for key, digest, row in upserts],
+                             [key for key, digest, row in upserts if key in old] + deletes)
+
+    where = " AND ".join(f"{col} = ?" for col in keys)
+    cur.executemany(f"DELETE FROM {table} WHERE {where}", [key.split(KEY_SEPARATOR) for key in deletes])
+    stats['Deleted'] = len(deletes)
+
+    cur.executemany("""
+        INSERT INTO CATALOG_HASHES (Tbl, Row_key, Content_hash) VALUES (?, ?, ?)
+        ON CONFLICT (Tbl, Row_key) DO UPDATE SET Content_hash = excluded.Content_hash
+    """, [(table, key, digest) for key, digest, row in upserts])
+    cur.executemany("DELETE FROM CATALOG_HASHES WHERE Tbl = ? AND Row_key = ?",
+                    [(table, key) for key in deletes])
+    return stats
+
+
+def sync_catalog(csv_dir=".", dry_run=False, force=False, workers=None):
+    """
+    Bring BOOK, AUTHORS and BOOK_AUTHORS in line with new catalog CSVs.
+
+    Each row's content hash is compared with the one stored in
+    CATALOG_HASHES, and only inserts, updates and deletes are written,
+    all in one transaction. A CSV file whose hash matches the last sync
+    is skipped without being parsed. Loans, fines, borrowers and holds
+    are untouched, and books with loan history or active holds are never
+    deleted (they are counted as Retained).
+
+    Args:
+        csv_dir (str): Directory with book.csv, authors.csv and book_authors.csv
+        dry_run (bool): Compute the changes but roll them back
+        force (bool): Compare files even if they are unchanged since the last sync
+        workers (int): Processes for parsing the CSVs (default: one per CPU beyond the first)
+
+    Returns:
+        tuple: (success: bool, message: str, stats: dict table -> counts)
+    """
+    if workers is None:
+        workers = (os.cpu_count() or 1) - 1
+    conn = sqlite3.connect(DB_PATH)
+    cur = conn.cursor()
+    stats = {}
+
+    try:
+        cur.execute("BEGIN IMMEDIATE")
+        for csv_file, table, col_map, key_count in SYNC_TABLES:
+            path = os.path.join(csv_dir, csv_file)
+            file_hash = _file_hash(path)
+            cur.execute("SELECT File_hash FROM CATALOG_FILES WHERE Tbl = ?", (table,))
+            row = cur.fetchone()
+            if row and row[0] == file_hash and not force:
+                stats[table] = {'Inserted': 0, 'Updated': 0, 'Deleted': 0, 'Retained': 0, 'Skipped': True}
+                continue
+
+            stats[table] = sync_table(cur, path, table, col_map, key_count, workers)
+            cur.execute("""
+                INSERT INTO CATALOG_FILES (Tbl, File_hash, Synced_at) VALUES (?, ?, ?)
+                ON CONFLICT (Tbl) DO UPDATE SET File_hash = excluded.File_hash, Synced_at = excluded.Synced_at
+            """, (table, file_hash, datetime.now().isoformat(timespec='seconds')))
+
+        if dry_run:
+            conn.rollback()
+        else:
+            conn.commit()
+        conn.close()
+
+    except (OSError, ingest.IngestError) as e:
+        conn.rollback()
+        conn.close()
+        return False, f"Error: {str(e)}", stats
+
+    except sqlite3.Error as e:
+        conn.rollback()
+        conn.close()
+        return False, f"Database error: {str(e)}", stats
+
+    lines = []
+    for table, counts in stats.items():
+        if counts.get('Skipped'):
+            lines.append(f"{table}: unchanged")
+        else:
+            lines.append(f"{table}: {counts['Inserted']} inserted, {counts['Updated']} updated, "
+                         f"{counts['Deleted']} deleted, {counts['Retained']} kept for circulation")
+    prefix = "Dry run (nothing written). " if dry_run else ""
+    return True, prefix + "; ".join(lines), stats
+
+
+if __name__ == "__main__":
+    # Usage: python catalog_sync.py [csv directory] [--dry-run] [--force]
+    args = [arg for arg in sys.argv[1:] if not arg.startswith("--")]
+    success, message, stats = sync_catalog(args[0] if args else ".",
+                                           dry_run="--dry-run" in sys.argv, force="--force" in sys.argv)
+    print(message)
+    sys.exit(0 if success else 1)
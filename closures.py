@@ -0,0 +1,206 @@
+import sqlite3
+import sys
+from datetime import date, datetime, timedelta
+from config import DB_PATH, CLOSED_WEEKDAYS
+
+LOOKAHEAD_DAYS = 62   # closures read past a due date when moving it to an open day
+MAX_CLOSED_RUN = 366  # a longer run of closed days is a data error, not a calendar
+
+
+def _to_date(value):
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    return date.fromisoformat(value)
+
+
+class ClosureCalendar:
+    """
+    Open and closed days, with prefix sums so counting open days is O(1).
+
+    A day is closed if its weekday is in closed_weekdays or it is listed
+    in LIBRARY_CLOSURES. open_through(day), the number of open days from
+    0001-01-01 up to and including day, is the weekly count (whole weeks
+    times open weekdays, plus a per-weekday prefix for the partial week)
+    minus a lookup in the prefix sums of listed closures. The open days
+    between any two dates are the difference of two such lookups.
+    """
+
+    def __init__(self, closed_days=(), closed_weekdays=CLOSED_WEEKDAYS):
+        self.closed_weekdays = frozenset(closed_weekdays)
+        if len(self.closed_weekdays) >= 7:
+            raise ValueError("The library must be open on at least one weekday.")
+        # week_prefix[r]: open days among the first r weekdays (Monday first);
+        # ordinal 1 (0001-01-01) is a Monday
+        self.week_prefix = [0]
+        for weekday in range(7):
+            self.week_prefix.append(self.week_prefix[-1] + (weekday not in self.closed_weekdays))
+
+        # Listed closures that fall on otherwise open days, as ordinals
+        extra = sorted({day.toordinal() for day in map(_to_date, closed_days)
+                        if day.weekday() not in self.closed_weekdays})
+        self.closed_days = frozenset(extra)
+        self.first = extra[0] if extra else 0
+        # closed_prefix[i]: listed closures on or before ordinal first + i
+        self.closed_prefix = []
+        count = 0
+        for ordinal in range(self.first, (extra[-1] + 1) if extra else 0):
+            if ordinal in self.closed_days:
+                count += 1
+            self.closed_prefix.append(count)
+
+    def is_open(self, day):
+        day = _to_date(day)
+        return day.weekday() not in self.closed_weekdays and day.toordinal() not in self.closed_days
+
+    def open_through(self, day):
+        """Number of open days from 0001-01-01 up to and including day"""
+        ordinal = _to_date(day).toordinal()
+        weeks, rest = divmod(ordinal, 7)
+        opened = weeks * self.week_prefix[7] + self.week_prefix[rest]
+        index = ordinal - self.first
+        if index < 0:
+            return opened
+        if index >= len(self.closed_prefix):
+            return opened - len(self.closed_days)
+        return opened - self.closed_prefix[index]
+
+    def open_days_between(self, start, end):
+        """Open days after start, up to and including end (0 if end <= start)"""
+        return max(0, self.open_through(end) - self.open_through(start))
+
+    def next_open_day(self, day):
+        """day itself if the library is open then, otherwise the first open day after it"""
+        start = _to_date(day)
+        for offset in range(MAX_CLOSED_RUN):
+            day = start + timedelta(days=offset)
+            if self.is_open(day):
+                return day
+        raise ValueError(f"No open day within {MAX_CLOSED_RUN} days of {start}; check LIBRARY_CLOSURES.")
+
+
+def load_calendar(cur):
+    """Build the calendar from LIBRARY_CLOSURES and config.CLOSED_WEEKDAYS"""
+    cur.execute("SELECT Closed_on FROM LIBRARY_CLOSURES")
+    return ClosureCalendar([row[0] for row in cur.fetchall()])
+
+
+def get_calendar(db_path=None):
+    """Load the current calendar from the database"""
+    conn = sqlite3.connect(db_path or DB_PATH)
+    calendar = load_calendar(conn.cursor())
+    conn.close()
+    return calendar
+
+
+def next_open_day(cur, day):
+    """
+    Move a date forward to the first day the library is open.
+
+    Used for due dates at checkout, so it reads only the closures from
+    that day on (an index range) instead of building the whole calendar.
+    Raises ValueError rather than searching past MAX_CLOSED_RUN closed days.
+    """
+    start = day = _to_date(day)
+    while day - start < timedelta(days=MAX_CLOSED_RUN):
+        cur.execute("SELECT Closed_on FROM LIBRARY_CLOSURES WHERE Closed_on >= ? ORDER BY Closed_on LIMIT ?",
+                    (day.isoformat(), LOOKAHEAD_DAYS))
+        closed = {row[0] for row in cur.fetchall()}
+        for _ in range(LOOKAHEAD_DAYS):
+            if day.weekday() not in CLOSED_WEEKDAYS and day.isoformat() not in closed:
+                return day
+            day += timedelta(days=1)
+    raise ValueError(f"No open day within {MAX_CLOSED_RUN} days of {start}; check LIBRARY_CLOSURES.")
+
+
+def add_closure(day, reason=""):
+    """
+    Mark a day as closed.
+
+    Loans already due that day keep their due date; the closed day is
+    simply not charged.
+
+    Returns:
+        tuple: (success: bool, message: str)
+    """
+    try:
+        day = _to_date(day)
+    except ValueError:
+        return False, f"Error: '{day}' is not a date (YYYY-MM-DD)."
+
+    conn = sqlite3.connect(DB_PATH)
+    cur = conn.cursor()
+    try:
+        cur.execute("""
+            INSERT INTO LIBRARY_CLOSURES (Closed_on, Reason) VALUES (?, ?)
+            ON CONFLICT (Closed_on) DO UPDATE SET Reason = excluded.Reason
+        """, (day.isoformat(), reason))
+        conn.commit()
+        conn.close()
+        return True, f"Closed on {day}."
+    except sqlite3.Error as e:
+        conn.close()
+        return False, f"Database error: {str(e)}"
+
+
+def remove_closure(day):
+    """
+    Open a previously closed day again.
+
+    Returns:
+        tuple: (success: bool, message: str)
+    """
+    try:
+        day = _to_date(day)
+    except ValueError:
+        return False, f"Error: '{day}' is not a date (YYYY-MM-DD)."
+
+    conn = sqlite3.connect(DB_PATH)
+    cur = conn.cursor()
+    try:
+        cur.execute("DELETE FROM LIBRARY_CLOSURES WHERE Closed_on = ?", (day.isoformat(),))
+        removed = cur.rowcount
+        conn.commit()
+        conn.close()
+    except sqlite3.Error as e:
+        conn.close()
+        return False, f"Database error: {str(e)}"
+    if not removed:
+        return False, f"Error: {day} is not a listed closure."
+    return True, f"Open on {day}."
+
+
+def list_closures(since=None):
+    """
+    Return the listed closures, earliest first.
+
+    Args:
+        since (date): Only closures on or after this day (default: all)
+
+    Returns:
+        list: Dictionaries with keys Closed_on, Reason
+    """
+    conn = sqlite3.connect(DB_PATH)
+    conn.row_factory = sqlite3.Row
+    cur = conn.cursor()
+    cur.execute("SELECT Closed_on, Reason FROM LIBRARY_CLOSURES WHERE Closed_on >= ? ORDER BY Closed_on",
+                (_to_date(since).isoformat() if since else "",))
+    closures = [{'Closed_on': row['Closed_on'], 'Reason': row['Reason']} for row in cur.fetchall()]
+    conn.close()
+    return closures
+
+
+if __name__ == "__main__":
+    # Usage: python closures.py list | add YYYY-MM-DD [reason] | remove YYYY-MM-DD
+    args = sys.argv[1:]
+    if args[:1] == ["add"] and len(args) >= 2:
+        success, message = add_closure(args[1], " ".join(args[2:]))
+    elif args[:1] == ["remove"] and len(args) == 2:
+        success, message = remove_closure(args[1])
+    else:
+        for closure in list_closures():
+            print(f"{closure['Closed_on']}  {closure['Reason'] or ''}")
+        sys.exit(0)
+    print(message)
+    sys.exit(0 if success else 1)
@@ -3,6 +3,7 @@ Configuration module for Library Management System
 Provides shared database path that works regardless of execution directory
 """
 import os
+import socket
 from pathlib import Path
 
 # Get the directory where this config file is located
@@ -11,3 +12,59 @@ BASE_DIR = Path(__file__).parent.absolute()
 # Database path - always relative to this module's location
 DB_PATH = str(BASE_DIR / "library.db")
 
+# Online backups (backup.py): where they go, how often the GUI takes one
+# (0 disables the schedule), and how many are kept
+BACKUP_DIR = str(BASE_DIR / "backups")
+BACKUP_INTERVAL_HOURS = 24
+BACKUP_RETAIN = 7
+
+# Opt-in allocation tracing of the large result paths (memprofile.py);
+# set LIBRARY_MEMPROFILE=1 to start with it on. Adds a Memory tab to the GUI.
+MEMORY_PROFILING = os.environ.get("LIBRARY_MEMPROFILE") == "1"
+
+# Branch databases for federated search (federation.py): branch name -> path
+# of that branch's library.db. Set LIBRARY_BRANCHES to e.g.
+# "Main=/srv/main/library.db;East=/srv/east/library.db". Empty means this
+# terminal only sees DB_PATH.
+BRANCHES = {}
+for _entry in os.environ.get("LIBRARY_BRANCHES", "").split(";"):
+    if "=" in _entry:
+        _name, _path = _entry.split("=", 1)
+        BRANCHES[_name.strip()] = _path.strip()
+
+# Weekdays the library is always closed (0 = Monday ... 6 = Sunday), e.g.
+# LIBRARY_CLOSED_WEEKDAYS="6". Holidays and other closed days are listed in
+# the LIBRARY_CLOSURES table (closures.py). No fines accrue and nothing
+# falls due on a closed day.
+try:
+    CLOSED_WEEKDAYS = tuple(sorted({int(day) for day in os.environ.get("LIBRARY_CLOSED_WEEKDAYS", "").split(",")
+                                    if day.strip()}))
+except ValueError:
+    raise ValueError("LIBRARY_CLOSED_WEEKDAYS must be comma-separated weekday numbers, e.g. \"6\" or \"5,6\".") from None
+if any(day not in range(7) for day in CLOSED_WEEKDAYS):
+    raise ValueError("LIBRARY_CLOSED_WEEKDAYS: weekdays are 0 (Monday) to 6 (Sunday).")
+if len(CLOSED_WEEKDAYS) == 7:
+    raise ValueError("LIBRARY_CLOSED_WEEKDAYS: the library must be open on at least one weekday.")
+
+# Circulation metrics in Prometheus text format (metrics.py): serve them on
+# http://127.0.0.1:<port>/metrics and/or rewrite a file every few seconds
+# (e.g. for node_exporter's textfile collector). 0 / empty turns each off.
+METRICS_PORT = int(os.environ.get("LIBRARY_METRICS_PORT", "0"))
+METRICS_FILE = os.environ.get("LIBRARY_METRICS_FILE", "")
+METRICS_FILE_INTERVAL = 15  # seconds
+
+# Route checkouts and check-ins through the group-commit circulation journal
+# (journal.py) instead of committing each one separately; set
+# LIBRARY_JOURNAL=1 to enable
+CIRCULATION_JOURNAL = os.environ.get("LIBRARY_JOURNAL") == "1"
+
+
+# Offline-capable terminal (offline.py): when library.db cannot be reached,
+# checkouts and check-ins are checked against a local cache and queued in
+# OFFLINE_DB_PATH, then replayed every OFFLINE_RETRY_SECONDS until the
+# queue is empty. Set LIBRARY_OFFLINE=1 to enable; TERMINAL_ID must be
+# unique per desk (default: the host name).
+OFFLINE_MODE = os.environ.get("LIBRARY_OFFLINE") == "1"
+OFFLINE_DB_PATH = str(BASE_DIR / "offline.db")
+TERMINAL_ID = os.environ.get("LIBRARY_TERMINAL_ID") or socket.gethostname()
+OFFLINE_RETRY_SECONDS = 30
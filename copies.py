@@ -0,0 +1,206 @@
+import sqlite3
+import holds
+from config import DB_PATH
+
+DEFAULT_BRANCH = "Main"
+
+
+def create_default_copies(conn):
+    """
+    Give every book without copies a single copy at the default branch.
+
+    Called by init_db after loading book.csv and when upgrading a database
+    created before BOOK_COPIES existed, so each ISBN keeps behaving as the
+    one copy it used to be.
+    """
+    cur = conn.cursor()
+    cur.execute("""
+        INSERT INTO BOOK_COPIES (Isbn, Branch)
+        SELECT b.Isbn, ?
+        FROM BOOK b
+        WHERE NOT EXISTS (SELECT 1 FROM BOOK_COPIES c WHERE c.Isbn = b.Isbn)
+        ORDER BY b.Isbn
+    """, (DEFAULT_BRANCH,))
+    conn.commit()
+
+
+def rebuild_availability(conn):
+    """
+    Recompute BOOK_COPIES.On_loan and BOOK_AVAILABILITY from ACTIVE_LOANS.
+
+    Only needed when upgrading or repairing a database; checkout and
+    check-in keep both up to date incrementally.
+    """
+    cur = conn.cursor()
+    cur.execute("""
+        UPDATE BOOK_COPIES
+        SET On_loan = EXISTS (SELECT 1 FROM ACTIVE_LOANS al WHERE al.Copy_id = BOOK_COPIES.Copy_id)
+    """)
+    cur.execute("DELETE FROM BOOK_AVAILABILITY")
+    cur.execute("""
+        INSERT INTO BOOK_AVAILABILITY (Isbn, Copies, Available)
+        SELECT Isbn, COUNT(*), SUM(On_loan = 0)
+        FROM BOOK_COPIES
+        GROUP BY Isbn
+    """)
+    conn.commit()
+
+
+def acquire_copy(cur, isbn):
+    """
+    Mark a free copy of a book as on loan inside the caller's transaction.
+
+    The free copy is found with one seek on the partial index of copies
+    that are not on loan, and BOOK_AVAILABILITY is decremented by key.
+
+    Args:
+        cur: Cursor on the connection that owns the current transaction
+        isbn (str): ISBN of the book
+
+    Returns:
+        int: Copy_id of the copy taken, or None if every copy is out
+    """
+    cur.execute("""
+        UPDATE BOOK_COPIES SET On_loan = 1
+        WHERE Copy_id = (
+            SELECT Copy_id FROM BOOK_COPIES
+            WHERE Isbn = ? AND On_loan = 0
+            ORDER BY Copy_id
+            LIMIT 1
+        )
+        RETURNING Copy_id
+    """, (isbn,))
+    row = cur.fetchone()
+    if row is None:
+        return None
+    cur.execute("UPDATE BOOK_AVAILABILITY SET Available = Available - 1 WHERE Isbn = ?", (isbn,))
+    return row[0]
+
+
+def release_copies(cur, returned):
+    """
+    Free a batch of returned copies inside the caller's transaction.
+
+    Args:
+        cur: Cursor on the connection that owns the current transaction
+        returned: (Copy_id, Isbn) pairs; pairs with no Copy_id are skipped
+    """
+    returned = [(copy_id, isbn) for copy_id, isbn in returned if copy_id is not None]
+    freed = {}
+    for copy_id, isbn in returned:
+        freed[isbn] = freed.get(isbn, 0) + 1
+    cur.executemany("UPDATE BOOK_COPIES SET On_loan = 0 WHERE Copy_id = ?",
+                    [(copy_id,) for copy_id, isbn in returned])
+    cur.executemany("UPDATE BOOK_AVAILABILITY SET Available = Available + ? WHERE Isbn = ?",
+                    [(count, isbn) for isbn, count in freed.items()])
+
+
+def get_availability(cur, isbn):
+    """
+    Return (copies, available) for a book with one primary-key read.
+
+    Returns (0, 0) for a book that has no copies.
+    """
+    cur.execute("SELECT Copies, Available FROM BOOK_AVAILABILITY WHERE Isbn = ?", (isbn,))
+    row = cur.fetchone()
+    return (row[0], row[1]) if row else (0, 0)
+
+
+def add_copies(isbn, count=1, branch=DEFAULT_BRANCH):
+    """
+    Add physical copies of a book.
+
+    Args:
+        isbn (str): ISBN of the book
+        count (int): Number of copies to add
+        branch (str): Branch that holds the new copies
+
+    Returns:
+        tuple: (success: bool, message: str, copy_ids: list)
+    """
+    if count < 1:
+        return False, "Error: Number of copies must be at least 1.", []
+
+    conn = sqlite3.connect(DB_PATH)
+    cur = conn.cursor()
+
+    try:
+        cur.execute("SELECT Title FROM BOOK WHERE Isbn = ?", (isbn,))
+        book = cur.fetchone()
+        if not book:
+            conn.close()
+            return False, f"Error: Book with ISBN '{isbn}' not found.", []
+
+        cur.executemany("INSERT INTO BOOK_COPIES (Isbn, Branch) VALUES (?, ?)",
+                        [(isbn, branch)] * count)
+        cur.execute("""
+            SELECT Copy_id FROM BOOK_COPIES
+            WHERE Isbn = ?
+            ORDER BY Copy_id DESC
+            LIMIT ?
+        """, (isbn, count))
+        copy_ids = sorted(row[0] for row in cur.fetchall())
+
+        cur.execute("""
+            INSERT INTO BOOK_AVAILABILITY (Isbn, Copies, Available)
+            VALUES (?, ?, ?)
+            ON CONFLICT (Isbn) DO UPDATE SET
+                Copies = Copies + excluded.Copies,
+                Available = Available + excluded.Available
+        """, (isbn, count, count))
+
+        # New copies go to borrowers already waiting for the title
+        for _ in range(count):
+            if not holds.dispatch_next_hold(cur, isbn):
+                break
+
+        conn.commit()
+        conn.close()
+
+        return True, f"Added {count} copy(ies) of '{book[0]}' (ISBN: {isbn}) at {branch}.", copy_ids
+
+    except sqlite3.Error as e:
+        conn.close()
+        return False, f"Database error: {str(e)}", []
+
+
+def get_copies(isbn):
+    """
+    List the copies of a book and who has each one.
+
+    Args:
+        isbn (str): ISBN of the book
+
+    Returns:
+        list: Dictionaries with keys Copy_id, Branch, Status, Card_id, Due_date
+    """
+    conn = sqlite3.connect(DB_PATH)
+    conn.row_factory = sqlite3.Row
+    cur = conn.cursor()
+
+    cur.execute("""
+        SELECT c.Copy_id, c.Branch, al.Card_id, bl.Due_date
+        FROM BOOK_COPIES c
+        LEFT JOIN ACTIVE_LOANS al ON c.Copy_id = al.Copy_id
+        LEFT JOIN BOOK_LOANS bl ON al.Loan_id = bl.Loan_id
+        WHERE c.Isbn = ?
+        ORDER BY c.Copy_id
+    """, (isbn,))
+
+    copies = []
+    for row in cur.fetchall():
+        copies.append({
+            'Copy_id': row['Copy_id'],
+            'Branch': row['Branch'],
+            'Status': "OUT" if row['Card_id'] else "IN",
+            'Card_id': row['Card_id'],
+            'Due_date': row['Due_date']
+        })
+
+    conn.close()
+    return copies
+
+
+if __name__ == "__main__":
+    for copy in get_copies("9780195153445"):
+        print(copy)
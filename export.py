@@ -0,0 +1,165 @@
+import sqlite3
+import csv
+import gzip
+import json
+import sys
+import argparse
+from config import DB_PATH
+
+CHUNK_SIZE = 1000
+
+# Each dataset is a query whose rows are streamed in key order, so an
+# interrupted export can be resumed from the last key written.
+DATASETS = {
+    'loans': {
+        'key': 'Loan_id',
+        'columns': ['Loan_id', 'Isbn', 'Card_id', 'Date_out', 'Due_date', 'Date_in'],
+        'query': """
+            SELECT bl.Loan_id, bl.Isbn, bl.Card_id, bl.Date_out, bl.Due_date, bl.Date_in
+            FROM BOOK_LOANS bl
+            WHERE bl.Loan_id > ? {filters}
+            ORDER BY bl.Loan_id
+        """,
+    },
+    'fines': {
+        'key': 'Loan_id',
+        'columns': ['Loan_id', 'Card_id', 'Isbn', 'Date_out', 'Due_date', 'Date_in', 'Fine_amt', 'Paid'],
+        'query': """
+            SELECT f.Loan_id, bl.Card_id, bl.Isbn, bl.Date_out, bl.Due_date, bl.Date_in,
+                   printf('%.2f', f.Fine_amt) as Fine_amt, f.Paid
+            FROM FINES f
+            JOIN BOOK_LOANS bl ON f.Loan_id = bl.Loan_id
+            WHERE f.Loan_id > ? {filters}
+            ORDER BY f.Loan_id
+        """,
+    },
+    'catalog': {
+        'key': 'Isbn',
+        'columns': ['Isbn', 'Title', 'Authors'],
+        'query': """
+            SELECT b.Isbn, b.Title, COALESCE(GROUP_CONCAT(a.Name, ', '), 'Unknown') as Authors
+            FROM BOOK b
+            LEFT JOIN BOOK_AUTHORS ba ON b.Isbn = ba.Isbn
+            LEFT JOIN AUTHORS a ON ba.Author_id = a.Author_id
+            WHERE b.Isbn > ?
+            GROUP BY b.Isbn, b.Title
+            ORDER BY b.Isbn
+        """,
+    },
+}
+
+
+def _build_filters(dataset, date_from, date_to, paid):
+    """Build the extra WHERE conditions and parameters for a dataset."""
+    conditions = []
+    params = []
+    if dataset in ('loans', 'fines'):
+        if date_from:
+            conditions.append("AND bl.Date_out >= ?")
+            params.append(str(date_from))
+        if date_to:
+            conditions.append("AND bl.Date_out <= ?")
+            params.append(str(date_to))
+    if dataset == 'fines' and paid is not None:
+        conditions.append("AND f.Paid = ?")
+        params.append(1 if paid else 0)
+    return " ".join(conditions), params
+
+
+def _open_output(path, compress, append):
+    """Open the output file as text, through gzip if requested."""
+    mode = 'at' if append else 'wt'
+    if compress:
+        return gzip.open(path, mode, encoding='utf-8', newline='')
+    return open(path, mode.replace('t', ''), encoding='utf-8', newline='')
+
+
+def export(dataset, path, fmt='csv', compress=False, date_from=None, date_to=None,
+           paid=None, after=None, chunk_size=CHUNK_SIZE):
+    """
+    Stream a dataset from the database to a CSV or JSONL file.
+
+    Rows are read from the cursor chunk_size at a time and written out
+    immediately, so memory use does not depend on the size of the table.
+
+    Args:
+        dataset (str): 'loans', 'fines' or 'catalog'
+        path (str): Output file path
+        fmt (str): 'csv' or 'jsonl'
+        compress (bool): If True, write gzip-compressed output
+        date_from: Only include loans with Date_out on or after this date (loans/fines)
+        date_to: Only include loans with Date_out on or before this date (loans/fines)
+        paid (bool): True for paid fines only, False for unpaid only, None for all (fines)
+        after: Resume after this key (Loan_id, or Isbn for catalog); rows are
+               appended to the existing file and no CSV header is written
+        chunk_size (int): Number of rows fetched per round trip
+
+    Returns:
+        tuple: (rows_written: int, last_key) - pass last_key as `after` to resume
+    """
+    if dataset not in DATASETS:
+        raise ValueError(f"Unknown dataset '{dataset}'. Choose from: {', '.join(DATASETS)}")
+    if fmt not in ('csv', 'jsonl'):
+        raise ValueError(f"Unknown format '{fmt}'. Choose 'csv' or 'jsonl'.")
+
+    spec = DATASETS[dataset]
+    filters, filter_params = _build_filters(dataset, date_from, date_to, paid)
+    query = spec['query'].format(filters=filters)
+    start_key = after if after is not None else (0 if spec['key'] == 'Loan_id' else '')
+
+    conn = sqlite3.connect(DB_PATH)
+    cur = conn.cursor()
+    cur.execute(query, [start_key] + filter_params)
+
+    rows_written = 0
+    last_key = after
+    key_index = spec['columns'].index(spec['key'])
+
+    with _open_output(path, compress, append=after is not None) as out:
+        if fmt == 'csv':
+            writer = csv.writer(out)
+            if after is None:
+                writer.writerow(spec['columns'])
+
+        while True:
+            rows = cur.fetchmany(chunk_size)
+            if not rows:
+                break
+
+            if fmt == 'csv':
+                writer.writerows(rows)
+            else:
+                out.writelines(json.dumps(dict(zip(spec['columns'], row))) + "\n" for row in rows)
+
+            rows_written += len(rows)
+            last_key = rows[-1][key_index]
+
+    conn.close()
+    return rows_written, last_key
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export loans, fines or catalog data.")
+    parser.add_argument("dataset", choices=sorted(DATASETS))
+    parser.add_argument("path", help="Output file")
+    parser.add_argument("--format", dest="fmt", choices=["csv", "jsonl"], default="csv")
+    parser.add_argument("--gzip", action="store_true", help="Compress the output with gzip")
+    parser.add_argument("--from", dest="date_from", help="Earliest Date_out (YYYY-MM-DD)")
+    parser.add_argument("--to", dest="date_to", help="Latest Date_out (YYYY-MM-DD)")
+    paid_group = parser.add_mutually_exclusive_group()
+    paid_group.add_argument("--paid", dest="paid", action="store_true", default=None)
+    paid_group.add_argument("--unpaid", dest="paid", action="store_false")
+    parser.add_argument("--after", help="Resume after this Loan_id (or Isbn for catalog)")
+    args = parser.parse_args(argv)
+
+    after = args.after
+    if after is not None and DATASETS[args.dataset]['key'] == 'Loan_id':
+        after = int(after)
+
+    rows_written, last_key = export(args.dataset, args.path, args.fmt, args.gzip,
+                                    args.date_from, args.date_to, args.paid, after)
+    print(f"Exported {rows_written} row(s) to {args.path}. Last key: {last_key}")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
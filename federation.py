@@ -0,0 +1,288 @@
+import sys
+import heapq
+import sqlite3
+from itertools import islice
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor, wait
+from config import BRANCHES, DB_PATH
+import search
+import loans
+import fuzzy
+
+BRANCH_TIMEOUT = 10.0  # seconds to wait for the slowest branch
+MAX_WORKERS = 8
+
+# Facets of federated_search_matches(): those of a single database, plus the branch
+FACET_NAMES = search.FACET_NAMES + ("Branch",)
+
+# Shared pool so a federated query does not pay for starting threads.
+# sqlite3 releases the GIL while a query runs, so branches really overlap.
+_executor = ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix="branch")
+
+
+def get_branches(branches=None):
+    """Return the branch name -> database path mapping to query"""
+    if branches:
+        return dict(branches)
+    return dict(BRANCHES) or {"Local": DB_PATH}
+
+
+def fan_out(query_fn, branches=None, timeout=BRANCH_TIMEOUT):
+    """
+    Run query_fn(db_path) against every branch concurrently.
+
+    Each branch gets its own connection on a pool thread, so the total
+    latency is that of the slowest branch (capped at timeout), not the sum.
+
+    Args:
+        query_fn: Callable taking a database path
+        branches (dict): Branch name -> database path (default: config.BRANCHES)
+        timeout (float): Seconds to wait for all branches
+
+    Returns:
+        tuple: (results: dict branch -> return value, errors: dict branch -> message)
+    """
+    futures = {}
+    errors = {}
+    for name, path in get_branches(branches).items():
+        # sqlite3.connect would silently create an empty file
+        if not Path(path).exists():
+            errors[name] = f"Database not found: {path}"
+            continue
+        futures[_executor.submit(query_fn, path)] = name
+
+    done, not_done = wait(futures, timeout=timeout)
+
+    results = {}
+    for future in done:
+        name = futures[future]
+        try:
+            results[name] = future.result()
+        except Exception as e:
+            errors[name] = f"Database error: {str(e)}"
+    for future in not_done:
+        future.cancel()
+        errors[futures[future]] = f"No answer within {timeout:g} seconds."
+
+    return results, errors
+
+
+def merge_branches(results, key, limit=None, offset=0):
+    """Merge per-branch lists that are each sorted by key, labelling every row with its branch"""
+    labelled = [
+        [{**row, 'Branch': name} for row in rows]
+        for name, rows in sorted(results.items())
+    ]
+    merged = heapq.merge(*labelled, key=key)
+    end = None if limit is None else offset + limit
+    return list(islice(merged, offset, end))
+
+
+def federated_search(search_term, limit=None, offset=0, branches=None, timeout=BRANCH_TIMEOUT):
+    """
+    Run search.search() on every branch and merge the results by ISBN.
+
+    Args:
+        search_term (str): Search query (case-insensitive, substring matching)
+        limit (int): Maximum number of merged results (None for all)
+        offset (int): Number of merged results to skip, for paging with limit
+        branches (dict): Branch name -> database path (default: config.BRANCHES)
+        timeout (float): Seconds to wait for the slowest branch
+
+    Returns:
+        tuple: (results: list, errors: dict)
+               results are search() dictionaries with an added Branch key,
+               ordered by ISBN then branch; errors maps each branch that
+               was missing, failed or timed out to a message
+    """
+    # Any branch may hold all of the first offset + limit rows
+    per_branch = None if limit is None else offset + limit
+    results, errors = fan_out(lambda path: search.search(search_term, per_branch, 0, db_path=path),
+                              branches, timeout)
+    rows = merge_branches(results, key=lambda row: (row['ISBN'], row['Branch']), limit=limit, offset=offset)
+    return rows, errors
+
+
+def federated_count_search(search_term, branches=None, timeout=BRANCH_TIMEOUT):
+    """Total of search.count_search() over all branches, as (count, errors)"""
+    results, errors = fan_out(lambda path: search.count_search(search_term, db_path=path), branches, timeout)
+    return sum(results.values()), errors
+
+
+def federated_ranked_search(search_term, limit=20, offset=0, branches=None, timeout=BRANCH_TIMEOUT):
+    """
+    Run search.ranked_search() on every branch and merge the results by score.
+
+    Returns:
+        tuple: (results: list, errors: dict)
+               results are ranked_search() dictionaries with an added Branch
+               key, best score first; errors as in federated_search()
+    """
+    # Any branch may hold all of the first offset + limit rows
+    results, errors = fan_out(lambda path: search.ranked_search(search_term, offset + limit, 0, db_path=path),
+                              branches, timeout)
+    rows = merge_branches(results, key=lambda row: (-row['Score'], row['ISBN'], row['Branch']),
+                          limit=limit, offset=offset)
+    return rows, errors
+
+
+def federated_search_matches(search_term, branches=None, timeout=BRANCH_TIMEOUT):
+    """
+    Run search.search_matches() on every branch and merge the matches by score.
+
+    Each match gets the branch as an extra facet, so its values line up
+    with FACET_NAMES below and results can be narrowed by branch too.
+
+    Returns:
+        tuple: (matches: list, errors: dict) with errors as in federated_search()
+    """
+    results, errors = fan_out(lambda path: search.search_matches(search_term, db_path=path), branches, timeout)
+    labelled = [
+        [(isbn, score, values + ((name,),)) for isbn, score, values in matches]
+        for name, matches in sorted(results.items())
+    ]
+    matches = list(heapq.merge(*labelled, key=lambda match: (-match[1], match[0], match[2][-1])))
+    return matches, errors
+
+
+def federated_lookup_books(matches, branches=None, timeout=BRANCH_TIMEOUT):
+    """
+    Return search() dictionaries with a Branch key for federated matches, in their order.
+
+    Each branch's books are looked up concurrently, like the other
+    federated queries, so one slow or unreachable branch cannot stall
+    the page; its matches are left out and it is reported in errors.
+
+    Args:
+        matches (list): A page of federated_search_matches() tuples
+        branches (dict): Branch name -> database path (default: config.BRANCHES)
+        timeout (float): Seconds to wait for the slowest branch
+
+    Returns:
+        tuple: (results: list, errors: dict) with errors as in federated_search()
+    """
+    paths = get_branches(branches)
+    by_branch = {}
+    for isbn, score, values in matches:
+        by_branch.setdefault(values[-1][0], []).append(isbn)
+    errors = {name: "Branch is no longer configured." for name in by_branch if name not in paths}
+    wanted = {name: paths[name] for name in by_branch if name in paths}
+    isbns_by_path = {}
+    for name, path in wanted.items():
+        isbns_by_path.setdefault(path, []).extend(by_branch[name])
+
+    results = {}
+    if wanted:  # fan_out() would take an empty mapping to mean every branch
+        results, unreachable = fan_out(lambda path: search.lookup_books(isbns_by_path[path], db_path=path),
+                                       wanted, timeout)
+        errors.update(unreachable)
+    books = {}
+    for name, rows in results.items():
+        for book in rows:
+            books[(book['ISBN'], name)] = {**book, 'Branch': name}
+    rows = [books[key] for key in ((isbn, values[-1][0]) for isbn, score, values in matches) if key in books]
+    return rows, errors
+
+
+def federated_fuzzy_search(search_term, limit=50, branches=None, timeout=BRANCH_TIMEOUT):
+    """
+    Run fuzzy.fuzzy_search() on every branch and merge the results by score.
+
+    Returns:
+        tuple: (results: list, errors: dict)
+               results are fuzzy_search() dictionaries with an added Branch
+               key, best score first; errors as in federated_search()
+    """
+    results, errors = fan_out(lambda path: fuzzy.fuzzy_search(search_term, limit, db_path=path), branches, timeout)
+    rows = merge_branches(results, key=lambda row: (-row['Score'], row['ISBN'], row['Branch']), limit=limit)
+    return rows, errors
+
+
+def federated_find_loans(search_term, limit=None, offset=0, branches=None, timeout=BRANCH_TIMEOUT):
+    """
+    Run loans.find_loans_by_search() on every branch and merge the loans by due date.
+
+    Loan IDs are only unique within a branch, so check-ins must go to the
+    database of the loan's Branch.
+
+    Args:
+        search_term (str): Search query (case-insensitive, substring matching)
+        limit (int): Maximum number of merged loans (None for all)
+        offset (int): Number of merged loans to skip, for paging with limit
+        branches (dict): Branch name -> database path (default: config.BRANCHES)
+        timeout (float): Seconds to wait for the slowest branch
+
+    Returns:
+        tuple: (results: list, errors: dict)
+               results are find_loans_by_search() dictionaries with an added
+               Branch key, ordered by due date; errors as in federated_search()
+    """
+    per_branch = None if limit is None else offset + limit
+    results, errors = fan_out(lambda path: loans.find_loans_by_search(search_term, per_branch, 0, db_path=path),
+                              branches, timeout)
+    rows = merge_branches(results, key=lambda row: (row['Due_date'], row['Branch'], row['Loan_id']),
+                          limit=limit, offset=offset)
+    return rows, errors
+
+
+def federated_count_loans(search_term, branches=None, timeout=BRANCH_TIMEOUT):
+    """Total of loans.count_loans_by_search() over all branches, as (count, errors)"""
+    results, errors = fan_out(lambda path: loans.count_loans_by_search(search_term, db_path=path), branches, timeout)
+    return sum(results.values()), errors
+
+
+def is_local_branch(branch, branches=None):
+    """True if the branch's database is this terminal's own config.DB_PATH"""
+    path = get_branches(branches).get(branch)
+    return path is not None and Path(path).resolve() == Path(DB_PATH).resolve()
+
+
+def branch_checkin(branch, loan_ids, branches=None):
+    """
+    Check in loans of another branch (a book returned here but lent there).
+
+    The loan IDs are those listed for that branch by federated_find_loans().
+
+    Returns:
+        tuple: (success: bool, message: str)
+    """
+    path = get_branches(branches).get(branch)
+    if path is None:
+        return False, f"Error: Unknown branch '{branch}'."
+    # sqlite3.connect would silently create an empty file
+    if not Path(path).exists():
+        return False, f"Error: Database not found: {path}"
+
+    conn = sqlite3.connect(path, timeout=BRANCH_TIMEOUT)
+    conn.row_factory = sqlite3.Row
+    try:
+        outcomes = []
+        success, message = loans.checkin_in_transaction(conn.cursor(), loan_ids, outcomes=outcomes)
+        # Partial check-ins keep the loans that succeeded, as loans.checkin does
+        conn.commit()
+        conn.close()
+        loans.count_committed('CHECKIN', success, outcomes)
+        return success, message
+    except sqlite3.Error as e:
+        conn.rollback()
+        conn.close()
+        return False, f"Database error: {str(e)}"
+
+
+if __name__ == "__main__":
+    # Usage: python federation.py search|loans <term>
+    if len(sys.argv) < 3 or sys.argv[1] not in ("search", "loans"):
+        print("Usage: python federation.py search|loans <term>")
+        sys.exit(1)
+
+    term = " ".join(sys.argv[2:])
+    if sys.argv[1] == "search":
+        results, errors = federated_search(term)
+        for row in results:
+            print(f"{row['Branch']:<12} {row['ISBN']:<15} {row['Title'][:49]:<50} {row['Availability']}")
+    else:
+        results, errors = federated_find_loans(term)
+        for row in results:
+            print(f"{row['Branch']:<12} {row['Loan_id']:<8} {row['ISBN']:<15} {row['Card_id']:<10} {row['Due_date']}")
+    for branch, error in errors.items():
+        print(f"{branch}: {error}")
@@ -1,8 +1,73 @@
 import sqlite3
-from datetime import datetime, date
+from datetime import date
 from decimal import Decimal
 from config import DB_PATH
+import standing
+import memprofile
+import metrics
+import closures
 FINE_RATE = Decimal('0.25')  # $0.25 per day
+FINE_LOOKUP_BATCH = 500
+
+# Existing fines of a batch of loans (format with the IN placeholders)
+FINE_LOOKUP_QUERY = "SELECT Loan_id, Fine_amt, Paid FROM FINES WHERE Loan_id IN ({placeholders})"
+
+# All fines with borrower and book, grouped by borrower (format with the paid filter)
+FINES_BY_BORROWER_QUERY = """
+    SELECT 
+        br.Card_id,
+        br.Bname,
+        f.Loan_id,
+        f.Fine_amt,
+        f.Paid,
+        bl.Isbn,
+        b.Title,
+        bl.Due_date,
+        bl.Date_in
+    FROM FINES f
+    JOIN BOOK_LOANS bl ON f.Loan_id = bl.Loan_id
+    JOIN BORROWER br ON bl.Card_id = br.Card_id
+    JOIN BOOK b ON bl.Isbn = b.Isbn
+    WHERE 1=1 {paid_filter}
+    ORDER BY br.Card_id, f.Paid, bl.Due_date
+"""
+
+# One borrower's unpaid fines, as checked and cleared by pay_fines (card ID)
+PAYABLE_FINES_QUERY = """
+    SELECT 
+        f.Loan_id,
+        f.Fine_amt,
+        bl.Date_in
+    FROM FINES f
+    JOIN BOOK_LOANS bl ON f.Loan_id = bl.Loan_id
+    WHERE bl.Card_id = ? AND f.Paid = 0
+"""
+
+# Whether a borrower still has any unpaid fine (card ID)
+HAS_UNPAID_QUERY = """
+    SELECT EXISTS (
+        SELECT 1
+        FROM BOOK_LOANS bl
+        JOIN FINES f ON f.Loan_id = bl.Loan_id
+        WHERE bl.Card_id = ? AND f.Paid = 0
+    )
+"""
+
+# One borrower's unpaid fines with titles, oldest due first (card ID)
+UNPAID_FINES_QUERY = """
+    SELECT 
+        f.Loan_id,
+        f.Fine_amt,
+        bl.Isbn,
+        b.Title,
+        bl.Due_date,
+        bl.Date_in
+    FROM FINES f
+    JOIN BOOK_LOANS bl ON f.Loan_id = bl.Loan_id
+    JOIN BOOK b ON bl.Isbn = b.Isbn
+    WHERE bl.Card_id = ? AND f.Paid = 0
+    ORDER BY bl.Due_date
+"""
 
 def has_unpaid_fines(card_id):
     """
@@ -18,33 +83,32 @@ def has_unpaid_fines(card_id):
     conn.row_factory = sqlite3.Row
     cur = conn.cursor()
     
-    query = """
-    SELECT COUNT(*) as count
-    FROM FINES f
-    JOIN BOOK_LOANS bl ON f.Loan_id = bl.Loan_id
-    WHERE bl.Card_id = ? AND f.Paid = 0
-    """
-    
-    cur.execute(query, (card_id,))
+    cur.execute("SELECT Has_unpaid FROM BORROWER_STANDING WHERE Card_id = ?", (card_id,))
     result = cur.fetchone()
     conn.close()
     
-    return result['count'] > 0
+    return bool(result and result['Has_unpaid'])
 
 
-def calculate_fine_amount(due_date, date_in=None):
+def calculate_fine_amount(due_date, date_in=None, calendar=None):
     """
-    Calculate fine amount for a loan.
+    Calculate fine amount for a loan: FINE_RATE per open day overdue.
+    
+    Days the library is closed (see closures.py) are not charged. The
+    count is two prefix-sum lookups in the calendar, however long the
+    loan is overdue.
     
     Args:
         due_date: Due date (date object or string in YYYY-MM-DD format)
         date_in: Return date if book is returned, None if still out (date object or string)
+        calendar (ClosureCalendar): Closed days; pass one when calculating many
+                                    fines (default: loaded from the database)
     
     Returns:
         Decimal: Fine amount (0 if not overdue)
     """
     if isinstance(due_date, str):
-        due_date = datetime.strptime(due_date, '%Y-%m-%d').date()
+        due_date = date.fromisoformat(due_date)
     
     today = date.today()
     
@@ -52,7 +116,7 @@ def calculate_fine_amount(due_date, date_in=None):
     if date_in:
         # Book has been returned - use date_in
         if isinstance(date_in, str):
-            date_in = datetime.strptime(date_in, '%Y-%m-%d').date()
+            date_in = date.fromisoformat(date_in)
         end_date = date_in
     else:
         # Book still out - use today
@@ -62,7 +126,9 @@ def calculate_fine_amount(due_date, date_in=None):
     if end_date <= due_date:
         return Decimal('0.00')
     
-    days_overdue = (end_date - due_date).days
+    if calendar is None:
+        calendar = closures.get_calendar()
+    days_overdue = calendar.open_days_between(due_date, end_date)
     fine_amount = Decimal(days_overdue) * FINE_RATE
     
     # Round to 2 decimal places
@@ -72,7 +138,7 @@ def calculate_fine_amount(due_date, date_in=None):
 def update_fines():
     """
     Update/refresh entries in the FINES table.
-    Handles both scenarios:
+    Handles both scenarios (counting only days the library is open):
     1. Late books that have been returned: (date_in - due_date) * $0.25
     2. Late books still out: (TODAY - due_date) * $0.25
     
@@ -88,51 +154,102 @@ def update_fines():
     
     # Find all overdue loans (both returned and still out)
     query = """
-    SELECT Loan_id, Due_date, Date_in
+    SELECT Loan_id, Card_id, Due_date, Date_in
     FROM BOOK_LOANS
     WHERE Due_date < ?
     """
     
     cur.execute(query, (today,))
-    overdue_loans = cur.fetchall()
-    
-    for loan in overdue_loans:
-        loan_id = loan['Loan_id']
-        due_date = loan['Due_date']
-        date_in = loan['Date_in']
-        
-        # Calculate fine amount
-        fine_amount = calculate_fine_amount(due_date, date_in)
-        
-        if fine_amount > 0:
-            # Check if fine already exists
-            cur.execute("SELECT * FROM FINES WHERE Loan_id = ?", (loan_id,))
-            existing_fine = cur.fetchone()
-            
-            if existing_fine:
-                # If paid == TRUE (1), do nothing
-                if existing_fine['Paid'] == 1:
-                    continue
-                
-                # If paid == FALSE (0), update fine_amt if different
-                existing_amount = Decimal(str(existing_fine['Fine_amt']))
-                if existing_amount != fine_amount:
-                    cur.execute("""
-                        UPDATE FINES
-                        SET Fine_amt = ?
-                        WHERE Loan_id = ? AND Paid = 0
-                    """, (str(fine_amount), loan_id))
-            else:
-                # Create new fine (always unpaid initially)
-                cur.execute("""
-                    INSERT INTO FINES (Loan_id, Fine_amt, Paid)
-                    VALUES (?, ?, 0)
-                """, (loan_id, str(fine_amount)))
+    accrue_fines(cur, cur.fetchall())
     
     conn.commit()
     conn.close()
 
 
+def accrue_fines(cur, loans):
+    """
+    Create or refresh the fines for specific loans inside the caller's transaction.
+    
+    Existing fines are read with batched IN lookups on the FINES primary
+    key. Paid fines are left alone, unpaid ones are updated if the amount
+    changed or deleted if it is now zero (e.g. a closure covers every
+    overdue day), and BORROWER_STANDING is adjusted once per borrower.
+    
+    Args:
+        cur: Cursor on the connection that owns the current transaction
+        loans: Rows or dicts with keys Loan_id, Card_id, Due_date, Date_in
+    
+    Returns:
+        dict: Loan_id -> fine amount (Decimal) for every loan that has an unpaid fine
+    """
+    loans = list(loans)
+    
+    existing = {}
+    loan_ids = [loan['Loan_id'] for loan in loans]
+    for start in range(0, len(loan_ids), FINE_LOOKUP_BATCH):
+        batch = loan_ids[start:start + FINE_LOOKUP_BATCH]
+        placeholders = ",".join(["?"] * len(batch))
+        cur.execute(FINE_LOOKUP_QUERY.format(placeholders=placeholders), batch)
+        for row in cur.fetchall():
+            existing[row[0]] = (Decimal(str(row[1])), row[2])
+    
+    # One calendar for the whole batch; each loan is then two lookups
+    calendar = closures.load_calendar(cur)
+    
+    inserts = []
+    updates = []
+    accrued = {}
+    removals = []
+    # Net change in unpaid fines per borrower, applied to BORROWER_STANDING
+    standing_deltas = {}
+    # Borrowers who lost an unpaid fine, whose unpaid flag must be re-read
+    cleared = set()
+    
+    for loan in loans:
+        loan_id = loan['Loan_id']
+        card_id = loan['Card_id']
+        fine_amount = calculate_fine_amount(loan['Due_date'], loan['Date_in'], calendar)
+        if fine_amount <= 0:
+            # A closure added since, or a moved due date, can leave an accrued
+            # fine with no chargeable days: drop it while it is unpaid
+            if loan_id in existing and existing[loan_id][1] == 0:
+                existing_amount = existing[loan_id][0]
+                removals.append((loan_id,))
+                cleared.add(card_id)
+                standing_deltas[card_id] = standing_deltas.get(card_id, Decimal('0.00')) - existing_amount
+            continue
+        
+        if loan_id in existing:
+            existing_amount, paid = existing[loan_id]
+            # If paid == TRUE (1), do nothing
+            if paid == 1:
+                continue
+            accrued[loan_id] = fine_amount
+            # If paid == FALSE (0), update fine_amt if different
+            if existing_amount != fine_amount:
+                updates.append((str(fine_amount), loan_id))
+                standing_deltas[card_id] = standing_deltas.get(card_id, Decimal('0.00')) + fine_amount - existing_amount
+        else:
+            # Create new fine (always unpaid initially)
+            inserts.append((loan_id, str(fine_amount)))
+            accrued[loan_id] = fine_amount
+            standing_deltas[card_id] = standing_deltas.get(card_id, Decimal('0.00')) + fine_amount
+    
+    cur.executemany("INSERT INTO FINES (Loan_id, Fine_amt, Paid) VALUES (?, ?, 0)", inserts)
+    cur.executemany("UPDATE FINES SET Fine_amt = ? WHERE Loan_id = ? AND Paid = 0", updates)
+    cur.executemany("DELETE FROM FINES WHERE Loan_id = ? AND Paid = 0", removals)
+    
+    for card_id, delta in standing_deltas.items():
+        has_unpaid = True
+        if card_id in cleared:
+            cur.execute(HAS_UNPAID_QUERY, (card_id,))
+            has_unpaid = bool(cur.fetchone()[0])
+        standing.adjust_standing(cur, card_id, fine_delta=delta, has_unpaid=has_unpaid)
+    
+    return accrued
+
+
+@memprofile.profiled("fines.get_fines_by_borrower")
 def get_fines_by_borrower(include_paid=False):
     """
     Get fines grouped by borrower (card_no), with total sum per borrower.
@@ -152,26 +269,7 @@ def get_fines_by_borrower(include_paid=False):
     else:
         paid_filter = "AND f.Paid = 0"
     
-    query = f"""
-    SELECT 
-        br.Card_id,
-        br.Bname,
-        f.Loan_id,
-        f.Fine_amt,
-        f.Paid,
-        bl.Isbn,
-        b.Title,
-        bl.Due_date,
-        bl.Date_in
-    FROM FINES f
-    JOIN BOOK_LOANS bl ON f.Loan_id = bl.Loan_id
-    JOIN BORROWER br ON bl.Card_id = br.Card_id
-    JOIN BOOK b ON bl.Isbn = b.Isbn
-    WHERE 1=1 {paid_filter}
-    ORDER BY br.Card_id, f.Paid, bl.Due_date
-    """
-    
-    cur.execute(query)
+    cur.execute(FINES_BY_BORROWER_QUERY.format(paid_filter=paid_filter))
     results = cur.fetchall()
     
     # Group by borrower
@@ -206,6 +304,81 @@ def get_fines_by_borrower(include_paid=False):
     return borrowers
 
 
+FINE_TOTALS_QUERY = """
+    FROM FINES f
+    JOIN BOOK_LOANS bl ON f.Loan_id = bl.Loan_id
+    JOIN BORROWER br ON bl.Card_id = br.Card_id
+    WHERE (? OR f.Paid = 0)
+      AND (LOWER(br.Card_id) LIKE ? OR LOWER(br.Bname) LIKE ?)
+"""
+
+
+def get_fine_totals(include_paid=False, search_term="", limit=None, offset=0):
+    """
+    Get one row per borrower with fines, with the total unpaid amount, one page at a time.
+    
+    Args:
+        include_paid (bool): If True, include borrowers whose fines are all paid.
+        search_term (str): Optional card ID / borrower name filter (substring matching)
+        limit (int): Maximum number of borrowers to return (None for all)
+        offset (int): Number of borrowers to skip, for paging with limit
+    
+    Returns:
+        list: List of dictionaries with keys Card_id, Bname, total_fine, ordered by Card_id
+    """
+    conn = sqlite3.connect(DB_PATH)
+    conn.row_factory = sqlite3.Row
+    cur = conn.cursor()
+    
+    search_pattern = f"%{search_term.lower()}%"
+    
+    cur.execute(f"""
+        SELECT
+            br.Card_id,
+            br.Bname,
+            ROUND(SUM(CASE WHEN f.Paid = 0 THEN f.Fine_amt ELSE 0 END), 2) as Total_fine
+        {FINE_TOTALS_QUERY}
+        GROUP BY br.Card_id, br.Bname
+        ORDER BY br.Card_id
+        LIMIT ? OFFSET ?
+    """, (int(include_paid), search_pattern, search_pattern,
+          -1 if limit is None else limit, offset))
+    
+    totals = []
+    for row in cur.fetchall():
+        totals.append({
+            'Card_id': row['Card_id'],
+            'Bname': row['Bname'],
+            'total_fine': Decimal(str(row['Total_fine'])).quantize(Decimal('0.01'))
+        })
+    
+    conn.close()
+    return totals
+
+
+def count_fine_totals(include_paid=False, search_term=""):
+    """
+    Count the borrowers that get_fine_totals() would return.
+    
+    Args:
+        include_paid (bool): If True, include borrowers whose fines are all paid.
+        search_term (str): Optional card ID / borrower name filter (substring matching)
+    
+    Returns:
+        int: Number of borrowers
+    """
+    conn = sqlite3.connect(DB_PATH)
+    cur = conn.cursor()
+    
+    search_pattern = f"%{search_term.lower()}%"
+    cur.execute(f"SELECT COUNT(DISTINCT br.Card_id) {FINE_TOTALS_QUERY}",
+                (int(include_paid), search_pattern, search_pattern))
+    count = cur.fetchone()[0]
+    
+    conn.close()
+    return count
+
+
 def display_fines(include_paid=False):
     """
     Display fines grouped by borrower with totals.
@@ -270,17 +443,7 @@ def pay_fines(card_id):
             return False, f"Error: Borrower with card ID '{card_id}' not found.", None
         
         # Get all unpaid fines for this borrower
-        query = """
-        SELECT 
-            f.Loan_id,
-            f.Fine_amt,
-            bl.Date_in
-        FROM FINES f
-        JOIN BOOK_LOANS bl ON f.Loan_id = bl.Loan_id
-        WHERE bl.Card_id = ? AND f.Paid = 0
-        """
-        
-        cur.execute(query, (card_id,))
+        cur.execute(PAYABLE_FINES_QUERY, (card_id,))
         unpaid_fines = cur.fetchall()
         
         if not unpaid_fines:
@@ -309,9 +472,13 @@ def pay_fines(card_id):
             WHERE Loan_id IN ({placeholders}) AND Paid = 0
         """, loan_ids_to_pay)
         
+        standing.adjust_standing(cur, card_id, fine_delta=-total_amount, has_unpaid=False)
+        
         conn.commit()
         conn.close()
         
+        metrics.inc("library_fines_paid_total")
+        metrics.inc("library_fines_paid_dollars_total", float(total_amount))
         return True, f"Successfully paid all fines for borrower {card_id}. Total amount: ${total_amount:.2f}", total_amount
     
     except sqlite3.Error as e:
@@ -333,22 +500,7 @@ def get_unpaid_fines(card_id):
     conn.row_factory = sqlite3.Row
     cur = conn.cursor()
     
-    query = """
-    SELECT 
-        f.Loan_id,
-        f.Fine_amt,
-        bl.Isbn,
-        b.Title,
-        bl.Due_date,
-        bl.Date_in
-    FROM FINES f
-    JOIN BOOK_LOANS bl ON f.Loan_id = bl.Loan_id
-    JOIN BOOK b ON bl.Isbn = b.Isbn
-    WHERE bl.Card_id = ? AND f.Paid = 0
-    ORDER BY bl.Due_date
-    """
-    
-    cur.execute(query, (card_id,))
+    cur.execute(UNPAID_FINES_QUERY, (card_id,))
     results = cur.fetchall()
     
     fines_list = []
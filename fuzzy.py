@@ -0,0 +1,300 @@
+import sqlite3
+import sys
+import time
+from collections import Counter
+from config import DB_PATH
+import search
+import metrics
+
+FUZZY_BUDGET_MS = 50     # hard limit on the time one fuzzy search may take
+MAX_CANDIDATES = 200     # titles (and author names) verified per search
+MAX_POSTINGS = 20000     # trigram index entries read per search, per index
+MAX_EDITS = 3            # typos tolerated in a long search term
+PROGRESS_STEPS = 1000    # SQLite VM steps between budget checks
+GRAM_SIZE = 3            # the FTS5 trigram tokenizer indexes every 3 characters
+
+# FUZZY_GRAMS kind -> (FTS5 table, indexed column)
+INDEXES = {'T': ("FUZZY_TITLES", "Title"), 'A': ("FUZZY_AUTHORS", "Name")}
+
+# Books by the matched authors (format with the IN placeholders; limit)
+AUTHOR_BOOKS_QUERY = "SELECT Isbn, Author_id FROM BOOK_AUTHORS WHERE Author_id IN ({placeholders}) LIMIT ?"
+
+
+def grams(text):
+    """Return the set of trigrams of a text, case-folded as the trigram tokenizer does"""
+    text = text.lower()
+    return {text[i:i + GRAM_SIZE] for i in range(len(text) - GRAM_SIZE + 1)}
+
+
+def rebuild_fuzzy_index(conn):
+    """Rebuild FUZZY_TITLES, FUZZY_AUTHORS and FUZZY_GRAMS from BOOK and AUTHORS"""
+    cur = conn.cursor()
+    cur.execute("DELETE FROM FUZZY_TITLES")
+    cur.execute("INSERT INTO FUZZY_TITLES (Isbn, Title) SELECT Isbn, Title FROM BOOK")
+    cur.execute("DELETE FROM FUZZY_AUTHORS")
+    cur.execute("INSERT INTO FUZZY_AUTHORS (rowid, Name) SELECT Author_id, Name FROM AUTHORS")
+
+    # Document counts come from the FTS5 vocabulary in one pass per index
+    cur.execute("DELETE FROM FUZZY_GRAMS")
+    for kind, (table, column) in INDEXES.items():
+        cur.execute(f"CREATE VIRTUAL TABLE temp.FUZZY_VOCAB USING fts5vocab(main, {table}, 'row')")
+        cur.execute("INSERT INTO FUZZY_GRAMS (Kind, Gram, Docs) SELECT ?, term, doc FROM temp.FUZZY_VOCAB", (kind,))
+        cur.execute("DROP TABLE temp.FUZZY_VOCAB")
+    conn.commit()
+
+
+def _adjust_gram_counts(cur, kind, added, removed):
+    """Apply the trigram document counts of added and removed texts to FUZZY_GRAMS"""
+    deltas = {}
+    for text in added:
+        for gram in grams(text):
+            deltas[gram] = deltas.get(gram, 0) + 1
+    for text in removed:
+        for gram in grams(text):
+            deltas[gram] = deltas.get(gram, 0) - 1
+    cur.executemany("""
+        INSERT INTO FUZZY_GRAMS (Kind, Gram, Docs) VALUES (?, ?, ?)
+        ON CONFLICT (Kind, Gram) DO UPDATE SET Docs = Docs + excluded.Docs
+    """, [(kind, gram, delta) for gram, delta in deltas.items() if delta])
+    cur.execute("DELETE FROM FUZZY_GRAMS WHERE Kind = ? AND Docs <= 0", (kind,))
+
+
+def update_titles(cur, titles, stale=()):
+    """
+    Keep the title index in step with BOOK inside the caller's transaction.
+
+    FUZZY_TITLES can only be searched by trigram, so removing entries by
+    ISBN reads the whole index once; callers should pass all stale ISBNs
+    in one call.
+
+    Args:
+        cur: Cursor on the connection that owns the current transaction
+        titles: (Isbn, Title) pairs to index
+        stale: ISBNs whose existing entries must go (changed or deleted books)
+    """
+    titles = list(titles)
+    stale = list(stale)
+    removed = []
+    if stale:
+        cur.execute("CREATE TEMP TABLE IF NOT EXISTS FUZZY_STALE (Isbn TEXT PRIMARY KEY)")
+        cur.execute("DELETE FROM FUZZY_STALE")
+        cur.executemany("INSERT OR IGNORE INTO FUZZY_STALE (Isbn) VALUES (?)", [(isbn,) for isbn in stale])
+        cur.execute("SELECT rowid, Title FROM FUZZY_TITLES WHERE Isbn IN (SELECT Isbn FROM FUZZY_STALE)")
+        rows = cur.fetchall()
+        removed = [row[1] for row in rows]
+        cur.executemany("DELETE FROM FUZZY_TITLES WHERE rowid = ?", [(row[0],) for row in rows])
+        cur.execute("DELETE FROM FUZZY_STALE")
+    cur.executemany("INSERT INTO FUZZY_TITLES (Isbn, Title) VALUES (?, ?)", titles)
+    _adjust_gram_counts(cur, 'T', [title for isbn, title in titles], removed)
+
+
+def update_authors(cur, names, stale=()):
+    """
+    Keep the author index in step with AUTHORS inside the caller's transaction.
+
+    Args:
+        cur: Cursor on the connection that owns the current transaction
+        names: (Author_id, Name) pairs to index
+        stale: Author IDs whose existing entries must go (changed or deleted authors)
+    """
+    names = [(int(author_id), name) for author_id, name in names]
+    removed = []
+    for author_id in stale:
+        # FTS5 tables do not support DELETE ... RETURNING
+        cur.execute("SELECT Name FROM FUZZY_AUTHORS WHERE rowid = ?", (int(author_id),))
+        removed.extend(row[0] for row in cur.fetchall())
+        cur.execute("DELETE FROM FUZZY_AUTHORS WHERE rowid = ?", (int(author_id),))
+    cur.executemany("INSERT INTO FUZZY_AUTHORS (rowid, Name) VALUES (?, ?)", names)
+    _adjust_gram_counts(cur, 'A', [name for author_id, name in names], removed)
+
+
+def max_edits_for(term):
+    """Typos tolerated for a search term: one per four characters, between 1 and MAX_EDITS"""
+    return max(1, min(MAX_EDITS, len(term) // 4))
+
+
+def substring_distance(pattern, text, max_edits):
+    """
+    Fewest edits that turn pattern into some substring of text.
+
+    Insertions, deletions, substitutions and swaps of adjacent characters
+    each count as one edit (optimal string alignment distance). Uses the
+    bit-parallel algorithm of Myers with Hyyrö's transposition extension,
+    so the cost is a handful of integer operations per character of text.
+
+    Returns:
+        int: The distance, or max_edits + 1 if it is larger than max_edits
+    """
+    m = len(pattern)
+    if m == 0:
+        return 0
+    mask = (1 << m) - 1
+    last = 1 << (m - 1)
+    peq = {}
+    for i, char in enumerate(pattern):
+        peq[char] = peq.get(char, 0) | (1 << i)
+
+    vp, vn = mask, 0
+    d0 = 0
+    prev_eq = 0
+    score = m
+    best = m
+    for char in text:
+        eq = peq.get(char, 0)
+        # Adjacent swap: pattern[i-1:i+1] matches text[j-1:j+1] reversed
+        tc = (((~d0) & eq) << 1) & prev_eq
+        d0 = ((((eq & vp) + vp) ^ vp) | eq | vn | tc) & mask
+        hp = (vn | ~(d0 | vp)) & mask
+        hn = vp & d0
+        if hp & last:
+            score += 1
+        elif hn & last:
+            score -= 1
+        # No carry into row 0: a match may start anywhere in text
+        hp = (hp << 1) & mask
+        hn = (hn << 1) & mask
+        vp = (hn | ~(d0 | hp)) & mask
+        vn = hp & d0
+        prev_eq = eq
+        if score < best:
+            best = score
+    return best if best <= max_edits else max_edits + 1
+
+
+def _candidates(cur, kind, term_grams, max_edits, max_candidates, max_postings):
+    """
+    Return the rowids of the index entries most likely to be near the term, best first.
+
+    The posting lists of the term's trigrams are read rarest first, up to
+    max_postings entries, counting how many trigrams each entry shares
+    with the term. Each edit destroys at most four trigrams (a swap
+    touches four, any other edit three), so an entry within max_edits
+    shares all but 4 * max_edits of the trigrams read; entries with fewer
+    hits are dropped without being verified.
+    """
+    table, column = INDEXES[kind]
+    term_grams = sorted(term_grams)
+    placeholders = ",".join(["?"] * len(term_grams))
+    cur.execute(f"SELECT Gram, Docs FROM FUZZY_GRAMS WHERE Kind = ? AND Gram IN ({placeholders})",
+                [kind] + term_grams)
+    docs = dict(cur.fetchall())
+
+    hits = Counter()
+    complete = 0   # trigrams whose posting list was read in full
+    budget = max_postings
+    for gram in sorted(term_grams, key=lambda gram: docs.get(gram, 0)):
+        if docs.get(gram, 0) > budget and complete:
+            break
+        # One string per posting list is much cheaper to fetch than a row per entry
+        cur.execute(f"SELECT group_concat(rowid) FROM (SELECT rowid FROM {table} WHERE {table} MATCH ? LIMIT ?)",
+                    ('"' + gram.replace('"', '""') + '"', budget))
+        found = cur.fetchone()[0]
+        rowids = found.split(",") if found else []
+        hits.update(rowids)
+        if len(rowids) >= budget:
+            break
+        budget -= len(rowids)
+        complete += 1
+
+    threshold = max(1, complete - 4 * max_edits)
+    return [int(rowid) for rowid, count in hits.most_common(max_candidates) if count >= threshold]
+
+
+def _verified(rows, term, max_edits, deadline):
+    """Yield (key, similarity) for candidate rows (key, text) within max_edits of the term"""
+    for key, text in rows:
+        if time.perf_counter() > deadline:
+            return
+        distance = substring_distance(term, text.lower(), max_edits)
+        if distance <= max_edits:
+            yield key, 1 - distance / len(term)
+
+
+@metrics.timed("library_search_seconds", labels=("fuzzy",))
+def fuzzy_search(search_term, limit=50, budget_ms=FUZZY_BUDGET_MS, max_candidates=MAX_CANDIDATES,
+                 max_postings=MAX_POSTINGS, db_path=None):
+    """
+    Search titles and author names, tolerating typos ("Tolkein", "Hary Poter").
+
+    Candidates come from the trigram indexes FUZZY_TITLES and FUZZY_AUTHORS:
+    the entries sharing the most of the term's rarest trigrams (see
+    _candidates), at most max_candidates per index. Each is verified by
+    its edit distance to the closest substring of the title or name. The
+    whole search stops at budget_ms: SQLite is interrupted, verification
+    ends, and whatever was verified by then is returned.
+
+    Args:
+        search_term (str): Search query (case-insensitive, at least 3 characters)
+        limit (int): Maximum number of results to return
+        budget_ms (float): Time budget in milliseconds
+        max_candidates (int): Entries verified from each index
+        max_postings (int): Trigram index entries read from each index
+        db_path (str): Database to search (default: config.DB_PATH)
+
+    Returns:
+        list: search() dictionaries with an added Score key (1.0 for an exact
+              substring match, less for each typo), best first, then by ISBN
+    """
+    term = " ".join((search_term or "").lower().split())
+    if len(term) < GRAM_SIZE:
+        return []
+    max_edits = max_edits_for(term)
+    term_grams = grams(term)
+    deadline = time.perf_counter() + budget_ms / 1000
+
+    conn = sqlite3.connect(db_path or DB_PATH)
+    conn.row_factory = sqlite3.Row
+    cur = conn.cursor()
+    conn.set_progress_handler(lambda: time.perf_counter() > deadline, PROGRESS_STEPS)
+
+    scores = {}
+    try:
+        rowids = _candidates(cur, 'T', term_grams, max_edits, max_candidates, max_postings)
+        if rowids:
+            cur.execute(f"SELECT Isbn, Title FROM FUZZY_TITLES WHERE rowid IN ({','.join(['?'] * len(rowids))})",
+                        rowids)
+            for isbn, score in _verified(cur.fetchall(), term, max_edits, deadline):
+                scores[isbn] = max(score, scores.get(isbn, 0))
+
+        rowids = _candidates(cur, 'A', term_grams, max_edits, max_candidates, max_postings)
+        if rowids:
+            cur.execute(f"SELECT rowid, Name FROM FUZZY_AUTHORS WHERE rowid IN ({','.join(['?'] * len(rowids))})",
+                        rowids)
+            authors = dict(_verified(cur.fetchall(), term, max_edits, deadline))
+            if authors:
+                placeholders = ",".join(["?"] * len(authors))
+                cur.execute(AUTHOR_BOOKS_QUERY.format(placeholders=placeholders), list(authors) + [max_candidates])
+                for isbn, author_id in cur.fetchall():
+                    scores[isbn] = max(authors[author_id], scores.get(isbn, 0))
+    except sqlite3.OperationalError as e:
+        # Interrupted by the progress handler: keep what was verified in time
+        if "interrupt" not in str(e):
+            conn.close()
+            raise
+
+    best = sorted(scores.items(), key=lambda item: (-item[1], item[0]))[:limit]
+    conn.set_progress_handler(None, 0)
+    books = search.get_books(cur, [isbn for isbn, score in best])
+    conn.close()
+
+    results = []
+    for isbn, score in best:
+        if isbn in books:
+            results.append({**books[isbn], 'Score': round(score, 3)})
+    return results
+
+
+if __name__ == "__main__":
+    # Usage: python fuzzy.py <term>  |  python fuzzy.py --rebuild
+    if sys.argv[1:] == ["--rebuild"]:
+        conn = sqlite3.connect(DB_PATH)
+        rebuild_fuzzy_index(conn)
+        conn.close()
+        print("Fuzzy search index rebuilt.")
+    else:
+        start = time.perf_counter()
+        results = fuzzy_search(" ".join(sys.argv[1:]))
+        elapsed = time.perf_counter() - start
+        for result in results:
+            print(f"{result['Score']:.2f}  {result['ISBN']:<15} {result['Title'][:49]:<50} {result['Authors'][:30]}")
+        print(f"{len(results)} result(s) in {elapsed * 1000:.1f} ms")
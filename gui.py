@@ -1,12 +1,24 @@
 import tkinter as tk
 from tkinter import ttk, messagebox, scrolledtext
 from datetime import datetime
+import threading
+import time
 import search
+import fuzzy
 import loans
 import borrowers
 import fines
-from config import DB_PATH
+import journal
+import analytics
+import holds
+import federation
+import backup
+import memprofile
+import metrics
+import offline
+from config import DB_PATH, CIRCULATION_JOURNAL, BRANCHES, BACKUP_INTERVAL_HOURS, MEMORY_PROFILING, OFFLINE_MODE
 import sqlite3
+from virtual_table import VirtualTable
 
 class LoginDialog:
     def __init__(self, parent):
@@ -85,31 +97,117 @@ class LibraryManagementGUI:
         self.root.title(f"Library Management System - Logged in as: {user_role.upper()}")
         self.root.geometry("1000x700")
         
+        self.startup_start = time.perf_counter()
+        self.startup_timings = {}
+        
+        # Checkouts/check-ins go through the group-commit journal when enabled,
+        # or through the offline-capable terminal, which also answers loan
+        # searches from its cache while library.db is unreachable
+        if OFFLINE_MODE:
+            self.circulation = offline.get_terminal()
+        else:
+            self.circulation = journal.get_journal() if CIRCULATION_JOURNAL else loans
+        self.loan_source = self.circulation if OFFLINE_MODE else loans
+        
         # Create notebook for tabs
         self.notebook = ttk.Notebook(root)
         self.notebook.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
         
-        # Create tabs
-        self.create_search_tab()
-        self.create_checkout_tab()
-        self.create_checkin_tab()
-        self.create_borrower_tab()
-        self.create_fines_tab()
+        # Create empty tab frames; contents are built the first time a tab is selected
+        self.tab_builders = {}
+        self.built_tabs = set()
+        tabs = [("Book Search", self.create_search_tab),
+                ("Checkout Book", self.create_checkout_tab),
+                ("Check-in Book", self.create_checkin_tab),
+                ("Borrower Management", self.create_borrower_tab),
+                ("Fines Management", self.create_fines_tab),
+                ("Reports", self.create_reports_tab)]
+        # Debug panel for allocation tracing, only when started with LIBRARY_MEMPROFILE=1
+        if MEMORY_PROFILING:
+            tabs.append(("Memory", self.create_memory_tab))
+        for title, builder in tabs:
+            frame = ttk.Frame(self.notebook)
+            self.notebook.add(frame, text=title)
+            self.tab_builders[str(frame)] = (title, builder, frame)
+        self.notebook.bind('<<NotebookTabChanged>>', self.on_tab_changed)
 
         #Create status bar for copies
         self.status_bar = ttk.Label(root, text="", relief = tk.SUNKEN, anchor = tk.W)
         self.status_bar.pack(side = tk.BOTTOM, fill = tk.X, padx=10, pady=(0,10))
+        if OFFLINE_MODE:
+            self.offline_label = ttk.Label(root, text="", anchor = tk.E)
+            self.offline_label.pack(side = tk.BOTTOM, fill = tk.X, padx=10)
+            self.update_offline_status()
         
-        # Update fines on startup
-        try:
-            fines.update_fines()
-        except:
-            pass
+        # Build the initially selected tab now
+        self.build_tab(self.notebook.select())
+        
+        # Update fines in the background instead of blocking startup
+        self.fines_update_thread = None
+        self.start_background_fine_update()
+        
+        # Scheduled online backups run on their own thread
+        if BACKUP_INTERVAL_HOURS > 0:
+            self.backup_scheduler = backup.BackupScheduler(on_result=lambda result: print(result[1])).start()
+        
+        # Prometheus metrics endpoint and/or file, if configured
+        metrics.start_exporters()
+        
+        self.startup_timings['init'] = time.perf_counter() - self.startup_start
+        self.root.after_idle(self.report_startup_time)
+    
+    def on_tab_changed(self, event):
+        """Build a tab's contents the first time it is selected"""
+        self.build_tab(self.notebook.select())
+    
+    def build_tab(self, tab_id):
+        """Build the contents of a tab if it has not been built yet"""
+        if not tab_id or tab_id in self.built_tabs:
+            return
+        title, builder, frame = self.tab_builders[tab_id]
+        start = time.perf_counter()
+        builder(frame)
+        self.built_tabs.add(tab_id)
+        self.startup_timings[f"tab: {title}"] = time.perf_counter() - start
     
-    def create_search_tab(self):
+    def report_startup_time(self):
+        """Print how long the window took to become usable"""
+        self.startup_timings['interactive'] = time.perf_counter() - self.startup_start
+        print("Startup timing:")
+        for name, seconds in self.startup_timings.items():
+            print(f"  {name:<30} {seconds * 1000:8.1f} ms")
+    
+    def start_background_fine_update(self):
+        """Run fines.update_fines() on a worker thread and refresh the display when done"""
+        if self.fines_update_thread and self.fines_update_thread.is_alive():
+            return
+        self.fines_update_error = None
+        
+        def worker():
+            try:
+                fines.update_fines()
+                holds.expire_holds()
+            except Exception as e:
+                self.fines_update_error = e
+        
+        self.fines_update_thread = threading.Thread(target=worker, daemon=True)
+        self.fines_update_thread.start()
+        self.root.after(200, self.check_background_fine_update)
+    
+    def check_background_fine_update(self):
+        """Poll the background fine update from the Tk event loop"""
+        if self.fines_update_thread.is_alive():
+            self.root.after(200, self.check_background_fine_update)
+            return
+        if self.fines_update_error:
+            print(f"Background fine update failed: {self.fines_update_error}")
+            return
+        self.show_status_message("Fines updated.")
+        if hasattr(self, 'fines_table'):
+            self.refresh_fines_display()
+    
+    def create_search_tab(self, search_frame):
         """Create book search tab"""
-        search_frame = ttk.Frame(self.notebook)
-        self.notebook.add(search_frame, text="Book Search")
         
         # Search input
         input_frame = ttk.Frame(search_frame)
@@ -122,41 +220,55 @@ class LibraryManagementGUI:
         
         ttk.Button(input_frame, text="Search", command=self.perform_search).pack(side=tk.LEFT, padx=5)
         
+        # Typo-tolerant matching of titles and authors instead of exact substrings
+        self.fuzzy_search_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(input_frame, text="Typo-tolerant", variable=self.fuzzy_search_var).pack(side=tk.LEFT, padx=5)
+        
+        # Best matches first (exact ISBN, title prefix, whole words, popularity) or plain ISBN order
+        ttk.Label(input_frame, text="Sort by:").pack(side=tk.LEFT, padx=5)
+        self.search_order_var = tk.StringVar(value="Relevance")
+        ttk.Combobox(input_frame, textvariable=self.search_order_var, values=("Relevance", "ISBN"),
+                     state="readonly", width=10).pack(side=tk.LEFT, padx=5)
+        
         # Results display
         results_frame = ttk.Frame(search_frame)
         results_frame.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
         
-        # Treeview for results
-        columns = ("ISBN", "Title", "Authors", "Status", "Borrower ID")
-        self.search_tree = ttk.Treeview(results_frame, columns=columns, show="headings", height=20)
-        
-        for col in columns:
-            self.search_tree.heading(col, text=col)
-            self.search_tree.column(col, width=200)
-        
-        self.search_tree.column("ISBN", width=120)
-        self.search_tree.column("Title", width=250)
-        self.search_tree.column("Authors", width=250)
-        self.search_tree.column("Status", width=80)
-        self.search_tree.column("Borrower ID", width=100)
-        
-        scrollbar = ttk.Scrollbar(results_frame, orient=tk.VERTICAL, command=self.search_tree.yview)
-        self.search_tree.configure(yscrollcommand=scrollbar.set)
-        
-        self.search_tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
-        scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        # Facets of the current results; clicking a value narrows them to it.
+        # They need every match, so they are only computed on request.
+        facet_frame = ttk.LabelFrame(results_frame, text="Narrow results", padding=5)
+        facet_frame.pack(side=tk.LEFT, fill=tk.Y, padx=(0, 10))
+        ttk.Button(facet_frame, text="Show Facets", command=self.load_facets).pack(fill=tk.X, pady=(0, 5))
+        self.facet_tree = ttk.Treeview(facet_frame, show="tree", selectmode="none", height=20)
+        self.facet_tree.column("#0", width=220)
+        self.facet_tree.pack(fill=tk.BOTH, expand=True)
+        self.facet_tree.bind('<ButtonRelease-1>', self.on_facet_click)
+        ttk.Button(facet_frame, text="Clear Filters", command=self.clear_facet_filters).pack(fill=tk.X, pady=(5, 0))
+        self.facet_values = {}  # facet tree item -> (facet, value)
+        self.search_term = None  # term of the last non-fuzzy search
+        self.search_match_list = []
+        self.facet_filters = {}
+        
+        # Virtualized table for results (only visible rows are Treeview items)
+        columns = ("ISBN", "Title", "Authors", "Availability", "Borrower ID")
+        widths = {"ISBN": 120, "Title": 250, "Authors": 250, "Availability": 130, "Borrower ID": 100}
+        if BRANCHES:
+            # Federated mode: every configured branch database is searched
+            columns += ("Branch",)
+            widths["Branch"] = 100
+        self.search_table = VirtualTable(results_frame, columns, widths, height=20)
+        self.search_table.pack(fill=tk.BOTH, expand=True)
 
-        self.search_tree.bind('<Double-1>', self.copy_selected_isbn)
+        self.search_table.tree.bind('<Double-1>', self.copy_selected_isbn)
 
     def copy_selected_isbn(self,event):
         """Copies ISBN of selected row"""
-        selected_items = self.search_tree.selection()
+        selected_rows = self.search_table.selected_values()
 
-        if not selected_items:
+        if not selected_rows:
             return
         
-        item_id = selected_items[0]
-        values = self.search_tree.item(item_id, 'values')
+        values = selected_rows[0]
 
         #Copies value from row
         if values and len(values) > 0:
@@ -170,6 +282,20 @@ class LibraryManagementGUI:
             except Exception as e:
                 messagebox.showerror("Clipboard Error", f"Failed to copy ISBN: {e}")
 
+    def update_offline_status(self):
+        """Show whether the terminal is working offline and how many events await replay"""
+        terminal = self.circulation
+        if terminal.offline:
+            text = f"OFFLINE - {terminal.pending_count()} queued event(s) will be sent when the library database is back"
+        else:
+            text = "Online"
+        conflicts = len(terminal.get_conflicts())
+        if conflicts:
+            # Replayed events library.db refused; listed by python offline.py conflicts
+            text += f"; {conflicts} offline event(s) refused on replay (python offline.py conflicts)"
+        self.offline_label.config(text=text, foreground="red" if terminal.offline or conflicts else "")
+        self.root.after(5000, self.update_offline_status)
+
     def show_status_message(self, message, duration_ms = 3000):
         """Dipslays a mesage in the status bar for a set duration"""
         self.status_bar.config(text=message)
@@ -187,34 +313,163 @@ class LibraryManagementGUI:
             messagebox.showwarning("Warning", "Please enter a search term.")
             return
         
-        # Clear previous results
-        for item in self.search_tree.get_children():
-            self.search_tree.delete(item)
+        self.search_term = None
+        self.search_match_list = []
+        self.facet_filters = {}
+        self.show_facets({})
         
         try:
-            results = search.search(search_term)
-            if not results:
+            if self.fuzzy_search_var.get():
+                total = self.search_table.set_source(*self.fuzzy_source(search_term))
+            else:
+                self.search_term = search_term
+                total = self.show_ranked_results(search_term)
+                if not total:
+                    # Probably a typo: show the closest matches instead of nothing
+                    self.search_term = None
+                    total = self.search_table.set_source(*self.fuzzy_source(search_term))
+                    if total:
+                        self.show_status_message(f"No exact matches for '{search_term}'. Showing close matches.", 8000)
+            if not total:
                 messagebox.showinfo("No Results", f"No books found matching '{search_term}'.")
                 return
-            
-            for result in results:
-                self.search_tree.insert("", tk.END, values=(
-                    result['ISBN'],
-                    result['Title'],
-                    result['Authors'],
-                    result['Status'],
-                    result['Borrower_id']
-                ))
         except Exception as e:
+            self.search_table.clear()
             import traceback
             error_details = traceback.format_exc()
             print(f"Search error: {error_details}")  # Print to console for debugging
             messagebox.showerror("Error", f"Search failed: {str(e)}\n\nPlease ensure the database file exists.")
     
-    def create_checkout_tab(self):
+    def show_branch_errors(self, errors):
+        """Name the branches a federated query could not reach in the status bar"""
+        if errors:
+            self.show_status_message("Branches not searched: " +
+                                     "; ".join(f"{name} ({error})" for name, error in errors.items()), 8000)
+    
+    def show_ranked_results(self, search_term):
+        """
+        Page through the matches of a search term without loading them all.
+        
+        Each page is its own LIMIT/OFFSET query, ranked by relevance or in
+        ISBN order, so only the visible rows are read.
+        
+        Returns:
+            int: Number of matching books
+        """
+        by_isbn = self.search_order_var.get() == "ISBN"
+        
+        if not BRANCHES:
+            def count():
+                return search.count_search(search_term)
+            
+            def fetch(offset, limit):
+                if by_isbn:
+                    results = search.search(search_term, limit, offset)
+                else:
+                    results = search.ranked_search(search_term, limit, offset)
+                return [(result['ISBN'], result['Title'], result['Authors'], result['Availability'],
+                         result['Borrower_id']) for result in results]
+        else:
+            def count():
+                total, errors = federation.federated_count_search(search_term)
+                self.show_branch_errors(errors)
+                return total
+            
+            def fetch(offset, limit):
+                if by_isbn:
+                    results, errors = federation.federated_search(search_term, limit, offset)
+                else:
+                    results, errors = federation.federated_ranked_search(search_term, limit, offset)
+                self.show_branch_errors(errors)
+                return [(result['ISBN'], result['Title'], result['Authors'], result['Availability'],
+                         result['Borrower_id'], result['Branch']) for result in results]
+        
+        return self.search_table.set_source(count, fetch)
+    
+    def load_facets(self):
+        """Find every match of the last search once, then show its facets"""
+        if not self.search_term:
+            self.show_status_message("Search for a term first; typo-tolerant results have no facets.")
+            return
+        if not self.search_match_list:
+            try:
+                if not BRANCHES:
+                    matches = search.search_matches(self.search_term)
+                else:
+                    matches, errors = federation.federated_search_matches(self.search_term)
+                    self.show_branch_errors(errors)
+            except Exception as e:
+                messagebox.showerror("Error", f"Could not compute facets: {str(e)}")
+                return
+            if self.search_order_var.get() == "ISBN":
+                matches.sort(key=lambda match: (match[0], match[2][-1]) if BRANCHES else match[0])
+            self.search_match_list = matches
+        self.show_search_matches()
+    
+    def show_search_matches(self):
+        """Show the search matches that pass the facet filters, and their facets"""
+        facet_names = federation.FACET_NAMES if BRANCHES else search.FACET_NAMES
+        matches = search.filter_matches(self.search_match_list, self.facet_filters, facet_names)
+        self.show_facets(search.facet_counts(matches, facet_names))
+        
+        def fetch(offset, limit):
+            page = matches[offset:offset + limit]
+            if not BRANCHES:
+                return [(result['ISBN'], result['Title'], result['Authors'], result['Availability'], result['Borrower_id'])
+                        for result in search.lookup_books([isbn for isbn, score, values in page])]
+            results, errors = federation.federated_lookup_books(page)
+            self.show_branch_errors(errors)
+            return [(result['ISBN'], result['Title'], result['Authors'], result['Availability'],
+                     result['Borrower_id'], result['Branch']) for result in results]
+        
+        return self.search_table.set_source(lambda: len(matches), fetch)
+    
+    def show_facets(self, facets):
+        """Fill the facet panel with (value, count) lists, marking the active filters"""
+        self.facet_tree.delete(*self.facet_tree.get_children())
+        self.facet_values = {}
+        for facet, values in facets.items():
+            if not values:
+                continue
+            parent = self.facet_tree.insert("", tk.END, text=facet, open=True)
+            for value, count in values:
+                mark = "\u2713 " if self.facet_filters.get(facet) == value else ""
+                item = self.facet_tree.insert(parent, tk.END, text=f"{mark}{value} ({count})")
+                self.facet_values[item] = (facet, value)
+    
+    def on_facet_click(self, event):
+        """Narrow the results to a facet value, or drop that filter if it is already active"""
+        item = self.facet_tree.identify_row(event.y)
+        if item not in self.facet_values:
+            return
+        facet, value = self.facet_values[item]
+        if self.facet_filters.get(facet) == value:
+            del self.facet_filters[facet]
+        else:
+            self.facet_filters[facet] = value
+        self.show_search_matches()
+    
+    def clear_facet_filters(self):
+        """Show all results of the last search again"""
+        if self.facet_filters:
+            self.facet_filters = {}
+            self.show_search_matches()
+    
+    def fuzzy_source(self, search_term):
+        """Return (count, fetch) functions over the best typo-tolerant matches"""
+        if not BRANCHES:
+            rows = [(result['ISBN'], result['Title'], result['Authors'], result['Availability'], result['Borrower_id'])
+                    for result in fuzzy.fuzzy_search(search_term)]
+        else:
+            results, errors = federation.federated_fuzzy_search(search_term)
+            rows = [(result['ISBN'], result['Title'], result['Authors'], result['Availability'],
+                     result['Borrower_id'], result['Branch']) for result in results]
+            self.show_branch_errors(errors)
+        # The results are already bounded, so pages are slices of one list
+        return (lambda: len(rows)), (lambda offset, limit: rows[offset:offset + limit])
+    
+    def create_checkout_tab(self, checkout_frame):
         """Create book checkout tab"""
-        checkout_frame = ttk.Frame(self.notebook)
-        self.notebook.add(checkout_frame, text="Checkout Book")
         
         # Input fields
         form_frame = ttk.LabelFrame(checkout_frame, text="Checkout Information", padding=20)
@@ -257,7 +512,7 @@ class LibraryManagementGUI:
         
         try:
             override = self.override_var.get()
-            success, message = loans.checkout(isbn, card_id, override)
+            success, message = self.circulation.checkout(isbn, card_id, override)
             self.checkout_status.insert(tk.END, f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] {message}\n")
             self.checkout_status.see(tk.END)
             
@@ -265,6 +520,9 @@ class LibraryManagementGUI:
                 messagebox.showinfo("Success", message)
                 self.checkout_isbn.delete(0, tk.END)
                 self.checkout_card_id.delete(0, tk.END)
+            elif "already checked out" in message or "on hold for another borrower" in message:
+                if messagebox.askyesno("Not Available", f"{message}\n\nPlace a hold for borrower {card_id}?"):
+                    self.place_hold(isbn, card_id)
             else:
                 messagebox.showerror("Error", message)
         except Exception as e:
@@ -272,10 +530,22 @@ class LibraryManagementGUI:
             self.checkout_status.insert(tk.END, f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] {error_msg}\n")
             messagebox.showerror("Error", error_msg)
     
-    def create_checkin_tab(self):
+    def place_hold(self, isbn, card_id):
+        """Queue a borrower for a book that is not available"""
+        try:
+            success, message, hold_id = holds.place_hold(isbn, card_id)
+            self.checkout_status.insert(tk.END, f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] {message}\n")
+            self.checkout_status.see(tk.END)
+            
+            if success:
+                messagebox.showinfo("Hold Placed", message)
+            else:
+                messagebox.showerror("Error", message)
+        except Exception as e:
+            messagebox.showerror("Error", f"Failed to place hold: {str(e)}")
+    
+    def create_checkin_tab(self, checkin_frame):
         """Create book check-in tab"""
-        checkin_frame = ttk.Frame(self.notebook)
-        self.notebook.add(checkin_frame, text="Check-in Book")
         
         # Search for loans
         search_frame = ttk.LabelFrame(checkin_frame, text="Find Loans", padding=10)
@@ -292,33 +562,24 @@ class LibraryManagementGUI:
         results_frame.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
         
         columns = ("Loan ID", "ISBN", "Title", "Card ID", "Borrower", "Date Out", "Due Date")
-        self.checkin_tree = ttk.Treeview(results_frame, columns=columns, show="headings", height=15)
-        
-        for col in columns:
-            self.checkin_tree.heading(col, text=col)
-        
-        self.checkin_tree.column("Loan ID", width=80)
-        self.checkin_tree.column("ISBN", width=150)
-        self.checkin_tree.column("Title", width=250)
-        self.checkin_tree.column("Card ID", width=100)
-        self.checkin_tree.column("Borrower", width=150)
-        self.checkin_tree.column("Date Out", width=100)
-        self.checkin_tree.column("Due Date", width=100)
-        
-        # Selection
-        self.checkin_tree.config(selectmode=tk.EXTENDED)
-        
-        scrollbar = ttk.Scrollbar(results_frame, orient=tk.VERTICAL, command=self.checkin_tree.yview)
-        self.checkin_tree.configure(yscrollcommand=scrollbar.set)
-        
-        self.checkin_tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
-        scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        widths = {"Loan ID": 80, "ISBN": 150, "Title": 250, "Card ID": 100,
+                  "Borrower": 150, "Date Out": 100, "Due Date": 100}
+        if BRANCHES:
+            # Federated mode: open loans of every configured branch are listed
+            columns += ("Branch",)
+            widths["Branch"] = 100
+        # Loan IDs are only unique within a branch, so federated rows are keyed by both
+        key_fn = (lambda row: (row[7], row[0])) if BRANCHES else None
+        self.checkin_table = VirtualTable(results_frame, columns, widths, height=15, selectmode=tk.EXTENDED,
+                                          key_fn=key_fn)
+        self.checkin_table.pack(fill=tk.BOTH, expand=True)
         
         # Check-in button
         button_frame = ttk.Frame(checkin_frame)
         button_frame.pack(fill=tk.X, padx=10, pady=10)
         
         ttk.Button(button_frame, text="Check-in Selected Books (1-3)", command=self.perform_checkin).pack(side=tk.LEFT, padx=5)
+        ttk.Button(button_frame, text="Book Drop Check-in...", command=self.open_book_drop).pack(side=tk.LEFT, padx=5)
         
         # Status display
         status_frame = ttk.LabelFrame(checkin_frame, text="Status", padding=10)
@@ -334,56 +595,73 @@ class LibraryManagementGUI:
             messagebox.showwarning("Warning", "Please enter a search term.")
             return
         
-        # Clear previous results
-        for item in self.checkin_tree.get_children():
-            self.checkin_tree.delete(item)
+        if not BRANCHES:
+            def fetch(offset, limit):
+                return [(loan['Loan_id'], loan['ISBN'], loan['Title'], loan['Card_id'],
+                         loan['Borrower_name'], loan['Date_out'], loan['Due_date'])
+                        for loan in self.loan_source.find_loans_by_search(search_term, limit, offset)]
+            
+            def count():
+                return self.loan_source.count_loans_by_search(search_term)
+        else:
+            def fetch(offset, limit):
+                results, errors = federation.federated_find_loans(search_term, limit, offset)
+                return [(loan['Loan_id'], loan['ISBN'], loan['Title'], loan['Card_id'],
+                         loan['Borrower_name'], loan['Date_out'], loan['Due_date'], loan['Branch'])
+                        for loan in results]
+            
+            def count():
+                total, errors = federation.federated_count_loans(search_term)
+                if errors:
+                    self.show_status_message("Branches not searched: " +
+                                             "; ".join(f"{name} ({error})" for name, error in errors.items()), 8000)
+                return total
         
         try:
-            loan_results = loans.find_loans_by_search(search_term)
-            if not loan_results:
+            total = self.checkin_table.set_source(count, fetch)
+            if not total:
                 messagebox.showinfo("No Results", f"No active loans found matching '{search_term}'.")
                 return
-            
-            for loan in loan_results:
-                self.checkin_tree.insert("", tk.END, values=(
-                    loan['Loan_id'],
-                    loan['ISBN'],
-                    loan['Title'],
-                    loan['Card_id'],
-                    loan['Borrower_name'],
-                    loan['Date_out'],
-                    loan['Due_date']
-                ))
         except Exception as e:
+            self.checkin_table.clear()
             messagebox.showerror("Error", f"Search failed: {str(e)}")
     
     def perform_checkin(self):
         """Perform book check-in"""
-        selected_items = self.checkin_tree.selection()
-        if not selected_items:
+        selected_rows = self.checkin_table.selected_values()
+        if not selected_rows:
             messagebox.showwarning("Warning", "Please select at least one loan to check in.")
             return
         
-        if len(selected_items) > 3:
+        if len(selected_rows) > 3:
             messagebox.showwarning("Warning", "You can only check in 1-3 books at a time.")
             return
         
+        # Loan IDs are only unique within a branch: each branch's loans are
+        # checked in at that branch's database (this terminal's own go through
+        # self.circulation as usual)
         loan_ids = []
-        for item in selected_items:
-            values = self.checkin_tree.item(item, 'values')
-            loan_ids.append(int(values[0]))
+        other_branches = {}
+        for values in selected_rows:
+            if BRANCHES and not federation.is_local_branch(values[7]):
+                other_branches.setdefault(values[7], []).append(int(values[0]))
+            else:
+                loan_ids.append(int(values[0]))
         
         try:
-            success, message = loans.checkin(loan_ids)
+            results = [self.circulation.checkin(loan_ids)] if loan_ids else []
+            for branch, branch_loan_ids in other_branches.items():
+                branch_success, branch_message = federation.branch_checkin(branch, branch_loan_ids)
+                results.append((branch_success, f"{branch}: {branch_message}"))
+            success = all(result[0] for result in results)
+            message = " ".join(result[1] for result in results)
             self.checkin_status.insert(tk.END, f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] {message}\n")
             self.checkin_status.see(tk.END)
             
             if success:
                 messagebox.showinfo("Success", message)
-                # Refresh the search
+                # Refresh the search (fines for the returned loans were accrued by the check-in)
                 self.search_loans()
-                # Update fines after check-in
-                fines.update_fines()
             else:
                 messagebox.showerror("Error", message)
         except Exception as e:
@@ -391,10 +669,57 @@ class LibraryManagementGUI:
             self.checkin_status.insert(tk.END, f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] {error_msg}\n")
             messagebox.showerror("Error", error_msg)
     
-    def create_borrower_tab(self):
+    def open_book_drop(self):
+        """Open a window for checking in a whole batch of scanned loan IDs or ISBNs"""
+        drop_window = tk.Toplevel(self.root)
+        drop_window.title("Book Drop Check-in")
+        drop_window.geometry("600x500")
+        
+        ttk.Label(drop_window, text="Scan or paste loan IDs or ISBNs, one per line:",
+                  font=("Arial", 10)).pack(anchor=tk.W, padx=10, pady=(10, 0))
+        items_text = scrolledtext.ScrolledText(drop_window, height=12, font=("Arial", 10))
+        items_text.pack(fill=tk.BOTH, expand=True, padx=10, pady=5)
+        items_text.focus_set()
+        
+        results_text = scrolledtext.ScrolledText(drop_window, height=10, font=("Arial", 9))
+        
+        ttk.Button(drop_window, text="Check In All",
+                   command=lambda: self.perform_batch_checkin(items_text, results_text)).pack(padx=10, pady=5)
+        results_text.pack(fill=tk.BOTH, expand=True, padx=10, pady=(0, 10))
+    
+    def perform_batch_checkin(self, items_text, results_text):
+        """Check in every loan ID or ISBN in the book drop window"""
+        items = []
+        for token in items_text.get("1.0", tk.END).split():
+            # Loan IDs are short numbers; ISBNs are 10 or 13 characters
+            items.append(int(token) if token.isdigit() and len(token) < 10 else token)
+        if not items:
+            messagebox.showwarning("Warning", "Please scan at least one loan ID or ISBN.")
+            return
+        
+        try:
+            success, message, outcomes = self.circulation.batch_checkin(items)
+        except Exception as e:
+            messagebox.showerror("Error", f"Check-in failed: {str(e)}")
+            return
+        
+        results_text.delete("1.0", tk.END)
+        for outcome in outcomes:
+            status = "OK " if outcome['Success'] else "ERR"
+            results_text.insert(tk.END, f"{status} {outcome['Item']}: {outcome['Message']}\n")
+        results_text.insert(tk.END, f"\n{message}\n")
+        
+        # Keep only the items that still need attention in the input box
+        items_text.delete("1.0", tk.END)
+        items_text.insert("1.0", "\n".join(str(outcome['Item']) for outcome in outcomes if not outcome['Success']))
+        
+        self.checkin_status.insert(tk.END, f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] Book drop: {message}\n")
+        self.checkin_status.see(tk.END)
+        if self.checkin_table.count_fn:
+            self.checkin_table.refresh()
+    
+    def create_borrower_tab(self, borrower_frame):
         """Create borrower management tab"""
-        borrower_frame = ttk.Frame(self.notebook)
-        self.notebook.add(borrower_frame, text="Borrower Management")
         
         # Form
         form_frame = ttk.LabelFrame(borrower_frame, text="Create New Borrower", padding=20)
@@ -456,10 +781,8 @@ class LibraryManagementGUI:
             self.borrower_status.insert(tk.END, f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] {error_msg}\n")
             messagebox.showerror("Error", error_msg)
     
-    def create_fines_tab(self):
+    def create_fines_tab(self, fines_frame):
         """Create fines management tab"""
-        fines_frame = ttk.Frame(self.notebook)
-        self.notebook.add(fines_frame, text="Fines Management")
         
         # Control buttons
         control_frame = ttk.Frame(fines_frame)
@@ -490,23 +813,12 @@ class LibraryManagementGUI:
         
         # Treeview for fines
         columns = ("Card ID", "Borrower", "Total Fine")
-        self.fines_tree = ttk.Treeview(display_frame, columns=columns, show="headings", height=15)
-        
-        for col in columns:
-            self.fines_tree.heading(col, text=col)
-        
-        self.fines_tree.column("Card ID", width=120)
-        self.fines_tree.column("Borrower", width=200)
-        self.fines_tree.column("Total Fine", width=150)
-        
-        scrollbar = ttk.Scrollbar(display_frame, orient=tk.VERTICAL, command=self.fines_tree.yview)
-        self.fines_tree.configure(yscrollcommand=scrollbar.set)
-        
-        self.fines_tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
-        scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        widths = {"Card ID": 120, "Borrower": 200, "Total Fine": 150}
+        self.fines_table = VirtualTable(display_frame, columns, widths, height=15)
+        self.fines_table.pack(fill=tk.BOTH, expand=True)
         
         # Bind double-click to show details
-        self.fines_tree.bind('<Double-1>', self.show_fine_details)
+        self.fines_table.tree.bind('<Double-1>', self.show_fine_details)
         
         # Payment section
         payment_frame = ttk.LabelFrame(fines_frame, text="Pay Fines", padding=10)
@@ -538,43 +850,26 @@ class LibraryManagementGUI:
     
     def refresh_fines_display(self):
         """Refresh the fines display"""
-        # Clear previous results
-        for item in self.fines_tree.get_children():
-            self.fines_tree.delete(item)
+        include_paid = (self.fines_filter.get() == "all")
+        search_term = self.fines_search_entry.get().strip().lower()
+        
+        def fetch(offset, limit):
+            return [(borrower_data['Card_id'], borrower_data['Bname'], f"${borrower_data['total_fine']:.2f}")
+                    for borrower_data in fines.get_fine_totals(include_paid, search_term, limit, offset)]
         
         try:
-            include_paid = (self.fines_filter.get() == "all")
-            search_term = self.fines_search_entry.get().strip().lower()
-            
-            borrowers_data = fines.get_fines_by_borrower(include_paid)
-            
-            if not borrowers_data:
-                return
-            
-            for card_id, borrower_data in borrowers_data.items():
-                # Filter by search term
-                if search_term:
-                    if (search_term not in card_id.lower() and 
-                        search_term not in borrower_data['Bname'].lower()):
-                        continue
-                
-                total_fine = f"${borrower_data['total_fine']:.2f}"
-                self.fines_tree.insert("", tk.END, values=(
-                    borrower_data['Card_id'],
-                    borrower_data['Bname'],
-                    total_fine
-                ), tags=(card_id,))
+            self.fines_table.set_source(lambda: fines.count_fine_totals(include_paid, search_term), fetch)
         except Exception as e:
+            self.fines_table.clear()
             messagebox.showerror("Error", f"Failed to refresh fines display: {str(e)}")
     
     def show_fine_details(self, event):
         """Show detailed fine information for selected borrower"""
-        selected_item = self.fines_tree.selection()
-        if not selected_item:
+        selected_rows = self.fines_table.selected_values()
+        if not selected_rows:
             return
         
-        item = self.fines_tree.item(selected_item[0])
-        card_id = item['tags'][0] if item['tags'] else item['values'][0]
+        card_id = selected_rows[0][0]
         
         # Create detail window
         detail_window = tk.Toplevel(self.root)
@@ -644,6 +939,93 @@ class LibraryManagementGUI:
             self.fines_status.insert(tk.END, f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] {error_msg}\n")
             messagebox.showerror("Error", error_msg)
 
+    
+    def create_reports_tab(self, reports_frame):
+        """Create circulation reports tab (reads only the rollup tables)"""
+        control_frame = ttk.Frame(reports_frame)
+        control_frame.pack(fill=tk.X, padx=10, pady=10)
+        
+        ttk.Label(control_frame, text="From (YYYY-MM-DD):", font=("Arial", 10)).pack(side=tk.LEFT, padx=5)
+        self.report_start = ttk.Entry(control_frame, width=12, font=("Arial", 10))
+        self.report_start.pack(side=tk.LEFT, padx=5)
+        
+        ttk.Label(control_frame, text="To:", font=("Arial", 10)).pack(side=tk.LEFT, padx=5)
+        self.report_end = ttk.Entry(control_frame, width=12, font=("Arial", 10))
+        self.report_end.pack(side=tk.LEFT, padx=5)
+        
+        ttk.Button(control_frame, text="Show Report", command=self.show_report).pack(side=tk.LEFT, padx=5)
+        ttk.Button(control_frame, text="Update Rollups", command=self.update_rollups).pack(side=tk.LEFT, padx=5)
+        
+        report_frame = ttk.LabelFrame(reports_frame, text="Circulation Report", padding=10)
+        report_frame.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
+        
+        self.report_text = scrolledtext.ScrolledText(report_frame, font=("Courier", 9))
+        self.report_text.pack(fill=tk.BOTH, expand=True)
+        
+        self.show_report()
+    
+    def show_report(self):
+        """Show the circulation report for the selected date range"""
+        start = self.report_start.get().strip() or None
+        end = self.report_end.get().strip() or None
+        
+        try:
+            report = analytics.format_report(start, end)
+        except Exception as e:
+            messagebox.showerror("Error", f"Failed to build report: {str(e)}")
+            return
+        
+        self.report_text.config(state=tk.NORMAL)
+        self.report_text.delete("1.0", tk.END)
+        self.report_text.insert(tk.END, report)
+        self.report_text.config(state=tk.DISABLED)
+    
+    def update_rollups(self):
+        """Fold new loans and returns into the rollups, then refresh the report"""
+        try:
+            new_loans, new_returns = analytics.update_rollups()
+            self.show_status_message(f"Rollups updated: {new_loans} new loan(s), {new_returns} return(s).")
+            self.show_report()
+        except Exception as e:
+            messagebox.showerror("Error", f"Failed to update rollups: {str(e)}")
+    
+    def create_memory_tab(self, memory_frame):
+        """Create memory profiling debug tab (peak usage and top allocation sites per operation)"""
+        control_frame = ttk.Frame(memory_frame)
+        control_frame.pack(fill=tk.X, padx=10, pady=10)
+        
+        ttk.Button(control_frame, text="Refresh", command=self.show_memory_report).pack(side=tk.LEFT, padx=5)
+        ttk.Button(control_frame, text="Reset", command=self.reset_memory_stats).pack(side=tk.LEFT, padx=5)
+        self.memory_toggle = ttk.Button(control_frame, command=self.toggle_memory_profiling)
+        self.memory_toggle.pack(side=tk.LEFT, padx=5)
+        
+        report_frame = ttk.LabelFrame(memory_frame, text="Allocations by Operation", padding=10)
+        report_frame.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
+        
+        self.memory_text = scrolledtext.ScrolledText(report_frame, font=("Courier", 9), wrap=tk.NONE)
+        self.memory_text.pack(fill=tk.BOTH, expand=True)
+        
+        self.show_memory_report()
+    
+    def show_memory_report(self):
+        """Show the collected memory statistics"""
+        self.memory_toggle.config(text="Stop Tracing" if memprofile.is_enabled() else "Start Tracing")
+        self.memory_text.config(state=tk.NORMAL)
+        self.memory_text.delete("1.0", tk.END)
+        self.memory_text.insert(tk.END, memprofile.format_report())
+        self.memory_text.config(state=tk.DISABLED)
+    
+    def reset_memory_stats(self):
+        memprofile.reset()
+        self.show_memory_report()
+    
+    def toggle_memory_profiling(self):
+        if memprofile.is_enabled():
+            memprofile.disable()
+        else:
+            memprofile.enable()
+        self.show_memory_report()
+
 
 def main():
     root = tk.Tk()
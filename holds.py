@@ -0,0 +1,286 @@
+import sqlite3
+from datetime import date, datetime, timedelta
+import copies
+from config import DB_PATH
+
+PICKUP_DAYS = 7  # a ready hold is kept on the shelf this long
+MAX_LOANS = 3    # holders at the loan limit are passed over, as at checkout
+
+# First waiting hold, in queue order, whose holder could check the book out
+DISPATCH_HOLD_QUERY = """
+    UPDATE HOLDS
+    SET Status = 'READY', Ready_at = ?, Expires_at = ?
+    WHERE Hold_id = (
+        SELECT h.Hold_id FROM HOLDS h
+        LEFT JOIN BORROWER_STANDING s ON s.Card_id = h.Card_id
+        WHERE h.Isbn = ? AND h.Status = 'WAITING'
+          AND COALESCE(s.Has_unpaid, 0) = 0
+          AND COALESCE(s.Active_loans, 0) < {max_loans}
+        ORDER BY h.Queued_at, h.Hold_id
+        LIMIT 1
+    )
+    RETURNING Hold_id, Card_id, Expires_at
+""".format(max_loans=MAX_LOANS)
+
+
+def place_hold(isbn, card_id):
+    """
+    Put a borrower in the hold queue for a book with no free copy.
+
+    Args:
+        isbn (str): ISBN of the book
+        card_id (str): Borrower card ID
+
+    Returns:
+        tuple: (success: bool, message: str, hold_id: int or None)
+    """
+    conn = sqlite3.connect(DB_PATH)
+    conn.row_factory = sqlite3.Row
+    cur = conn.cursor()
+
+    try:
+        cur.execute("SELECT Card_id FROM BORROWER WHERE Card_id = ?", (card_id,))
+        if not cur.fetchone():
+            conn.close()
+            return False, f"Error: Borrower with card ID '{card_id}' not found.", None
+
+        cur.execute("SELECT Title FROM BOOK WHERE Isbn = ?", (isbn,))
+        book = cur.fetchone()
+        if not book:
+            conn.close()
+            return False, f"Error: Book with ISBN '{isbn}' not found.", None
+
+        # Copies on the hold shelf are not free for other borrowers
+        total, available = copies.get_availability(cur, isbn)
+        if total and available > len(ready_holds(cur, isbn)):
+            conn.close()
+            return False, f"Error: Book with ISBN '{isbn}' is available. Check it out instead of placing a hold.", None
+        cur.execute("SELECT 1 FROM ACTIVE_LOANS WHERE Isbn = ? AND Card_id = ?", (isbn, card_id))
+        if cur.fetchone():
+            conn.close()
+            return False, f"Error: Borrower {card_id} already has this book checked out.", None
+
+        cur.execute("""
+            INSERT INTO HOLDS (Isbn, Card_id, Queued_at, Status)
+            VALUES (?, ?, ?, 'WAITING')
+        """, (isbn, card_id, datetime.now().isoformat(timespec='seconds')))
+        hold_id = cur.lastrowid
+
+        cur.execute("""
+            SELECT COUNT(*) FROM HOLDS
+            WHERE Isbn = ? AND Status = 'WAITING' AND Hold_id <= ?
+        """, (isbn, hold_id))
+        position = cur.fetchone()[0]
+
+        conn.commit()
+        conn.close()
+
+        return True, f"Hold placed on '{book['Title']}' (ISBN: {isbn}) for {card_id}. Queue position: {position}.", hold_id
+
+    except sqlite3.IntegrityError:
+        conn.rollback()
+        conn.close()
+        return False, f"Error: Borrower {card_id} already has an active hold on ISBN '{isbn}'.", None
+
+    except sqlite3.Error as e:
+        conn.close()
+        return False, f"Database error: {str(e)}", None
+
+
+def cancel_hold(hold_id):
+    """
+    Cancel a waiting or ready hold. A cancelled ready hold passes the book to the next in line.
+
+    Args:
+        hold_id (int): Hold ID
+
+    Returns:
+        tuple: (success: bool, message: str)
+    """
+    conn = sqlite3.connect(DB_PATH)
+    conn.row_factory = sqlite3.Row
+    cur = conn.cursor()
+
+    try:
+        cur.execute("""
+            SELECT Isbn, Status FROM HOLDS
+            WHERE Hold_id = ? AND Status IN ('WAITING', 'READY')
+        """, (hold_id,))
+        row = cur.fetchone()
+        if not row:
+            conn.close()
+            return False, f"Error: Hold {hold_id} not found or no longer active."
+
+        cur.execute("UPDATE HOLDS SET Status = 'CANCELLED' WHERE Hold_id = ?", (hold_id,))
+        message = f"Hold {hold_id} cancelled."
+        if row['Status'] == 'READY':
+            next_hold = dispatch_next_hold(cur, row['Isbn'])
+            if next_hold:
+                message += f" ISBN {row['Isbn']} is now on hold for {next_hold['Card_id']}."
+
+        conn.commit()
+        conn.close()
+        return True, message
+
+    except sqlite3.Error as e:
+        conn.close()
+        return False, f"Database error: {str(e)}"
+
+
+def dispatch_next_hold(cur, isbn, today=None):
+    """
+    Mark the next eligible waiting hold on a book as ready for pickup.
+
+    Called inside the check-in transaction, once per returned copy. Holders
+    who could not check the copy out now (unpaid fines, or the 3-loan limit
+    reached, as read from BORROWER_STANDING) are passed over and keep their
+    place in the queue for a later copy. The lookup walks the
+    (Isbn, Queued_at) index of waiting holds in queue order with a key
+    lookup per holder, so it stops at the first eligible one.
+
+    Args:
+        cur: Cursor on the caller's connection
+        isbn (str): ISBN that just became available
+        today (date): Date the hold becomes ready (default: today)
+
+    Returns:
+        dict: The dispatched hold (Hold_id, Card_id, Expires_at), or None if nobody eligible is waiting
+    """
+    today = today or date.today()
+    expires_at = today + timedelta(days=PICKUP_DAYS)
+    cur.execute(DISPATCH_HOLD_QUERY, (today.isoformat(), expires_at.isoformat(), isbn))
+    row = cur.fetchone()
+    if not row:
+        return None
+    return {'Hold_id': row[0], 'Card_id': row[1], 'Expires_at': row[2]}
+
+
+def ready_holds(cur, isbn):
+    """
+    Return the (Hold_id, Card_id) of every ready hold on a book.
+
+    Used by checkout to keep one free copy on the hold shelf per ready hold.
+    """
+    cur.execute("SELECT Hold_id, Card_id FROM HOLDS WHERE Isbn = ? AND Status = 'READY'", (isbn,))
+    return [(row[0], row[1]) for row in cur.fetchall()]
+
+
+def fulfill_hold(cur, hold_id):
+    """Mark a ready hold as picked up (inside the checkout transaction)."""
+    cur.execute("UPDATE HOLDS SET Status = 'FULFILLED' WHERE Hold_id = ?", (hold_id,))
+
+
+def expire_holds(today=None):
+    """
+    Expire ready holds that were not picked up in time and pass each copy on.
+
+    Runs as a set-based batch: one UPDATE expires every overdue ready hold,
+    and one UPDATE promotes, for each of those books, as many waiting holds
+    as it had holds expire. As in dispatch_next_hold(), holders with unpaid
+    fines or at the loan limit are passed over and keep their place.
+
+    Args:
+        today (date): Processing date (default: today)
+
+    Returns:
+        tuple: (expired: int, promoted: int)
+    """
+    today = today or date.today()
+    expires_at = today + timedelta(days=PICKUP_DAYS)
+
+    conn = sqlite3.connect(DB_PATH)
+    cur = conn.cursor()
+
+    cur.execute("CREATE TEMP TABLE IF NOT EXISTS EXPIRED_HOLD_ISBNS (Isbn TEXT PRIMARY KEY, Freed INTEGER NOT NULL)")
+    cur.execute("DELETE FROM EXPIRED_HOLD_ISBNS")
+    cur.execute("""
+        UPDATE HOLDS SET Status = 'EXPIRED'
+        WHERE Status = 'READY' AND Expires_at < ?
+        RETURNING Isbn
+    """, (today.isoformat(),))
+    expired_isbns = cur.fetchall()
+    cur.executemany("""
+        INSERT INTO EXPIRED_HOLD_ISBNS (Isbn, Freed) VALUES (?, 1)
+        ON CONFLICT (Isbn) DO UPDATE SET Freed = Freed + 1
+    """, expired_isbns)
+
+    cur.execute("""
+        UPDATE HOLDS
+        SET Status = 'READY', Ready_at = ?, Expires_at = ?
+        WHERE Hold_id IN (
+            SELECT q.Hold_id
+            FROM EXPIRED_HOLD_ISBNS e
+            JOIN (
+                SELECT h.Hold_id, h.Isbn,
+                       ROW_NUMBER() OVER (PARTITION BY h.Isbn ORDER BY h.Queued_at, h.Hold_id) as Position
+                FROM HOLDS h
+                LEFT JOIN BORROWER_STANDING s ON s.Card_id = h.Card_id
+                WHERE h.Status = 'WAITING'
+                  AND h.Isbn IN (SELECT Isbn FROM EXPIRED_HOLD_ISBNS)
+                  AND COALESCE(s.Has_unpaid, 0) = 0
+                  AND COALESCE(s.Active_loans, 0) < ?
+            ) q ON q.Isbn = e.Isbn AND q.Position <= e.Freed
+        )
+    """, (today.isoformat(), expires_at.isoformat(), MAX_LOANS))
+    promoted = cur.rowcount
+
+    conn.commit()
+    conn.close()
+    return len(expired_isbns), promoted
+
+
+def get_holds(isbn=None, card_id=None, active_only=True):
+    """
+    List holds for a book and/or a borrower.
+
+    Args:
+        isbn (str): Only holds on this ISBN
+        card_id (str): Only holds for this borrower
+        active_only (bool): If True, only WAITING and READY holds
+
+    Returns:
+        list: Dictionaries with keys Hold_id, ISBN, Title, Card_id, Queued_at, Status, Expires_at
+    """
+    conn = sqlite3.connect(DB_PATH)
+    conn.row_factory = sqlite3.Row
+    cur = conn.cursor()
+
+    conditions = []
+    params = []
+    if isbn:
+        conditions.append("h.Isbn = ?")
+        params.append(isbn)
+    if card_id:
+        conditions.append("h.Card_id = ?")
+        params.append(card_id)
+    if active_only:
+        conditions.append("h.Status IN ('WAITING', 'READY')")
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+
+    cur.execute(f"""
+        SELECT h.Hold_id, h.Isbn, b.Title, h.Card_id, h.Queued_at, h.Status, h.Expires_at
+        FROM HOLDS h
+        JOIN BOOK b ON h.Isbn = b.Isbn
+        {where}
+        ORDER BY h.Isbn, h.Queued_at, h.Hold_id
+    """, params)
+
+    holds = []
+    for row in cur.fetchall():
+        holds.append({
+            'Hold_id': row['Hold_id'],
+            'ISBN': row['Isbn'],
+            'Title': row['Title'],
+            'Card_id': row['Card_id'],
+            'Queued_at': row['Queued_at'],
+            'Status': row['Status'],
+            'Expires_at': row['Expires_at']
+        })
+
+    conn.close()
+    return holds
+
+
+if __name__ == "__main__":
+    expired, promoted = expire_holds()
+    print(f"Expired {expired} hold(s); {promoted} passed to the next borrower in line.")
@@ -0,0 +1,265 @@
+import csv
+import io
+import os
+import sqlite3
+import sys
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from config import DB_PATH
+
+CHUNK_BYTES = 4 * 1024 * 1024   # target size of the byte range each worker parses
+SCAN_BLOCK = 1024 * 1024        # read size when looking for chunk boundaries
+MAX_IN_FLIGHT = 2               # parsed chunks waiting for the writer, per worker
+
+# The catalog and borrower dumps loaded by init_db: (file, table, csv column -> table column)
+CATALOG_SOURCES = [
+    ("book.csv", "BOOK", {"ISBN13": "Isbn", "Title": "Title"}),
+    ("authors.csv", "AUTHORS", {"Author_id": "Author_id", "Author": "Name"}),
+    ("book_authors.csv", "BOOK_AUTHORS", {"ISBN13": "Isbn", "Author_id": "Author_id"}),
+    ("borrower.csv", "BORROWER", {
+        "Card_id": "Card_id",
+        "Bname": "Bname",
+        "Address": "Address",
+        "Phone": "Phone",
+        "Ssn": "Ssn"
+    }),
+]
+
+
+class IngestError(Exception):
+    """A CSV file could not be loaded; nothing from the run was committed."""
+
+
+def read_header(path):
+    """Return (header columns, byte offset of the first data row)"""
+    with open(path, 'rb') as f:
+        line = f.readline()
+        offset = f.tell()
+    header = next(csv.reader([line.decode('utf-8-sig')]))
+    return header, offset
+
+
+def split_chunks(path, data_start, chunk_bytes=CHUNK_BYTES):
+    """
+    Split the data rows of a CSV file into byte ranges that start on a row.
+
+    A boundary is only placed after a newline that is outside quotes (an
+    even number of '"' since the start of the data), so quoted fields that
+    contain newlines are never cut. Scanning only counts bytes, which is
+    far cheaper than parsing.
+
+    Returns:
+        list: (start, end) byte offsets
+    """
+    ranges = []
+    chunk_start = data_start
+    target = chunk_start + chunk_bytes
+    in_quotes = 0
+    seeking = False
+
+    with open(path, 'rb') as f:
+        f.seek(data_start)
+        base = data_start
+        while True:
+            block = f.read(SCAN_BLOCK)
+            if not block:
+                break
+            k = 0
+            while True:
+                if not seeking:
+                    if base + len(block) <= target:
+                        in_quotes ^= block.count(b'"', k) & 1
+                        break
+                    t = target - base
+                    in_quotes ^= block.count(b'"', k, t) & 1
+                    k = t
+                    seeking = True
+                j = block.find(b'\n', k)
+                if j < 0:
+                    in_quotes ^= block.count(b'"', k) & 1
+                    break
+                in_quotes ^= block.count(b'"', k, j) & 1
+                k = j + 1
+                if not in_quotes:
+                    ranges.append((chunk_start, base + k))
+                    chunk_start = base + k
+                    target = chunk_start + chunk_bytes
+                    seeking = False
+            base += len(block)
+
+    if chunk_start < base:
+        ranges.append((chunk_start, base))
+    return ranges
+
+
+def parse_chunk(path, start, end, indexes, width):
+    """
+    Parse one byte range of a CSV file into tuples of the wanted columns.
+
+    Runs in a worker process. Rows with the wrong number of fields raise
+    IngestError naming the byte offset of the chunk.
+
+    Returns:
+        tuple: (rows: list of tuples, bytes parsed: int)
+    """
+    with open(path, 'rb') as f:
+        f.seek(start)
+        data = f.read(end - start)
+
+    rows = []
+    for row_no, row in enumerate(csv.reader(io.StringIO(data.decode('utf-8'), newline='')), 1):
+        if not row:
+            continue
+        if len(row) != width:
+            raise IngestError(f"{os.path.basename(path)}: row {row_no} of the chunk at byte {start} "
+                              f"has {len(row)} fields, expected {width}.")
+        rows.append(tuple(row[i] for i in indexes))
+    return rows, end - start
+
+
+def file_chunks(path, columns, chunk_bytes=CHUNK_BYTES):
+    """
+    Return the parse_chunk() argument tuples covering one CSV file.
+
+    Args:
+        path (str): CSV file
+        columns (list): CSV columns to extract, in output order
+        chunk_bytes (int): Target size of each chunk
+
+    Returns:
+        list: (path, start, end, indexes, width) tuples
+    """
+    header, data_start = read_header(path)
+    missing = [col for col in columns if col not in header]
+    if missing:
+        raise IngestError(f"{os.path.basename(path)}: missing column(s) {', '.join(missing)}.")
+    indexes = tuple(header.index(col) for col in columns)
+    return [(path, start, end, indexes, len(header))
+            for start, end in split_chunks(path, data_start, chunk_bytes)]
+
+
+def read_rows(path, columns, workers=0, chunk_bytes=CHUNK_BYTES):
+    """
+    Parse a whole CSV file into tuples of the given columns, in file order.
+
+    With workers > 0 the chunks are parsed by that many processes.
+    """
+    chunks = file_chunks(path, columns, chunk_bytes)
+    rows = []
+    if workers <= 0 or len(chunks) == 1:
+        for args in chunks:
+            rows.extend(parse_chunk(*args)[0])
+        return rows
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for chunk_rows, size in pool.map(parse_chunk, *zip(*chunks)):
+            rows.extend(chunk_rows)
+    return rows
+
+
+def plan(sources, base_dir=".", chunk_bytes=CHUNK_BYTES):
+    """
+    Build the list of parse tasks for the given sources.
+
+    Returns:
+        tuple: (tasks: list of (sql, path, start, end, indexes, width), total bytes: int)
+    """
+    tasks = []
+    total = 0
+    for csv_file, table, col_map in sources:
+        placeholders = ",".join(["?"] * len(col_map))
+        sql = f"INSERT INTO {table} ({','.join(col_map.values())}) VALUES ({placeholders})"
+        for args in file_chunks(os.path.join(base_dir, csv_file), list(col_map), chunk_bytes):
+            tasks.append((sql, *args))
+            total += args[2] - args[1]
+    return tasks, total
+
+
+def print_progress(done, total):
+    percent = 100 * done / total if total else 100
+    sys.stderr.write(f"\rLoading CSV data: {percent:5.1f}% ({done:,} of {total:,} bytes)")
+    if done >= total:
+        sys.stderr.write("\n")
+    sys.stderr.flush()
+
+
+def ingest(conn, sources=CATALOG_SOURCES, base_dir=".", workers=None,
+           chunk_bytes=CHUNK_BYTES, progress=print_progress):
+    """
+    Load CSV files into their tables with parallel parsing and a single writer.
+
+    Worker processes parse byte-range chunks into tuples. The calling
+    thread is the only writer and inserts each chunk with executemany, in
+    file order, all in one transaction. At most MAX_IN_FLIGHT chunks per
+    worker are parsed ahead of the writer, so memory stays bounded when
+    parsing outruns the database. A malformed row stops the run, cancels
+    the outstanding chunks and rolls back, leaving the tables as they were.
+
+    Args:
+        conn: Connection to load into
+        sources (list): (csv file, table, csv column -> table column) entries
+        base_dir (str): Directory containing the CSV files
+        workers (int): Parser processes (default: CPU count; 0 parses in this process)
+        chunk_bytes (int): Target size of each parsed chunk
+        progress: Callable (bytes done, total bytes), or None
+
+    Returns:
+        int: Number of rows inserted
+    """
+    tasks, total = plan(sources, base_dir, chunk_bytes)
+    if workers is None:
+        workers = os.cpu_count() or 1
+    cur = conn.cursor()
+    inserted = 0
+    done = 0
+
+    def write(sql, rows, size):
+        nonlocal inserted, done
+        cur.executemany(sql, rows)
+        inserted += len(rows)
+        done += size
+        if progress:
+            progress(done, total)
+
+    try:
+        if workers <= 0:
+            for sql, *args in tasks:
+                write(sql, *parse_chunk(*args))
+        else:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                pending = deque()
+                try:
+                    for sql, *args in tasks:
+                        pending.append((sql, pool.submit(parse_chunk, *args)))
+                        # Back-pressure: wait for the writer before parsing further ahead
+                        if len(pending) >= workers * MAX_IN_FLIGHT:
+                            sql, future = pending.popleft()
+                            write(sql, *future.result())
+                    while pending:
+                        sql, future = pending.popleft()
+                        write(sql, *future.result())
+                except BaseException:
+                    for _, future in pending:
+                        future.cancel()
+                    raise
+        conn.commit()
+    except IngestError:
+        conn.rollback()
+        raise
+    except sqlite3.Error as e:
+        conn.rollback()
+        raise IngestError(f"Database error: {str(e)}") from e
+
+    return inserted
+
+
+if __name__ == "__main__":
+    # Usage: python ingest.py [csv directory] -- loads into the configured database
+    conn = sqlite3.connect(DB_PATH)
+    try:
+        rows = ingest(conn, base_dir=sys.argv[1] if len(sys.argv) > 1 else ".")
+        print(f"Loaded {rows} rows.")
+    except IngestError as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+    finally:
+        conn.close()
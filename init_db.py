@@ -1,7 +1,15 @@
 import sqlite3
-import csv
+import sys
+from datetime import datetime
 from pathlib import Path
 from config import DB_PATH
+import standing
+import borrowers
+import copies
+import backup
+import ingest
+import fuzzy
+import loans
 
 def create_tables(conn):
     cur = conn.cursor()
@@ -35,6 +43,8 @@ def create_tables(conn):
         FOREIGN KEY (Author_id) REFERENCES AUTHORS(Author_id)
     );
     """)
+    # Books of an author, for author matches found by fuzzy search
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_book_authors_author ON BOOK_AUTHORS (Author_id);")
 
     # BORROWER
     cur.execute("""
@@ -47,6 +57,40 @@ def create_tables(conn):
     );
     """)
 
+    # BOOK_COPIES - physical copies of each title. On_loan is kept in step
+    # with ACTIVE_LOANS so a free copy is one seek on idx_copies_free.
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS BOOK_COPIES (
+        Copy_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        Isbn TEXT NOT NULL,
+        Branch TEXT NOT NULL DEFAULT 'Main',
+        On_loan INTEGER NOT NULL DEFAULT 0 CHECK (On_loan IN (0,1)),
+        FOREIGN KEY (Isbn) REFERENCES BOOK(Isbn)
+    );
+    """)
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_copies_isbn ON BOOK_COPIES (Isbn);")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_copies_free ON BOOK_COPIES (Isbn) WHERE On_loan = 0;")
+
+    # BOOK_AVAILABILITY - maintained copy counts per title (see copies.py)
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS BOOK_AVAILABILITY (
+        Isbn TEXT PRIMARY KEY,
+        Copies INTEGER NOT NULL DEFAULT 0,
+        Available INTEGER NOT NULL DEFAULT 0,
+        FOREIGN KEY (Isbn) REFERENCES BOOK(Isbn)
+    );
+    """)
+
+    # BOOK_POPULARITY - maintained count of all loans per title, used to rank
+    # search results (see loans.py)
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS BOOK_POPULARITY (
+        Isbn TEXT PRIMARY KEY,
+        Loans INTEGER NOT NULL DEFAULT 0,
+        FOREIGN KEY (Isbn) REFERENCES BOOK(Isbn)
+    );
+    """)
+
     # BOOK_LOANS
     cur.execute("""
     CREATE TABLE IF NOT EXISTS BOOK_LOANS (
@@ -56,10 +100,15 @@ def create_tables(conn):
         Date_out DATE NOT NULL,
         Due_date DATE NOT NULL,
         Date_in DATE,
+        Copy_id INTEGER,
         FOREIGN KEY (Isbn) REFERENCES BOOK(Isbn),
-        FOREIGN KEY (Card_id) REFERENCES BORROWER(Card_id)
+        FOREIGN KEY (Card_id) REFERENCES BORROWER(Card_id),
+        FOREIGN KEY (Copy_id) REFERENCES BOOK_COPIES(Copy_id)
     );
     """)
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_book_loans_isbn ON BOOK_LOANS (Isbn);")
+    # A borrower's fines are found through their loans (pay_fines, get_unpaid_fines)
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_book_loans_card ON BOOK_LOANS (Card_id);")
 
     # FINES
     cur.execute("""
@@ -71,46 +120,323 @@ def create_tables(conn):
     );
     """)
 
+    # LIBRARY_CLOSURES - days the library is closed besides the weekly
+    # config.CLOSED_WEEKDAYS; not charged as overdue, never a due date (see closures.py)
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS LIBRARY_CLOSURES (
+        Closed_on DATE PRIMARY KEY,
+        Reason TEXT
+    );
+    """)
+
+    # ACTIVE_LOANS - one row per copy currently checked out.
+    # Copy_id is the primary key, so a second open loan for the same copy is
+    # rejected by the database itself.
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS ACTIVE_LOANS (
+        Copy_id INTEGER PRIMARY KEY,
+        Loan_id INTEGER NOT NULL UNIQUE,
+        Isbn TEXT NOT NULL,
+        Card_id TEXT NOT NULL,
+        FOREIGN KEY (Copy_id) REFERENCES BOOK_COPIES(Copy_id),
+        FOREIGN KEY (Loan_id) REFERENCES BOOK_LOANS(Loan_id),
+        FOREIGN KEY (Isbn) REFERENCES BOOK(Isbn),
+        FOREIGN KEY (Card_id) REFERENCES BORROWER(Card_id)
+    );
+    """)
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_active_loans_isbn ON ACTIVE_LOANS (Isbn);")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_active_loans_card ON ACTIVE_LOANS (Card_id);")
+
+    # BORROWER_STANDING - per-borrower checkout eligibility summary,
+    # maintained incrementally by loans.py and fines.py (see standing.py)
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS BORROWER_STANDING (
+        Card_id TEXT PRIMARY KEY,
+        Active_loans INTEGER NOT NULL DEFAULT 0,
+        Unpaid_total DECIMAL(10,2) NOT NULL DEFAULT 0,
+        Has_unpaid INTEGER NOT NULL DEFAULT 0 CHECK (Has_unpaid IN (0,1)),
+        FOREIGN KEY (Card_id) REFERENCES BORROWER(Card_id)
+    );
+    """)
+
+    # CARD_ID_SEQUENCE - next Card_id number, allocated by borrowers.py
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS CARD_ID_SEQUENCE (
+        Name TEXT PRIMARY KEY,
+        Next_value INTEGER NOT NULL
+    );
+    """)
+
+    # CIRCULATION_JOURNAL - append-only log of checkout/check-in events
+    # written by journal.py, with the outcome of applying each one
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS CIRCULATION_JOURNAL (
+        Seq INTEGER PRIMARY KEY AUTOINCREMENT,
+        Event TEXT NOT NULL CHECK (Event IN ('CHECKOUT', 'CHECKIN')),
+        Payload TEXT NOT NULL,
+        Logged_at TEXT NOT NULL,
+        Applied INTEGER NOT NULL DEFAULT 0 CHECK (Applied IN (0,1)),
+        Success INTEGER,
+        Message TEXT
+    );
+    """)
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_journal_unapplied ON CIRCULATION_JOURNAL (Applied, Seq);")
+
+    # OFFLINE_TERMINALS - last offline queue entry each terminal has
+    # replayed (offline.py), committed with the replayed events
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS OFFLINE_TERMINALS (
+        Terminal_id TEXT PRIMARY KEY,
+        Last_seq INTEGER NOT NULL,
+        Synced_at TEXT NOT NULL
+    );
+    """)
+
+    # Circulation rollups maintained incrementally by analytics.py
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS ROLLUP_DAILY (
+        Day DATE PRIMARY KEY,
+        Checkouts INTEGER NOT NULL DEFAULT 0,
+        Returns INTEGER NOT NULL DEFAULT 0,
+        Loan_days REAL NOT NULL DEFAULT 0,
+        Overdue_returns INTEGER NOT NULL DEFAULT 0
+    );
+    """)
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS ROLLUP_ISBN_DAILY (
+        Day DATE NOT NULL,
+        Isbn TEXT NOT NULL,
+        Checkouts INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (Day, Isbn)
+    );
+    """)
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS ROLLUP_AUTHOR_DAILY (
+        Day DATE NOT NULL,
+        Author_id INTEGER NOT NULL,
+        Checkouts INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (Day, Author_id)
+    );
+    """)
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS ROLLUP_BORROWER_DAILY (
+        Day DATE NOT NULL,
+        Card_id TEXT NOT NULL,
+        Checkouts INTEGER NOT NULL DEFAULT 0,
+        Overdue_returns INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (Day, Card_id)
+    );
+    """)
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS ROLLUP_PENDING_RETURNS (
+        Loan_id INTEGER PRIMARY KEY
+    );
+    """)
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS ROLLUP_WATERMARK (
+        Name TEXT PRIMARY KEY,
+        Value INTEGER NOT NULL
+    );
+    """)
+
+    # HOLDS - hold queue per book, served in Queued_at order (see holds.py)
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS HOLDS (
+        Hold_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        Isbn TEXT NOT NULL,
+        Card_id TEXT NOT NULL,
+        Queued_at TEXT NOT NULL,
+        Status TEXT NOT NULL CHECK (Status IN ('WAITING', 'READY', 'FULFILLED', 'EXPIRED', 'CANCELLED')),
+        Ready_at DATE,
+        Expires_at DATE,
+        FOREIGN KEY (Isbn) REFERENCES BOOK(Isbn),
+        FOREIGN KEY (Card_id) REFERENCES BORROWER(Card_id)
+    );
+    """)
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_holds_queue ON HOLDS (Isbn, Queued_at) WHERE Status = 'WAITING';")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_holds_ready ON HOLDS (Isbn) WHERE Status = 'READY';")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_holds_expiry ON HOLDS (Expires_at) WHERE Status = 'READY';")
+    cur.execute("""
+    CREATE UNIQUE INDEX IF NOT EXISTS idx_holds_one_active
+    ON HOLDS (Isbn, Card_id) WHERE Status IN ('WAITING', 'READY');
+    """)
+
+    # NOTICE_WATERMARK - fingerprint of the last overdue notice sent to each
+    # borrower, so notices.py only re-issues notices that changed
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS NOTICE_WATERMARK (
+        Card_id TEXT PRIMARY KEY,
+        Content_hash TEXT NOT NULL,
+        Notice_date DATE NOT NULL,
+        FOREIGN KEY (Card_id) REFERENCES BORROWER(Card_id)
+    );
+    """)
+
+    # CATALOG_HASHES / CATALOG_FILES - content hash of every catalog row and
+    # of each CSV file last synced, so catalog_sync.py only applies changes
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS CATALOG_HASHES (
+        Tbl TEXT NOT NULL,
+        Row_key TEXT NOT NULL,
+        Content_hash BLOB NOT NULL,
+        PRIMARY KEY (Tbl, Row_key)
+    ) WITHOUT ROWID;
+    """)
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS CATALOG_FILES (
+        Tbl TEXT PRIMARY KEY,
+        File_hash TEXT NOT NULL,
+        Synced_at TEXT NOT NULL
+    );
+    """)
+
+    # FUZZY_TITLES / FUZZY_AUTHORS - trigram indexes over titles and author
+    # names for typo-tolerant search (fuzzy.py), derived from BOOK and AUTHORS.
+    # FUZZY_GRAMS holds each trigram's document count ('T' titles, 'A' authors)
+    # so the rarest trigrams of a search term can be picked with key lookups.
+    cur.execute("""
+    CREATE VIRTUAL TABLE IF NOT EXISTS FUZZY_TITLES
+    USING fts5(Isbn UNINDEXED, Title, tokenize = 'trigram', detail = 'none');
+    """)
+    cur.execute("""
+    CREATE VIRTUAL TABLE IF NOT EXISTS FUZZY_AUTHORS
+    USING fts5(Name, tokenize = 'trigram', detail = 'none');
+    """)
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS FUZZY_GRAMS (
+        Kind TEXT NOT NULL CHECK (Kind IN ('T', 'A')),
+        Gram TEXT NOT NULL,
+        Docs INTEGER NOT NULL,
+        PRIMARY KEY (Kind, Gram)
+    ) WITHOUT ROWID;
+    """)
+
     conn.commit()
 
 
-def load_csv(conn, csv_file, table, col_map):
+def migrate_schema(conn):
+    """
+    Alter tables created by older versions before create_tables() runs.
+    
+    - BOOK_LOANS gains the Copy_id column.
+    - ACTIVE_LOANS used to be keyed by Isbn; it only holds derived data,
+      so it is dropped and recreated keyed by Copy_id.
+    """
     cur = conn.cursor()
-    with open(csv_file, newline='', encoding='utf-8') as f:
-        reader = csv.DictReader(f)
-        for row in reader:
-            csv_cols = list(col_map.keys())
-            table_cols = list(col_map.values())
-            
-            values = [row[col] for col in csv_cols]
-            placeholders = ",".join(["?"] * len(table_cols))
-            
-            sql = f"INSERT INTO {table} ({','.join(table_cols)}) VALUES ({placeholders})"
-            cur.execute(sql, values)
+    
+    cur.execute("PRAGMA table_info(BOOK_LOANS)")
+    loan_columns = [row[1] for row in cur.fetchall()]
+    if loan_columns and 'Copy_id' not in loan_columns:
+        cur.execute("ALTER TABLE BOOK_LOANS ADD COLUMN Copy_id INTEGER REFERENCES BOOK_COPIES(Copy_id)")
+    
+    cur.execute("PRAGMA table_info(ACTIVE_LOANS)")
+    active_columns = [row[1] for row in cur.fetchall()]
+    if active_columns and 'Copy_id' not in active_columns:
+        cur.execute("DROP TABLE ACTIVE_LOANS")
+    
     conn.commit()
 
 
-def main():
-    if Path(DB_PATH).exists():
-        Path(DB_PATH).unlink()
+def rebuild_active_loans(conn):
+    """
+    Rebuild ACTIVE_LOANS from the open rows (Date_in IS NULL) in BOOK_LOANS.
+    
+    Used when upgrading a database created before ACTIVE_LOANS existed.
+    Loans recorded before copies existed are assigned to the title's first
+    copy. If BOOK_LOANS somehow holds more than one open loan for a copy,
+    the oldest one is kept.
+    """
+    cur = conn.cursor()
+    cur.execute("""
+        UPDATE BOOK_LOANS
+        SET Copy_id = (SELECT MIN(c.Copy_id) FROM BOOK_COPIES c WHERE c.Isbn = BOOK_LOANS.Isbn)
+        WHERE Copy_id IS NULL
+    """)
+    cur.execute("DELETE FROM ACTIVE_LOANS")
+    cur.execute("""
+        INSERT OR IGNORE INTO ACTIVE_LOANS (Copy_id, Loan_id, Isbn, Card_id)
+        SELECT Copy_id, Loan_id, Isbn, Card_id
+        FROM BOOK_LOANS
+        WHERE Date_in IS NULL AND Copy_id IS NOT NULL
+        ORDER BY Loan_id
+    """)
+    conn.commit()
+
 
+def upgrade():
+    """
+    Bring an existing library.db up to the current schema without
+    deleting any data, and rebuild derived tables.
+    """
     conn = sqlite3.connect(DB_PATH)
-
+    migrate_schema(conn)
     create_tables(conn)
+    copies.create_default_copies(conn)
+    rebuild_active_loans(conn)
+    copies.rebuild_availability(conn)
+    standing.rebuild_standing(conn)
+    loans.rebuild_popularity(conn)
+    fuzzy.rebuild_fuzzy_index(conn)
+    borrowers.seed_card_id_sequence(conn.cursor())
+    conn.commit()
+    conn.close()
+
+
+def main(force=False):
+    """
+    Rebuild library.db from the CSV files, backing up the old database first.
+
+    Args:
+        force (bool): If the backup fails (e.g. the old database is corrupt),
+                      rename the old file aside instead of giving up
+    """
+    replaced = Path(DB_PATH).exists()
+    if replaced:
+        # Keep a copy of the database being replaced
+        success, message, stats = backup.backup()
+        print(message)
+        if success:
+            Path(DB_PATH).unlink()
+        elif force:
+            aside = Path(f"{DB_PATH}.{datetime.now().strftime('%Y%m%d-%H%M%S')}.old")
+            Path(DB_PATH).rename(aside)
+            print(f"Old database moved to {aside}.")
+        else:
+            print("Database not replaced. Run with --force to move it aside and re-initialise anyway.")
+            sys.exit(1)
+
+    conn = sqlite3.connect(DB_PATH)
 
-    load_csv(conn, "book.csv", "BOOK", {"ISBN13": "Isbn", "Title": "Title"})
-    load_csv(conn, "authors.csv", "AUTHORS", {"Author_id": "Author_id", "Author": "Name"})
-    load_csv(conn, "book_authors.csv", "BOOK_AUTHORS", {"ISBN13": "Isbn", "Author_id": "Author_id"})
-    load_csv(conn, "borrower.csv", "BORROWER", {
-        "Card_id": "Card_id", 
-        "Bname": "Bname", 
-        "Address": "Address", 
-        "Phone": "Phone", 
-        "Ssn": "Ssn"
-    })
+    try:
+        create_tables(conn)
+        # book.csv, authors.csv, book_authors.csv and borrower.csv, parsed in parallel
+        ingest.ingest(conn, ingest.CATALOG_SOURCES)
+        copies.create_default_copies(conn)
+        copies.rebuild_availability(conn)
+        fuzzy.rebuild_fuzzy_index(conn)
+        borrowers.seed_card_id_sequence(conn.cursor())
+        conn.commit()
+    except (OSError, ingest.IngestError) as e:
+        message = f"Error: {str(e)}"
+    except sqlite3.Error as e:
+        # e.g. duplicate keys in the CSV files
+        message = f"Database error: {str(e)}"
+    else:
+        conn.close()
+        return
 
+    # Leave no half-built database behind for the application to open
     conn.close()
+    for path in (DB_PATH, f"{DB_PATH}-journal", f"{DB_PATH}-wal", f"{DB_PATH}-shm"):
+        Path(path).unlink(missing_ok=True)
+    print(message)
+    if replaced:
+        print("Database not created; the previous one was kept as reported above.")
+    sys.exit(1)
 
 
 if __name__ == "__main__":
-    main()
+    if "--upgrade" in sys.argv[1:]:
+        upgrade()
+    else:
+        main(force="--force" in sys.argv[1:])
@@ -0,0 +1,319 @@
+import sqlite3
+import json
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from datetime import date, datetime
+from config import DB_PATH
+import loans
+import metrics
+
+GROUP_SIZE = 64           # commit after this many events...
+GROUP_DELAY_MS = 20       # ...or after the first event has waited this long
+
+
+class CirculationJournal:
+    """
+    Group-commit writer for checkouts and check-ins.
+
+    Callers submit events from any thread and get back a Future. A single
+    writer thread collects up to GROUP_SIZE events (or whatever arrives
+    within GROUP_DELAY_MS), and for each one appends a row to the
+    append-only CIRCULATION_JOURNAL table and applies it to BOOK_LOANS
+    inside a savepoint. The whole group is committed at once, so N events
+    share one fsync. A Future is only resolved after that commit, so a
+    result in hand means the event is durable.
+    """
+
+    def __init__(self, db_path=None, group_size=GROUP_SIZE, group_delay_ms=GROUP_DELAY_MS):
+        self.db_path = db_path or DB_PATH
+        self.group_size = group_size
+        self.group_delay = group_delay_ms / 1000
+        self.events = queue.Queue()
+        self.writer = None
+        self.stopping = threading.Event()
+
+    def start(self):
+        """Start the writer thread (recovering any unapplied journal entries first)"""
+        if self.writer and self.writer.is_alive():
+            return self
+        recover(self.db_path)
+        self.stopping.clear()
+        self.writer = threading.Thread(target=self.run, name="circulation-journal", daemon=True)
+        self.writer.start()
+        return self
+
+    def stop(self):
+        """Flush queued events and stop the writer thread"""
+        self.stopping.set()
+        if self.writer:
+            self.writer.join()
+
+    def submit_checkout(self, isbn, card_id, override=False):
+        """Queue a checkout. Returns a Future resolving to (success, message)."""
+        return self.submit('CHECKOUT', {'isbn': isbn, 'card_id': card_id, 'override': bool(override),
+                                        'date': date.today().isoformat()})
+
+    def submit_checkin(self, loan_ids):
+        """Queue a check-in. Returns a Future resolving to (success, message)."""
+        return self.submit('CHECKIN', {'loan_ids': [int(loan_id) for loan_id in loan_ids],
+                                       'date': date.today().isoformat()})
+
+    def submit(self, event, payload):
+        if self.stopping.is_set() or not (self.writer and self.writer.is_alive()):
+            raise RuntimeError("Circulation journal is not running.")
+        future = Future()
+        self.events.put((event, payload, future))
+        return future
+
+    @metrics.timed("library_checkout_seconds")
+    def checkout(self, isbn, card_id, override=False):
+        """Blocking checkout with the same signature and result as loans.checkout"""
+        return self.submit_checkout(isbn, card_id, override).result()
+
+    def checkin(self, loan_ids):
+        """Blocking check-in with the same signature and result as loans.checkin"""
+        if not loan_ids:
+            return False, "Error: No loan IDs provided."
+        if len(loan_ids) > 3:
+            return False, "Error: Cannot check in more than 3 books at once."
+        loan_ids, error = loans.parse_loan_ids(loan_ids)
+        if error:
+            return False, error
+        return self.submit_checkin(loan_ids).result()
+
+    def batch_checkin(self, items):
+        """Blocking book-drop check-in with the same signature and result as loans.batch_checkin"""
+        if not items:
+            return False, "Error: No loan IDs or ISBNs provided.", []
+        return self.submit('CHECKIN', {'items': list(items), 'date': date.today().isoformat()}).result()
+
+    def next_group(self):
+        """Wait for the first event, then collect more until the group is full or the delay expires"""
+        try:
+            first = self.events.get(timeout=0.1)
+        except queue.Empty:
+            return []
+        group = [first]
+        deadline = time.monotonic() + self.group_delay
+        while len(group) < self.group_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                group.append(self.events.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return group
+
+    def run(self):
+        conn = sqlite3.connect(self.db_path, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode = WAL")
+        try:
+            while not (self.stopping.is_set() and self.events.empty()):
+                group = self.next_group()
+                if group:
+                    self.commit_group(conn, group)
+        finally:
+            conn.close()
+
+    def commit_group(self, conn, group):
+        """Append and apply a group of events in one transaction, then acknowledge them"""
+        cur = conn.cursor()
+        results = []
+        try:
+            cur.execute("BEGIN IMMEDIATE")
+            for event, payload, future in group:
+                try:
+                    seq = append_entry(cur, event, payload)
+                except (TypeError, ValueError) as e:
+                    # Payload cannot be logged; nothing was written for it
+                    results.append((future, event, [], (False, f"Error: Invalid {event} event: {e!r}")))
+                    continue
+                outcomes = []
+                result = apply_entry(cur, seq, event, payload, outcomes)
+                results.append((future, event, outcomes, result + (outcomes,) if 'items' in payload else result))
+            cur.execute("COMMIT")
+        except Exception as e:
+            # The commit (or the connection) failed: nothing in the group is
+            # durable. Any exception is caught so the writer thread survives
+            # and no caller is left waiting on its Future.
+            try:
+                if conn.in_transaction:
+                    cur.execute("ROLLBACK")
+            except sqlite3.Error:
+                pass
+            error = f"Database error: {str(e)}" if isinstance(e, sqlite3.Error) else f"Error: {e!r}"
+            for event, payload, future in group:
+                if event == 'CHECKOUT':
+                    metrics.inc("library_checkouts_failed_total", labels=("database_error",))
+                future.set_result((False, error, []) if 'items' in payload else (False, error))
+            return
+
+        for future, event, outcomes, result in results:
+            loans.count_committed(event, result[0], outcomes)
+            future.set_result(result)
+
+
+def append_entry(cur, event, payload):
+    """Append an unapplied event to CIRCULATION_JOURNAL and return its sequence number"""
+    cur.execute("""
+        INSERT INTO CIRCULATION_JOURNAL (Event, Payload, Logged_at)
+        VALUES (?, ?, ?)
+    """, (event, json.dumps(payload), datetime.now().isoformat(timespec='seconds')))
+    return cur.lastrowid
+
+
+def apply_entry(cur, seq, event, payload, outcomes=None):
+    """
+    Apply one journal entry inside a savepoint and record its outcome.
+
+    Must run inside an explicit transaction on a connection opened with
+    isolation_level=None. A CHECKIN payload carries either loan_ids (the
+    desk's 1-3 loans) or items (a book drop: any number of loan IDs and
+    ISBNs, see loans.batch_checkin). The per-loan outcomes of a check-in
+    are appended to `outcomes` if a list is given, for the book drop's
+    results and for loans.count_committed() once the caller has committed.
+
+    Returns:
+        tuple: (success: bool, message: str)
+    """
+    cur.execute("SAVEPOINT journal_event")
+    kept = len(outcomes) if outcomes is not None else 0
+    try:
+        # Events carry the date they happened, so replays keep the original dates
+        event_date = date.fromisoformat(payload['date']) if payload.get('date') else None
+        if event == 'CHECKOUT':
+            success, message = loans.checkout_in_transaction(
+                cur, payload['isbn'], payload['card_id'], payload.get('override', False), event_date)
+            if not success:
+                cur.execute("ROLLBACK TO journal_event")
+        elif event == 'CHECKIN' and 'items' in payload:
+            batch = loans.batch_checkin_in_transaction(cur, payload['items'], event_date)
+            success, message = loans.summarize_batch(batch)
+            if outcomes is not None:
+                outcomes.extend(batch)
+        elif event == 'CHECKIN':
+            # Partial check-ins keep the loans that succeeded, as loans.checkin does
+            success, message = loans.checkin_in_transaction(cur, payload['loan_ids'], event_date, outcomes)
+        else:
+            success, message = False, f"Error: Unknown journal event '{event}'."
+    except Exception as e:
+        # A bad event (malformed payload, failed statement) fails on its own;
+        # the rest of its group still commits
+        cur.execute("ROLLBACK TO journal_event")
+        if outcomes is not None:
+            del outcomes[kept:]
+        if isinstance(e, sqlite3.Error):
+            success, message = False, f"Database error: {str(e)}"
+        else:
+            success, message = False, f"Error: Invalid {event} event: {e!r}"
+    cur.execute("RELEASE journal_event")
+
+    cur.execute("""
+        UPDATE CIRCULATION_JOURNAL
+        SET Applied = 1, Success = ?, Message = ?
+        WHERE Seq = ?
+    """, (int(success), message, seq))
+    return success, message
+
+
+def recover(db_path=None):
+    """
+    Apply journal entries that were logged but never applied, in sequence order.
+
+    CirculationJournal appends and applies each entry in the same
+    transaction, so this only finds work when entries were appended on
+    their own with append_entry() (for example by another tool that
+    queues events for the desk to apply).
+
+    Returns:
+        int: Number of entries applied
+    """
+    conn = sqlite3.connect(db_path or DB_PATH, isolation_level=None)
+    conn.row_factory = sqlite3.Row
+    cur = conn.cursor()
+
+    cur.execute("BEGIN IMMEDIATE")
+    cur.execute("SELECT Seq, Event, Payload FROM CIRCULATION_JOURNAL WHERE Applied = 0 ORDER BY Seq")
+    pending = cur.fetchall()
+    applied = []
+    for entry in pending:
+        outcomes = []
+        success, message = apply_entry(cur, entry['Seq'], entry['Event'], json.loads(entry['Payload']), outcomes)
+        applied.append((entry['Event'], success, outcomes))
+    cur.execute("COMMIT")
+    for event, success, outcomes in applied:
+        loans.count_committed(event, success, outcomes)
+
+    conn.close()
+    return len(pending)
+
+
+def replay(source_db, target_db, after_seq=0):
+    """
+    Re-apply journal entries from one database onto another.
+
+    Used after restoring an older copy of library.db: replaying the
+    journal of the newer file brings the circulation state forward.
+    Entries are applied in sequence order with their original dates and
+    appended to the target's own journal. Pass the last Seq the restored
+    copy already contains as after_seq. Loan IDs in check-in events only
+    line up if all circulation since that point went through the journal.
+
+    Args:
+        source_db (str): Database file whose CIRCULATION_JOURNAL is read
+        target_db (str): Database file the events are applied to
+        after_seq (int): Only replay entries with Seq greater than this
+
+    Returns:
+        tuple: (replayed: int, failed: int, last_seq: int)
+    """
+    source = sqlite3.connect(source_db)
+    source.row_factory = sqlite3.Row
+    target = sqlite3.connect(target_db, isolation_level=None)
+    target.row_factory = sqlite3.Row
+    tcur = target.cursor()
+
+    replayed = 0
+    failed = 0
+    last_seq = after_seq
+
+    entries = source.execute("""
+        SELECT Seq, Event, Payload
+        FROM CIRCULATION_JOURNAL
+        WHERE Seq > ? AND Applied = 1
+        ORDER BY Seq
+    """, (after_seq,))
+
+    # Restored history rather than new circulation, so not counted in metrics
+    tcur.execute("BEGIN IMMEDIATE")
+    for entry in entries:
+        payload = json.loads(entry['Payload'])
+        seq = append_entry(tcur, entry['Event'], payload)
+        success, message = apply_entry(tcur, seq, entry['Event'], payload)
+        if success:
+            replayed += 1
+        else:
+            failed += 1
+        last_seq = entry['Seq']
+    tcur.execute("COMMIT")
+
+    source.close()
+    target.close()
+    return replayed, failed, last_seq
+
+
+_journal = None
+_journal_lock = threading.Lock()
+
+
+def get_journal():
+    """Return the process-wide journal, starting it on first use"""
+    global _journal
+    with _journal_lock:
+        if _journal is None:
+            _journal = CirculationJournal().start()
+        return _journal
@@ -1,8 +1,60 @@
 import sqlite3
 from datetime import datetime, timedelta
+from decimal import Decimal
+import standing
+import holds
+import copies
 import fines
+import closures
+import memprofile
+import metrics
 from config import DB_PATH
 
+ISBN_LOOKUP_BATCH = 500
+
+# Borrower and their standing for the checkout checks (card ID)
+BORROWER_ELIGIBILITY_QUERY = """
+    SELECT
+        br.Card_id,
+        COALESCE(s.Active_loans, 0) as Active_loans,
+        COALESCE(s.Has_unpaid, 0) as Has_unpaid
+    FROM BORROWER br
+    LEFT JOIN BORROWER_STANDING s ON br.Card_id = s.Card_id
+    WHERE br.Card_id = ?
+"""
+
+# Active loans matching by ISBN, card ID, or borrower name (three LIKE parameters, limit, offset)
+LOAN_SEARCH_QUERY = """
+    SELECT 
+        bl.Loan_id,
+        bl.Isbn,
+        b.Title,
+        bl.Card_id,
+        br.Bname,
+        bl.Date_out,
+        bl.Due_date,
+        bl.Date_in
+    FROM ACTIVE_LOANS al
+    JOIN BOOK_LOANS bl ON al.Loan_id = bl.Loan_id
+    JOIN BOOK b ON bl.Isbn = b.Isbn
+    JOIN BORROWER br ON bl.Card_id = br.Card_id
+    WHERE (LOWER(bl.Isbn) LIKE ? 
+           OR LOWER(bl.Card_id) LIKE ?
+           OR LOWER(br.Bname) LIKE ?)
+    ORDER BY bl.Due_date, bl.Loan_id
+    LIMIT ? OFFSET ?
+"""
+
+# Open loans of a batch of ISBNs, earliest due first (format with the IN placeholders)
+OPEN_LOANS_BY_ISBN = """
+    SELECT al.Isbn, al.Loan_id
+    FROM ACTIVE_LOANS al
+    JOIN BOOK_LOANS bl ON al.Loan_id = bl.Loan_id
+    WHERE al.Isbn IN ({placeholders})
+    ORDER BY bl.Due_date, al.Loan_id
+"""
+
+@metrics.timed("library_checkout_seconds")
 def checkout(isbn, card_id, override=False):
     """
     Check out a book for a borrower.
@@ -20,103 +72,170 @@ def checkout(isbn, card_id, override=False):
     cur = conn.cursor()
     
     try:
-        # Check if borrower exists
-        cur.execute("SELECT * FROM BORROWER WHERE Card_id = ?", (card_id,))
-        borrower = cur.fetchone()
-        if not borrower:
-            conn.close()
-            return False, f"Error: Borrower with card ID '{card_id}' not found."
-        
-        # Check if book exists
-        cur.execute("SELECT * FROM BOOK WHERE Isbn = ?", (isbn,))
-        book = cur.fetchone()
-        if not book:
-            conn.close()
-            return False, f"Error: Book with ISBN '{isbn}' not found."
-        
-        # Check if borrower has unpaid fines
-        if not override and fines.has_unpaid_fines(card_id):
-            conn.close()
-            return False, "Error: Borrower has unpaid fines. Cannot checkout books until fines are paid."
-        
-        # Check if borrower already has 3 active loans
-        cur.execute("""
-            SELECT COUNT(*) as count
-            FROM BOOK_LOANS
-            WHERE Card_id = ? AND Date_in IS NULL
-        """, (card_id,))
-        active_loans = cur.fetchone()
-        if not override and active_loans['count'] >= 3:
-            conn.close()
-            return False, f"Error: Borrower already has 3 active loans. Maximum limit reached."
-        
-        # Check if book is already checked out
-        cur.execute("""
-            SELECT COUNT(*) as count
-            FROM BOOK_LOANS
-            WHERE Isbn = ? AND Date_in IS NULL
-        """, (isbn,))
-        book_status = cur.fetchone()
-        if book_status['count'] > 0:
-            conn.close()
-            return False, f"Error: Book with ISBN '{isbn}' is already checked out and not available."
-        
-        # Create new loan
-        date_out = datetime.now().date()
-        due_date = date_out + timedelta(days=14)
-        
-        cur.execute("""
-            INSERT INTO BOOK_LOANS (Isbn, Card_id, Date_out, Due_date)
-            VALUES (?, ?, ?, ?)
-        """, (isbn, card_id, date_out, due_date))
-        
-        conn.commit()
+        success, message = checkout_in_transaction(cur, isbn, card_id, override)
+        if success:
+            conn.commit()
+            count_committed('CHECKOUT', success)
+        else:
+            conn.rollback()
         conn.close()
-        
-        return True, f"Successfully checked out book '{book['Title']}' (ISBN: {isbn}). Due date: {due_date}."
+        return success, message
     
     except sqlite3.Error as e:
         conn.close()
+        metrics.inc("library_checkouts_failed_total", labels=("database_error",))
         return False, f"Database error: {str(e)}"
 
 
-def find_loans_by_search(search_term):
+def count_committed(event, success, outcomes=()):
+    """
+    Count a committed checkout or check-in in the circulation metrics.
+
+    Called by whoever commits, after the COMMIT, so rolled-back work is
+    never counted.
+
+    Args:
+        event (str): 'CHECKOUT' or 'CHECKIN'
+        success (bool): Result of the checkout
+        outcomes (list): Per-loan outcomes of the check-in (see batch_checkin_in_transaction)
+    """
+    if event == 'CHECKOUT':
+        if success:
+            metrics.inc("library_checkouts_total")
+        return
+    checked_in = sum(1 for outcome in outcomes if outcome['Success'])
+    if checked_in:
+        metrics.inc("library_checkins_total", checked_in)
+
+
+def _refused(reason, message):
+    """Count a refused checkout by reason and return its result"""
+    metrics.inc("library_checkouts_failed_total", labels=(reason,))
+    return False, message
+
+
+def checkout_in_transaction(cur, isbn, card_id, override=False, date_out=None):
+    """
+    Checkout logic without commit, for callers that manage their own transaction.
+    
+    On failure the caller must roll back (a failed checkout may have
+    taken a copy before the ACTIVE_LOANS insert was rejected).
+    
+    Args:
+        cur: Cursor (with sqlite3.Row row factory) on the caller's connection
+        isbn (str): ISBN of the book to checkout
+        card_id (str): Borrower card ID
+        override (bool): If True, bypass restrictions (fines, max loans)
+        date_out (date): Checkout date (default: today), used when replaying journals
+    
+    Returns:
+        tuple: (success: bool, message: str)
+    """
+    # Check if borrower exists and read their standing (one key lookup)
+    cur.execute(BORROWER_ELIGIBILITY_QUERY, (card_id,))
+    borrower = cur.fetchone()
+    if not borrower:
+        return _refused("borrower_not_found", f"Error: Borrower with card ID '{card_id}' not found.")
+    
+    # Check if book exists
+    cur.execute("SELECT * FROM BOOK WHERE Isbn = ?", (isbn,))
+    book = cur.fetchone()
+    if not book:
+        return _refused("book_not_found", f"Error: Book with ISBN '{isbn}' not found.")
+    
+    # Check if borrower has unpaid fines
+    if not override and borrower['Has_unpaid']:
+        return _refused("unpaid_fines", "Error: Borrower has unpaid fines. Cannot checkout books until fines are paid.")
+    
+    # Check if borrower already has 3 active loans
+    if not override and borrower['Active_loans'] >= 3:
+        return _refused("loan_limit", f"Error: Borrower already has 3 active loans. Maximum limit reached.")
+    
+    # Check if a copy is free (one read of the maintained counts)
+    total, available = copies.get_availability(cur, isbn)
+    if available <= 0:
+        if total > 1:
+            return _refused("unavailable", f"Error: All {total} copies of book with ISBN '{isbn}' are already checked out.")
+        return _refused("unavailable", f"Error: Book with ISBN '{isbn}' is already checked out and not available.")
+    
+    # Returned copies with a ready hold are kept for the holds' borrowers
+    ready = holds.ready_holds(cur, isbn)
+    ready_hold = next((hold for hold in ready if hold[1] == card_id), None)
+    if not ready_hold and available <= len(ready):
+        return _refused("on_hold", f"Error: Book with ISBN '{isbn}' is on hold for another borrower.")
+    
+    copy_id = copies.acquire_copy(cur, isbn)
+    if copy_id is None:
+        return _refused("unavailable", f"Error: Book with ISBN '{isbn}' is already checked out and not available.")
+    
+    # Create new loan, due on the first open day from two weeks out
+    date_out = date_out or datetime.now().date()
+    due_date = closures.next_open_day(cur, date_out + timedelta(days=14))
+    
+    cur.execute("""
+        INSERT INTO BOOK_LOANS (Isbn, Card_id, Date_out, Due_date, Copy_id)
+        VALUES (?, ?, ?, ?, ?)
+    """, (isbn, card_id, date_out, due_date, copy_id))
+    
+    # Record the open loan; the primary key on Copy_id rejects a second
+    # checkout of the same copy
+    try:
+        cur.execute("""
+            INSERT INTO ACTIVE_LOANS (Copy_id, Loan_id, Isbn, Card_id)
+            VALUES (?, ?, ?, ?)
+        """, (copy_id, cur.lastrowid, isbn, card_id))
+    except sqlite3.IntegrityError:
+        return _refused("unavailable", f"Error: Book with ISBN '{isbn}' is already checked out and not available.")
+    
+    standing.adjust_standing(cur, card_id, loans_delta=1)
+    cur.execute("""
+        INSERT INTO BOOK_POPULARITY (Isbn, Loans) VALUES (?, 1)
+        ON CONFLICT (Isbn) DO UPDATE SET Loans = Loans + 1
+    """, (isbn,))
+    if ready_hold:
+        holds.fulfill_hold(cur, ready_hold[0])
+    
+    return True, f"Successfully checked out book '{book['Title']}' (ISBN: {isbn}). Due date: {due_date}."
+
+
+def rebuild_popularity(conn):
+    """
+    Recompute BOOK_POPULARITY from BOOK_LOANS.
+    
+    Only needed when upgrading or repairing a database; checkout keeps
+    the counts up to date incrementally.
+    """
+    cur = conn.cursor()
+    cur.execute("DELETE FROM BOOK_POPULARITY")
+    cur.execute("""
+        INSERT INTO BOOK_POPULARITY (Isbn, Loans)
+        SELECT Isbn, COUNT(*) FROM BOOK_LOANS GROUP BY Isbn
+    """)
+    conn.commit()
+
+
+@memprofile.profiled("loans.find_loans_by_search")
+def find_loans_by_search(search_term, limit=None, offset=0, db_path=None):
     """
     Find loans by searching on ISBN, card_id, or borrower name (substring matching).
     
     Args:
         search_term (str): Search query (case-insensitive, substring matching)
+        limit (int): Maximum number of loans to return (None for all)
+        offset (int): Number of loans to skip, for paging with limit
+        db_path (str): Database to search (default: config.DB_PATH)
     
     Returns:
         list: List of dictionaries with loan information
     """
-    conn = sqlite3.connect(DB_PATH)
+    conn = sqlite3.connect(db_path or DB_PATH)
     conn.row_factory = sqlite3.Row
     cur = conn.cursor()
     
     search_pattern = f"%{search_term.lower()}%"
     
-    query = """
-    SELECT 
-        bl.Loan_id,
-        bl.Isbn,
-        b.Title,
-        bl.Card_id,
-        br.Bname,
-        bl.Date_out,
-        bl.Due_date,
-        bl.Date_in
-    FROM BOOK_LOANS bl
-    JOIN BOOK b ON bl.Isbn = b.Isbn
-    JOIN BORROWER br ON bl.Card_id = br.Card_id
-    WHERE (LOWER(bl.Isbn) LIKE ? 
-           OR LOWER(bl.Card_id) LIKE ?
-           OR LOWER(br.Bname) LIKE ?)
-      AND bl.Date_in IS NULL
-    ORDER BY bl.Due_date
-    """
-    
-    cur.execute(query, (search_pattern, search_pattern, search_pattern))
+    cur.execute(LOAN_SEARCH_QUERY, (search_pattern, search_pattern, search_pattern,
+                        -1 if limit is None else limit, offset))
     results = cur.fetchall()
     
     loans = []
@@ -136,6 +255,36 @@ def find_loans_by_search(search_term):
     return loans
 
 
+def count_loans_by_search(search_term, db_path=None):
+    """
+    Count the active loans that find_loans_by_search() would return.
+    
+    Args:
+        search_term (str): Search query (case-insensitive, substring matching)
+        db_path (str): Database to search (default: config.DB_PATH)
+    
+    Returns:
+        int: Number of matching active loans
+    """
+    conn = sqlite3.connect(db_path or DB_PATH)
+    cur = conn.cursor()
+    
+    search_pattern = f"%{search_term.lower()}%"
+    
+    cur.execute("""
+        SELECT COUNT(*)
+        FROM ACTIVE_LOANS al
+        JOIN BORROWER br ON al.Card_id = br.Card_id
+        WHERE LOWER(al.Isbn) LIKE ?
+           OR LOWER(al.Card_id) LIKE ?
+           OR LOWER(br.Bname) LIKE ?
+    """, (search_pattern, search_pattern, search_pattern))
+    count = cur.fetchone()[0]
+    
+    conn.close()
+    return count
+
+
 def display_loans(loans):
     """
     Display loan search results in a formatted table.
@@ -164,6 +313,22 @@ def display_loans(loans):
     print()
 
 
+def parse_loan_ids(loan_ids):
+    """
+    Convert loan IDs as entered at the desk to integers.
+
+    Returns:
+        tuple: (loan_ids: list of int, error: str or None)
+    """
+    parsed = []
+    for loan_id in loan_ids:
+        try:
+            parsed.append(int(loan_id))
+        except (TypeError, ValueError):
+            return [], f"Error: '{loan_id}' is not a loan ID."
+    return parsed, None
+
+
 def checkin(loan_ids):
     """
     Check in one or more books by loan IDs.
@@ -180,49 +345,213 @@ def checkin(loan_ids):
     if len(loan_ids) > 3:
         return False, "Error: Cannot check in more than 3 books at once."
     
+    loan_ids, error = parse_loan_ids(loan_ids)
+    if error:
+        return False, error
+    
     conn = sqlite3.connect(DB_PATH)
     conn.row_factory = sqlite3.Row
     cur = conn.cursor()
     
     try:
-        date_in = datetime.now().date()
-        checked_in_count = 0
-        errors = []
-        
-        for loan_id in loan_ids:
-            # Verify loan exists and is still active
-            cur.execute("""
-                SELECT * FROM BOOK_LOANS
-                WHERE Loan_id = ? AND Date_in IS NULL
-            """, (loan_id,))
-            loan = cur.fetchone()
-            
-            if not loan:
-                errors.append(f"Loan ID {loan_id} not found or already checked in.")
-                continue
-            
-            # Update loan with check-in date
-            cur.execute("""
-                UPDATE BOOK_LOANS
-                SET Date_in = ?
-                WHERE Loan_id = ?
-            """, (date_in, loan_id))
-            
-            checked_in_count += 1
-        
+        outcomes = []
+        success, message = checkin_in_transaction(cur, loan_ids, outcomes=outcomes)
         conn.commit()
         conn.close()
-        
-        if errors:
-            return False, f"Errors: {'; '.join(errors)}. Checked in {checked_in_count} book(s)."
-        
-        return True, f"Successfully checked in {checked_in_count} book(s)."
+        count_committed('CHECKIN', success, outcomes)
+        return success, message
     
     except sqlite3.Error as e:
         conn.close()
         return False, f"Database error: {str(e)}"
 
 
+def checkin_in_transaction(cur, loan_ids, date_in=None, outcomes=None):
+    """
+    Check-in logic without commit, for callers that manage their own transaction.
+    
+    Loans that can be checked in are, even if others in the list fail,
+    so the caller should commit in both cases.
+    
+    Args:
+        cur: Cursor (with sqlite3.Row row factory) on the caller's connection
+        loan_ids (list): List of loan IDs to check in
+        date_in (date): Return date (default: today), used when replaying journals
+        outcomes (list): If given, receives the per-loan outcomes (for count_committed)
+    
+    Returns:
+        tuple: (success: bool, message: str)
+    """
+    batch = batch_checkin_in_transaction(cur, [int(loan_id) for loan_id in loan_ids], date_in)
+    if outcomes is not None:
+        outcomes.extend(batch)
+    checked_in_count = sum(1 for outcome in batch if outcome['Success'])
+    errors = [outcome['Message'] for outcome in batch if not outcome['Success']]
+    hold_notes = [f"ISBN {outcome['ISBN']} is on hold for {outcome['Hold']['Card_id']} until {outcome['Hold']['Expires_at']}."
+                  for outcome in batch if outcome['Hold']]
+    
+    holds_text = f" {' '.join(hold_notes)}" if hold_notes else ""
+    
+    if errors:
+        return False, f"Errors: {'; '.join(errors)}. Checked in {checked_in_count} book(s).{holds_text}"
+    
+    return True, f"Successfully checked in {checked_in_count} book(s).{holds_text}"
+
+
+
+def batch_checkin(items, date_in=None):
+    """
+    Check in any number of books in one transaction, e.g. when emptying the book drop.
+    
+    Args:
+        items (list): Loan IDs (int) and/or ISBNs (str). An ISBN checks in
+                      the open loan of that title that is due first; scan
+                      the loan ID instead to pick a specific copy.
+        date_in (date): Return date (default: today)
+    
+    Returns:
+        tuple: (success: bool, message: str, outcomes: list)
+               success is True only if every item was checked in; outcomes
+               has one dict per item, in input order (see batch_checkin_in_transaction)
+    """
+    if not items:
+        return False, "Error: No loan IDs or ISBNs provided.", []
+    
+    conn = sqlite3.connect(DB_PATH)
+    conn.row_factory = sqlite3.Row
+    cur = conn.cursor()
+    
+    try:
+        outcomes = batch_checkin_in_transaction(cur, items, date_in)
+        conn.commit()
+        conn.close()
+        count_committed('CHECKIN', True, outcomes)
+    
+    except sqlite3.Error as e:
+        conn.rollback()
+        conn.close()
+        return False, f"Database error: {str(e)}", []
+    
+    success, message = summarize_batch(outcomes)
+    return success, message, outcomes
+
+
+def summarize_batch(outcomes):
+    """
+    Summarize batch check-in outcomes for the desk.
+
+    Returns:
+        tuple: (success: bool, message: str); success only if every item was checked in
+    """
+    checked_in = sum(1 for outcome in outcomes if outcome['Success'])
+    failed = len(outcomes) - checked_in
+    fined = sum((outcome['Fine'] for outcome in outcomes), Decimal('0.00'))
+    message = f"Checked in {checked_in} book(s); {failed} failed. Fines accrued: ${fined:.2f}."
+    return failed == 0, message
+
+
+def batch_checkin_in_transaction(cur, items, date_in=None):
+    """
+    Set-based check-in without commit, for callers that manage their own transaction.
+    The caller counts the returns with count_committed() once it has committed.
+    
+    ISBNs are resolved to open loans with batched lookups on ACTIVE_LOANS,
+    then all loans are closed with a single UPDATE ... RETURNING over a
+    temporary table of loan IDs. Copies, availability counts and borrower
+    standing are adjusted in bulk, fines are accrued for the returned
+    loans only, and each returned copy is offered to the next hold.
+    
+    Args:
+        cur: Cursor on the caller's connection
+        items (list): Loan IDs (int) and/or ISBNs (str)
+        date_in (date): Return date (default: today)
+    
+    Returns:
+        list: One dict per item with keys Item, Loan_id, ISBN, Card_id,
+              Success, Message, Fine (Decimal) and Hold (dispatched hold or None)
+    """
+    date_in = date_in or datetime.now().date()
+    outcomes = [{'Item': item, 'Loan_id': None, 'ISBN': None, 'Card_id': None, 'Success': False,
+                 'Message': "", 'Fine': Decimal('0.00'), 'Hold': None} for item in items]
+    
+    # Loan IDs given directly
+    claimed = set()
+    for outcome in outcomes:
+        if isinstance(outcome['Item'], int):
+            if outcome['Item'] in claimed:
+                outcome['Message'] = f"Loan ID {outcome['Item']} is listed more than once."
+            else:
+                outcome['Loan_id'] = outcome['Item']
+                claimed.add(outcome['Item'])
+    
+    # ISBNs: each scan takes the open loan of that title due first
+    isbns = list({outcome['Item'] for outcome in outcomes if not isinstance(outcome['Item'], int)})
+    open_loans = {}
+    for start in range(0, len(isbns), ISBN_LOOKUP_BATCH):
+        batch = isbns[start:start + ISBN_LOOKUP_BATCH]
+        placeholders = ",".join(["?"] * len(batch))
+        cur.execute(OPEN_LOANS_BY_ISBN.format(placeholders=placeholders), batch)
+        for row in cur.fetchall():
+            if row[1] not in claimed:
+                open_loans.setdefault(row[0], []).append(row[1])
+    for outcome in outcomes:
+        if isinstance(outcome['Item'], int):
+            continue
+        candidates = open_loans.get(outcome['Item'])
+        if candidates:
+            outcome['Loan_id'] = candidates.pop(0)
+            claimed.add(outcome['Loan_id'])
+        else:
+            outcome['Message'] = f"ISBN {outcome['Item']} has no open loan to check in."
+    
+    cur.execute("CREATE TEMP TABLE IF NOT EXISTS CHECKIN_BATCH (Loan_id INTEGER PRIMARY KEY)")
+    cur.execute("DELETE FROM CHECKIN_BATCH")
+    cur.executemany("INSERT INTO CHECKIN_BATCH (Loan_id) VALUES (?)", [(loan_id,) for loan_id in claimed])
+    
+    cur.execute("""
+        UPDATE BOOK_LOANS
+        SET Date_in = ?
+        WHERE Loan_id IN (SELECT Loan_id FROM CHECKIN_BATCH) AND Date_in IS NULL
+        RETURNING Loan_id, Isbn, Card_id, Copy_id, Due_date, Date_in
+    """, (date_in,))
+    returned = {row[0]: {'Loan_id': row[0], 'Isbn': row[1], 'Card_id': row[2], 'Copy_id': row[3],
+                         'Due_date': row[4], 'Date_in': row[5]}
+                for row in cur.fetchall()}
+    
+    cur.execute("DELETE FROM ACTIVE_LOANS WHERE Loan_id IN (SELECT Loan_id FROM CHECKIN_BATCH)")
+    cur.execute("DELETE FROM CHECKIN_BATCH")
+    copies.release_copies(cur, [(loan['Copy_id'], loan['Isbn']) for loan in returned.values()])
+    
+    loans_by_card = {}
+    for loan in returned.values():
+        loans_by_card[loan['Card_id']] = loans_by_card.get(loan['Card_id'], 0) + 1
+    for card_id, count in loans_by_card.items():
+        standing.adjust_standing(cur, card_id, loans_delta=-count)
+    
+    accrued = fines.accrue_fines(cur, returned.values())
+    
+    for outcome in outcomes:
+        loan = returned.get(outcome['Loan_id'])
+        if not loan:
+            if outcome['Loan_id'] is not None:
+                outcome['Message'] = f"Loan ID {outcome['Loan_id']} not found or already checked in."
+            continue
+        outcome['ISBN'] = loan['Isbn']
+        outcome['Card_id'] = loan['Card_id']
+        outcome['Success'] = True
+        outcome['Fine'] = accrued.get(loan['Loan_id'], Decimal('0.00'))
+        outcome['Message'] = f"Checked in loan {loan['Loan_id']}."
+        if outcome['Fine']:
+            outcome['Message'] += f" Fine: ${outcome['Fine']:.2f}."
+        
+        # Hand the copy to the next borrower waiting for the title
+        outcome['Hold'] = holds.dispatch_next_hold(cur, loan['Isbn'], date_in)
+        if outcome['Hold']:
+            outcome['Message'] += f" On hold for {outcome['Hold']['Card_id']}."
+    
+    return outcomes
+
+
 if __name__ == "__main__":
     # Test checkout
     success, message = checkout("9780195153445", "ID000001")
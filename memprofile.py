@@ -0,0 +1,152 @@
+import functools
+import threading
+import tracemalloc
+from contextlib import contextmanager
+from config import MEMORY_PROFILING
+
+TRACE_FRAMES = 1    # stack depth recorded per allocation; sites are reported by line
+TOP_SITES = 10      # allocation sites kept per operation
+
+# The profiler's own allocations are not part of any operation
+_own_frames = (
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, __file__),
+)
+
+_lock = threading.Lock()
+_stats = {}                    # operation name -> dict, see get_stats()
+_local = threading.local()     # per-thread stack of operations being tracked
+
+
+def enable(frames=TRACE_FRAMES):
+    """Start tracing allocations (tracking is a no-op until this is called)"""
+    if not tracemalloc.is_tracing():
+        tracemalloc.start(frames)
+
+
+def disable():
+    """Stop tracing allocations; collected statistics are kept"""
+    if tracemalloc.is_tracing():
+        tracemalloc.stop()
+
+
+def is_enabled():
+    return tracemalloc.is_tracing()
+
+
+def reset():
+    """Forget all collected statistics"""
+    with _lock:
+        _stats.clear()
+
+
+@contextmanager
+def track(operation):
+    """
+    Record allocations made while the block runs under the given operation name.
+
+    Takes a tracemalloc snapshot before and after and keeps the peak
+    traced memory, the net change, and the top allocation sites by size.
+    Nested tracking (e.g. a search run while a table renders) works: the
+    outer operation's peak includes the inner one. The peak is process-wide,
+    so work on other threads at the same time is counted too.
+    """
+    if not tracemalloc.is_tracing():
+        yield
+        return
+
+    stack = getattr(_local, 'stack', None)
+    if stack is None:
+        stack = _local.stack = []
+    if stack:
+        # Keep the outer operation's peak before reset_peak() clears it
+        stack[-1]['peak'] = max(stack[-1]['peak'], tracemalloc.get_traced_memory()[1])
+
+    before = tracemalloc.take_snapshot().filter_traces(_own_frames)
+    start_current = tracemalloc.get_traced_memory()[0]
+    tracemalloc.reset_peak()
+    frame = {'peak': 0}
+    stack.append(frame)
+    try:
+        yield
+    finally:
+        stack.pop()
+        current, peak = tracemalloc.get_traced_memory()
+        peak = max(peak, frame['peak'])
+        after = tracemalloc.take_snapshot().filter_traces(_own_frames)
+        if stack:
+            stack[-1]['peak'] = max(stack[-1]['peak'], peak)
+        _record(operation, peak - start_current, current - start_current, after.compare_to(before, 'lineno'))
+
+
+def profiled(operation):
+    """Decorator form of track()"""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not tracemalloc.is_tracing():
+                return func(*args, **kwargs)
+            with track(operation):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def _record(operation, peak, net, differences):
+    top = [
+        {'Site': str(diff.traceback[0]), 'Size': diff.size_diff, 'Count': diff.count_diff}
+        for diff in sorted(differences, key=lambda d: d.size_diff, reverse=True)[:TOP_SITES]
+        if diff.size_diff > 0
+    ]
+    with _lock:
+        entry = _stats.setdefault(operation, {'Operation': operation, 'Calls': 0, 'Last_peak': 0,
+                                              'Max_peak': 0, 'Last_net': 0, 'Top_sites': []})
+        entry['Calls'] += 1
+        entry['Last_peak'] = peak
+        entry['Last_net'] = net
+        if peak >= entry['Max_peak']:
+            # Keep the allocation sites of the worst call seen
+            entry['Max_peak'] = peak
+            entry['Top_sites'] = top
+
+
+def get_stats():
+    """
+    Return the collected statistics, largest peak first.
+
+    Returns:
+        list: Dictionaries with keys Operation, Calls, Last_peak, Max_peak,
+              Last_net (bytes) and Top_sites (list of dicts with Site, Size, Count
+              for the call with the largest peak)
+    """
+    with _lock:
+        entries = [dict(entry, Top_sites=list(entry['Top_sites'])) for entry in _stats.values()]
+    return sorted(entries, key=lambda entry: entry['Max_peak'], reverse=True)
+
+
+def _format_bytes(size):
+    for unit in ("B", "KB", "MB"):
+        if abs(size) < 1024:
+            return f"{size:.0f} {unit}" if unit == "B" else f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.1f} GB"
+
+
+def format_report():
+    """Return the collected statistics as plain text"""
+    if not is_enabled() and not _stats:
+        return "Memory profiling is off. Enable it to start collecting.\n"
+
+    current, peak = tracemalloc.get_traced_memory() if is_enabled() else (0, 0)
+    lines = [f"Traced memory: {_format_bytes(current)} now, {_format_bytes(peak)} peak since last operation", ""]
+    for entry in get_stats():
+        lines.append(f"{entry['Operation']}: {entry['Calls']} call(s), peak {_format_bytes(entry['Max_peak'])} "
+                     f"(last {_format_bytes(entry['Last_peak'])}), last net {_format_bytes(entry['Last_net'])}")
+        for site in entry['Top_sites']:
+            lines.append(f"    {_format_bytes(site['Size']):>10} {site['Count']:>8} blocks  {site['Site']}")
+        lines.append("")
+    return "\n".join(lines) + "\n"
+
+
+if MEMORY_PROFILING:
+    enable()
@@ -0,0 +1,216 @@
+import bisect
+import functools
+import os
+import sqlite3
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from config import DB_PATH, METRICS_PORT, METRICS_FILE, METRICS_FILE_INTERVAL
+
+# Latency histogram bucket upper bounds, in seconds
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Every metric: name -> (type, help text, label names)
+METRICS = {
+    "library_checkouts_total": ("counter", "Books checked out.", ()),
+    "library_checkins_total": ("counter", "Books checked in.", ()),
+    "library_checkouts_failed_total": ("counter", "Checkouts refused or failed, by reason.", ("reason",)),
+    "library_fines_paid_total": ("counter", "Borrower fine payments.", ()),
+    "library_fines_paid_dollars_total": ("counter", "Dollars of fines paid.", ()),
+    "library_search_seconds": ("histogram", "Book search latency.", ("kind",)),
+    "library_checkout_seconds": ("histogram", "Checkout latency, including the commit.", ()),
+    "library_active_loans": ("gauge", "Books currently checked out.", ()),
+    "library_unpaid_fines_dollars": ("gauge", "Outstanding unpaid fines.", ()),
+}
+
+# Gauges are read from the maintained tables when metrics are exported, so
+# the hot paths never pay for them
+GAUGE_QUERIES = {
+    "library_active_loans": "SELECT COUNT(*) FROM ACTIVE_LOANS",
+    "library_unpaid_fines_dollars": "SELECT COALESCE(SUM(Unpaid_total), 0) FROM BORROWER_STANDING",
+}
+
+_lock = threading.Lock()
+_counters = {}     # (name, label values) -> value
+_histograms = {}   # (name, label values) -> [bucket counts..., +Inf count, sum]
+
+
+def inc(name, amount=1, labels=()):
+    """Add to a counter; labels are values for the metric's label names, in order"""
+    key = (name, labels)
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + amount
+
+
+def observe(name, seconds, labels=()):
+    """Record one latency in a histogram"""
+    key = (name, labels)
+    slot = bisect.bisect_left(LATENCY_BUCKETS, seconds)
+    with _lock:
+        buckets = _histograms.get(key)
+        if buckets is None:
+            buckets = _histograms[key] = [0] * (len(LATENCY_BUCKETS) + 1) + [0.0]
+        buckets[slot] += 1
+        buckets[-1] += seconds
+
+
+def timed(name, labels=()):
+    """Decorator recording the call's latency in a histogram"""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                observe(name, time.perf_counter() - start, labels)
+        return wrapper
+    return decorator
+
+
+def reset():
+    """Forget all recorded counters and histograms"""
+    with _lock:
+        _counters.clear()
+        _histograms.clear()
+
+
+def read_gauges(db_path=None):
+    """Return {gauge name: value}, or {} if the database cannot be read"""
+    path = db_path or DB_PATH
+    if not os.path.exists(path):
+        return {}
+    try:
+        conn = sqlite3.connect(path)
+        cur = conn.cursor()
+        gauges = {}
+        for name, sql in GAUGE_QUERIES.items():
+            cur.execute(sql)
+            gauges[name] = cur.fetchone()[0]
+        conn.close()
+    except sqlite3.Error:
+        return {}
+    return gauges
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(names, values, extra=""):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def format_text(db_path=None):
+    """
+    Return all metrics in the Prometheus text exposition format (version 0.0.4).
+
+    Counters and histograms are those recorded by this process since it
+    started; gauges are read from the database now.
+    """
+    with _lock:
+        counters = dict(_counters)
+        histograms = {key: list(buckets) for key, buckets in _histograms.items()}
+    gauges = read_gauges(db_path)
+
+    lines = []
+    for name, (kind, help_text, label_names) in METRICS.items():
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        if kind == "counter":
+            series = sorted((labels, value) for (metric, labels), value in counters.items() if metric == name)
+            if not series and not label_names:
+                series = [((), 0)]
+            for labels, value in series:
+                lines.append(f"{name}{_labels(label_names, labels)} {_number(value)}")
+        elif kind == "histogram":
+            for (metric, labels), buckets in sorted(histograms.items()):
+                if metric != name:
+                    continue
+                cumulative = 0
+                for bound, count in zip(LATENCY_BUCKETS + ("+Inf",), buckets):
+                    cumulative += count
+                    le = f'le="{bound}"'
+                    lines.append(f"{name}_bucket{_labels(label_names, labels, le)} {cumulative}")
+                lines.append(f"{name}_sum{_labels(label_names, labels)} {_number(buckets[-1])}")
+                lines.append(f"{name}_count{_labels(label_names, labels)} {cumulative}")
+        elif name in gauges:
+            lines.append(f"{name} {_number(gauges[name])}")
+    return "\n".join(lines) + "\n"
+
+
+def write_file(path=None, db_path=None):
+    """Write the metrics to a file atomically, e.g. for node_exporter's textfile collector"""
+    path = path or METRICS_FILE
+    tmp = f"{path}.tmp"
+    with open(tmp, "w") as f:
+        f.write(format_text(db_path))
+    os.replace(tmp, path)
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = format_text().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # Scrapes every few seconds would flood the console
+        pass
+
+
+def serve(port=None, host="127.0.0.1"):
+    """
+    Serve /metrics over HTTP from a daemon thread.
+
+    Returns:
+        ThreadingHTTPServer: The running server (call shutdown() to stop it)
+    """
+    server = ThreadingHTTPServer((host, port or METRICS_PORT), _MetricsHandler)
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    return server
+
+
+def start_file_writer(path=None, interval=None):
+    """Rewrite the metrics file every interval seconds from a daemon thread"""
+    interval = interval or METRICS_FILE_INTERVAL
+
+    def run():
+        while True:
+            try:
+                write_file(path)
+            except OSError as e:
+                print(f"Metrics file not written: {e}")
+            time.sleep(interval)
+
+    thread = threading.Thread(target=run, name="metrics-file", daemon=True)
+    thread.start()
+    return thread
+
+
+def start_exporters():
+    """Start whichever exporters are configured (METRICS_PORT, METRICS_FILE)"""
+    if METRICS_PORT:
+        serve(METRICS_PORT)
+    if METRICS_FILE:
+        start_file_writer(METRICS_FILE)
+
+
+if __name__ == "__main__":
+    # Usage: python metrics.py -- prints the gauges (counters only exist
+    # inside a running terminal; scrape that via METRICS_PORT or METRICS_FILE)
+    sys.stdout.write(format_text())
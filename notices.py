@@ -0,0 +1,163 @@
+import sqlite3
+import hashlib
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+from decimal import Decimal
+from itertools import groupby
+from pathlib import Path
+from config import BASE_DIR, DB_PATH
+import fines
+import closures
+
+NOTICE_DIR = BASE_DIR / "notices"
+MAX_WORKERS = 4
+
+
+def _notice_hash(loan_rows):
+    """Fingerprint of the overdue loans on a notice (not the daily fine amount)."""
+    key = ";".join(f"{row['Loan_id']}:{row['Due_date']}" for row in loan_rows)
+    return hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+
+def render_notice(card_id, bname, address, loan_rows, today, calendar=None):
+    """
+    Render the text of an overdue notice for one borrower.
+
+    Args:
+        card_id (str): Borrower card ID
+        bname (str): Borrower name
+        address (str): Borrower address
+        loan_rows (list): Overdue loan rows (Loan_id, Isbn, Title, Due_date)
+        today (date): Date printed on the notice
+        calendar (ClosureCalendar): Closed days for the fines (default: loaded from the database)
+
+    Returns:
+        str: Notice text
+    """
+    lines = [
+        f"OVERDUE NOTICE - {today}",
+        "",
+        bname,
+        address,
+        f"Card ID: {card_id}",
+        "",
+        "The following items are overdue:",
+        "",
+        f"{'Loan_ID':<10} {'ISBN':<15} {'Title':<40} {'Due_Date':<12} {'Fine':<10}",
+        "-" * 90,
+    ]
+
+    calendar = calendar or closures.get_calendar()
+    total = Decimal('0.00')
+    for row in loan_rows:
+        fine_amount = fines.calculate_fine_amount(row['Due_date'], calendar=calendar)
+        total += fine_amount
+        title = row['Title'][:39]
+        lines.append(f"{row['Loan_id']:<10} {row['Isbn']:<15} {title:<40} {row['Due_date']:<12} ${fine_amount:.2f}")
+
+    lines.append("-" * 90)
+    lines.append(f"Fines accrued to date: ${total:.2f}")
+    lines.append("")
+    lines.append("Please return these items as soon as possible. Fines can only be paid once items are returned.")
+    return "\n".join(lines) + "\n"
+
+
+def _write_notice(path, text):
+    path.write_text(text, encoding='utf-8')
+    return path
+
+
+def generate_notices(output_dir=None, force=False, max_workers=MAX_WORKERS):
+    """
+    Write an overdue notice file for every borrower with open overdue loans.
+
+    Runs a single query over overdue ACTIVE_LOANS/BOOK_LOANS joined to BORROWER
+    and BOOK, ordered by card ID, and groups the rows per borrower as they
+    stream in. Notices are written to files by a thread pool. NOTICE_WATERMARK
+    stores a fingerprint of the loans on each borrower's last notice, so a rerun
+    only writes notices for borrowers whose set of overdue loans changed.
+
+    Args:
+        output_dir (str): Directory for notice files (default: notices/ next to the code)
+        force (bool): If True, ignore the watermark and write every notice
+        max_workers (int): Number of writer threads
+
+    Returns:
+        tuple: (written: int, skipped: int)
+    """
+    output_dir = Path(output_dir) if output_dir else NOTICE_DIR
+    output_dir.mkdir(parents=True, exist_ok=True)
+    today = date.today()
+
+    conn = sqlite3.connect(DB_PATH)
+    conn.row_factory = sqlite3.Row
+    cur = conn.cursor()
+
+    query = """
+    SELECT
+        bl.Card_id,
+        br.Bname,
+        br.Address,
+        bl.Loan_id,
+        bl.Isbn,
+        b.Title,
+        bl.Due_date,
+        w.Content_hash
+    FROM ACTIVE_LOANS al
+    JOIN BOOK_LOANS bl ON al.Loan_id = bl.Loan_id
+    JOIN BORROWER br ON bl.Card_id = br.Card_id
+    JOIN BOOK b ON bl.Isbn = b.Isbn
+    LEFT JOIN NOTICE_WATERMARK w ON bl.Card_id = w.Card_id
+    WHERE bl.Due_date < ?
+    ORDER BY bl.Card_id, bl.Due_date, bl.Loan_id
+    """
+    calendar = closures.load_calendar(cur)
+    cur.execute(query, (today,))
+
+    written = 0
+    skipped = 0
+    watermarks = []
+    pending = []
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        for card_id, group in groupby(cur, key=lambda row: row['Card_id']):
+            loan_rows = list(group)
+            content_hash = _notice_hash(loan_rows)
+
+            if not force and loan_rows[0]['Content_hash'] == content_hash:
+                skipped += 1
+                continue
+
+            first = loan_rows[0]
+            text = render_notice(card_id, first['Bname'], first['Address'], loan_rows, today, calendar)
+            pending.append(pool.submit(_write_notice, output_dir / f"{card_id}.txt", text))
+            watermarks.append((card_id, content_hash, today))
+
+            # Keep the number of queued notices bounded
+            if len(pending) >= max_workers * 8:
+                for future in pending:
+                    future.result()
+                written += len(pending)
+                pending = []
+
+        for future in pending:
+            future.result()
+        written += len(pending)
+
+    cur.executemany("""
+        INSERT INTO NOTICE_WATERMARK (Card_id, Content_hash, Notice_date)
+        VALUES (?, ?, ?)
+        ON CONFLICT (Card_id) DO UPDATE SET
+            Content_hash = excluded.Content_hash,
+            Notice_date = excluded.Notice_date
+    """, watermarks)
+    conn.commit()
+    conn.close()
+
+    return written, skipped
+
+
+if __name__ == "__main__":
+    written, skipped = generate_notices(force="--force" in sys.argv[1:])
+    print(f"Wrote {written} notice(s); {skipped} unchanged borrower(s) skipped.")
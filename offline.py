@@ -0,0 +1,682 @@
+import json
+import sqlite3
+import sys
+import threading
+import time
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from pathlib import Path
+from config import DB_PATH, OFFLINE_DB_PATH, TERMINAL_ID, OFFLINE_RETRY_SECONDS
+import loans
+import journal
+import closures
+import metrics
+
+REPLAY_BATCH = 100            # queued events applied per library.db transaction
+CONNECT_TIMEOUT = 2.0         # seconds to wait for a locked library.db before working offline
+LOCAL_TIMEOUT = 30.0          # seconds a desk operation waits for a cache refresh
+CACHE_REFRESH_SECONDS = 600   # how often the read cache is refreshed while online
+MAX_LOANS = 3
+
+# OperationalError messages that mean library.db cannot be reached right
+# now. Anything else (e.g. "no such table" from a database that was never
+# upgraded) would make every queued event conflict, so it is reported instead.
+UNREACHABLE_ERRORS = ("unable to open", "database is locked", "disk i/o")
+
+# Terminal-local database: a read cache of what the desk checks at checkout
+# and check-in, and the queue of circulation events taken while offline.
+# LIBRARY_CLOSURES has the library's schema so closures.next_open_day()
+# works on it unchanged.
+LOCAL_SCHEMA = [
+    """
+    CREATE TABLE IF NOT EXISTS CACHED_BOOKS (
+        Isbn TEXT PRIMARY KEY,
+        Title TEXT NOT NULL,
+        Copies INTEGER NOT NULL,
+        Available INTEGER NOT NULL
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS CACHED_BORROWERS (
+        Card_id TEXT PRIMARY KEY,
+        Bname TEXT NOT NULL,
+        Active_loans INTEGER NOT NULL,
+        Has_unpaid INTEGER NOT NULL
+    )
+    """,
+    # Open loans; offline checkouts get a provisional negative Loan_id (-Seq)
+    """
+    CREATE TABLE IF NOT EXISTS CACHED_LOANS (
+        Loan_id INTEGER PRIMARY KEY,
+        Isbn TEXT NOT NULL,
+        Card_id TEXT NOT NULL,
+        Date_out DATE NOT NULL,
+        Due_date DATE NOT NULL
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS LIBRARY_CLOSURES (
+        Closed_on DATE PRIMARY KEY,
+        Reason TEXT
+    )
+    """,
+    # Loan_id is the real loan of an applied offline checkout
+    """
+    CREATE TABLE IF NOT EXISTS OFFLINE_QUEUE (
+        Seq INTEGER PRIMARY KEY AUTOINCREMENT,
+        Event TEXT NOT NULL CHECK (Event IN ('CHECKOUT', 'CHECKIN')),
+        Payload TEXT NOT NULL,
+        Queued_at TEXT NOT NULL,
+        Status TEXT NOT NULL DEFAULT 'PENDING' CHECK (Status IN ('PENDING', 'APPLIED', 'CONFLICT')),
+        Message TEXT,
+        Loan_id INTEGER
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_offline_queue_status ON OFFLINE_QUEUE (Status, Seq)",
+    """
+    CREATE TABLE IF NOT EXISTS CACHE_INFO (
+        Name TEXT PRIMARY KEY,
+        Value TEXT
+    )
+    """,
+]
+
+
+def create_local_tables(conn):
+    cur = conn.cursor()
+    for statement in LOCAL_SCHEMA:
+        cur.execute(statement)
+    conn.commit()
+
+
+def refresh_cache(local_path=None, db_path=None):
+    """
+    Replace the read cache with the current catalog, borrower standing and open loans.
+
+    Skipped (returns False) while queued events are waiting, since the
+    cache then holds their effects and library.db does not yet.
+
+    Returns:
+        bool: True if the cache was refreshed
+    """
+    db_path = db_path or DB_PATH
+    if not Path(db_path).exists():
+        # ATTACH would create an empty file in place of the missing database
+        raise sqlite3.OperationalError(f"unable to open database file: {db_path}")
+
+    conn = sqlite3.connect(local_path or OFFLINE_DB_PATH, timeout=LOCAL_TIMEOUT, isolation_level=None)
+    cur = conn.cursor()
+    cur.execute("ATTACH DATABASE ? AS library", (db_path,))
+    try:
+        # The write lock keeps desk operations from queueing events mid-refresh
+        cur.execute("BEGIN IMMEDIATE")
+        cur.execute("SELECT COUNT(*) FROM OFFLINE_QUEUE WHERE Status = 'PENDING'")
+        if cur.fetchone()[0]:
+            cur.execute("ROLLBACK")
+            return False
+        cur.execute("DELETE FROM CACHED_BOOKS")
+        cur.execute("""
+            INSERT INTO CACHED_BOOKS (Isbn, Title, Copies, Available)
+            SELECT b.Isbn, b.Title, COALESCE(av.Copies, 0), COALESCE(av.Available, 0)
+            FROM library.BOOK b
+            LEFT JOIN library.BOOK_AVAILABILITY av ON av.Isbn = b.Isbn
+        """)
+        cur.execute("DELETE FROM CACHED_BORROWERS")
+        cur.execute("""
+            INSERT INTO CACHED_BORROWERS (Card_id, Bname, Active_loans, Has_unpaid)
+            SELECT br.Card_id, br.Bname, COALESCE(s.Active_loans, 0), COALESCE(s.Has_unpaid, 0)
+            FROM library.BORROWER br
+            LEFT JOIN library.BORROWER_STANDING s ON s.Card_id = br.Card_id
+        """)
+        cur.execute("DELETE FROM CACHED_LOANS")
+        cur.execute("""
+            INSERT INTO CACHED_LOANS (Loan_id, Isbn, Card_id, Date_out, Due_date)
+            SELECT bl.Loan_id, bl.Isbn, bl.Card_id, bl.Date_out, bl.Due_date
+            FROM library.ACTIVE_LOANS al
+            JOIN library.BOOK_LOANS bl ON bl.Loan_id = al.Loan_id
+        """)
+        cur.execute("DELETE FROM LIBRARY_CLOSURES")
+        cur.execute("INSERT INTO LIBRARY_CLOSURES SELECT Closed_on, Reason FROM library.LIBRARY_CLOSURES")
+        cur.execute("""
+            INSERT INTO CACHE_INFO (Name, Value) VALUES ('Refreshed_at', ?)
+            ON CONFLICT (Name) DO UPDATE SET Value = excluded.Value
+        """, (datetime.now().isoformat(timespec='seconds'),))
+        cur.execute("COMMIT")
+        return True
+    except sqlite3.Error:
+        if conn.in_transaction:
+            cur.execute("ROLLBACK")
+        raise
+    finally:
+        cur.execute("DETACH DATABASE library")
+        conn.close()
+
+
+def is_unreachable(error):
+    """True if a sqlite3 error means library.db cannot be opened or locked"""
+    return isinstance(error, sqlite3.OperationalError) and any(
+        text in str(error).lower() for text in UNREACHABLE_ERRORS)
+
+
+def _refused(reason, message):
+    metrics.inc("library_checkouts_failed_total", labels=(reason,))
+    return False, message
+
+
+class OfflineTerminal:
+    """
+    Checkouts and check-ins that keep working when library.db cannot be reached.
+
+    While library.db is reachable, operations go straight to it as with
+    loans.checkout/loans.checkin. When opening or locking it fails, the
+    terminal goes offline: checks run against the local read cache,
+    events are appended to OFFLINE_QUEUE, and the cache is adjusted so
+    the next checkout at this desk sees them. Every desk operation is
+    then a local SQLite write.
+
+    A background thread retries every retry_seconds and replays the
+    queue in order, REPLAY_BATCH events per transaction, through
+    journal.apply_entry (so library.db's CIRCULATION_JOURNAL records
+    them, with their original dates). An event library.db refuses, for
+    example a copy another terminal checked out meanwhile, is marked
+    CONFLICT with the reason for staff to resolve. OFFLINE_TERMINALS in
+    library.db holds the last applied Seq of each terminal, committed
+    with the batch, so an interrupted replay never applies an event twice.
+    The terminal goes back online once the queue is empty.
+
+    The cache is only as fresh as its last refresh (at start, every
+    CACHE_REFRESH_SECONDS and after a replay); anything it misses, such as
+    holds, is caught as a conflict on replay.
+    """
+
+    def __init__(self, db_path=None, local_path=None, terminal_id=TERMINAL_ID, retry_seconds=OFFLINE_RETRY_SECONDS):
+        self.db_path = db_path or DB_PATH
+        self.local_path = local_path or OFFLINE_DB_PATH
+        self.terminal_id = terminal_id
+        self.retry_seconds = retry_seconds
+        self.lock = threading.Lock()        # one desk operation at a time on the local database
+        self.sync_lock = threading.Lock()   # one replay at a time
+        self.stopping = threading.Event()
+        self.thread = None
+        self.last_refresh = 0.0
+        self.last_error = None
+
+        conn = sqlite3.connect(self.local_path)
+        create_local_tables(conn)
+        conn.close()
+        # Events left from an earlier session must be replayed before anything new goes online
+        self.offline = self.pending_count() > 0
+
+    def start(self):
+        """Start the background replay and cache refresh thread"""
+        if self.thread and self.thread.is_alive():
+            return self
+        self.stopping.clear()
+        self.thread = threading.Thread(target=self.run, name="offline-sync", daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.stopping.set()
+        if self.thread:
+            self.thread.join()
+
+    def run(self):
+        while not self.stopping.is_set():
+            # An operation that saw the terminal offline just as it came back
+            # may still have queued its event
+            if self.offline or self.pending_count():
+                self.sync()
+            elif time.monotonic() - self.last_refresh >= CACHE_REFRESH_SECONDS:
+                self.refresh()
+            self.stopping.wait(self.retry_seconds)
+
+    def go_offline(self, error):
+        self.offline = True
+        self.last_error = str(error)
+
+    def refresh(self):
+        """Refresh the read cache, going offline if library.db cannot be read"""
+        try:
+            if refresh_cache(self.local_path, self.db_path):
+                self.last_refresh = time.monotonic()
+        except sqlite3.Error as e:
+            if is_unreachable(e):
+                self.go_offline(e)
+            else:
+                # Keep the old cache; shown by the CLI and retried next interval
+                self.last_error = str(e)
+
+    def _local(self):
+        conn = sqlite3.connect(self.local_path, timeout=LOCAL_TIMEOUT)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def _library(self, isolation_level=""):
+        # sqlite3.connect would silently create an empty file
+        if not Path(self.db_path).exists():
+            raise sqlite3.OperationalError(f"unable to open database file: {self.db_path}")
+        conn = sqlite3.connect(self.db_path, timeout=CONNECT_TIMEOUT, isolation_level=isolation_level)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def pending_count(self):
+        conn = self._local()
+        count = conn.execute("SELECT COUNT(*) FROM OFFLINE_QUEUE WHERE Status = 'PENDING'").fetchone()[0]
+        conn.close()
+        return count
+
+    @metrics.timed("library_checkout_seconds")
+    def checkout(self, isbn, card_id, override=False):
+        """Check out a book; same signature and result as loans.checkout"""
+        if not self.offline:
+            try:
+                conn = self._library()
+                try:
+                    success, message = loans.checkout_in_transaction(conn.cursor(), isbn, card_id, override)
+                    if success:
+                        conn.commit()
+                        loans.count_committed('CHECKOUT', success)
+                    else:
+                        conn.rollback()
+                    return success, message
+                finally:
+                    conn.close()
+            except sqlite3.Error as e:
+                if not is_unreachable(e):
+                    metrics.inc("library_checkouts_failed_total", labels=("database_error",))
+                    return False, f"Database error: {str(e)}"
+                self.go_offline(e)
+        return self.checkout_offline(isbn, card_id, override)
+
+    def checkin(self, loan_ids):
+        """Check in 1-3 loans; same signature and result as loans.checkin"""
+        if not loan_ids:
+            return False, "Error: No loan IDs provided."
+        if len(loan_ids) > 3:
+            return False, "Error: Cannot check in more than 3 books at once."
+        loan_ids, error = loans.parse_loan_ids(loan_ids)
+        if error:
+            return False, error
+        if not self.offline:
+            try:
+                conn = self._library()
+                try:
+                    outcomes = []
+                    success, message = loans.checkin_in_transaction(conn.cursor(), loan_ids, outcomes=outcomes)
+                    conn.commit()
+                    loans.count_committed('CHECKIN', success, outcomes)
+                    return success, message
+                finally:
+                    conn.close()
+            except sqlite3.Error as e:
+                if not is_unreachable(e):
+                    return False, f"Database error: {str(e)}"
+                self.go_offline(e)
+        return self.checkin_offline(loan_ids)
+
+    def checkout_offline(self, isbn, card_id, override=False):
+        """Check the cached standing and availability, then queue the checkout"""
+        with self.lock:
+            conn = self._local()
+            cur = conn.cursor()
+            try:
+                cur.execute("SELECT * FROM CACHED_BORROWERS WHERE Card_id = ?", (card_id,))
+                borrower = cur.fetchone()
+                if not borrower:
+                    return _refused("borrower_not_found", f"Error: Borrower with card ID '{card_id}' not found.")
+                cur.execute("SELECT * FROM CACHED_BOOKS WHERE Isbn = ?", (isbn,))
+                book = cur.fetchone()
+                if not book:
+                    return _refused("book_not_found", f"Error: Book with ISBN '{isbn}' not found.")
+                if not override and borrower['Has_unpaid']:
+                    return _refused("unpaid_fines", "Error: Borrower has unpaid fines. Cannot checkout books until fines are paid.")
+                if not override and borrower['Active_loans'] >= MAX_LOANS:
+                    return _refused("loan_limit", f"Error: Borrower already has {MAX_LOANS} active loans. Maximum limit reached.")
+                if book['Available'] <= 0:
+                    return _refused("unavailable", f"Error: Book with ISBN '{isbn}' is already checked out and not available.")
+
+                date_out = date.today()
+                due_date = closures.next_open_day(cur, date_out + timedelta(days=14))
+                seq = self._queue(cur, 'CHECKOUT', {'isbn': isbn, 'card_id': card_id, 'override': bool(override),
+                                                    'date': date_out.isoformat()})
+                cur.execute("UPDATE CACHED_BOOKS SET Available = Available - 1 WHERE Isbn = ?", (isbn,))
+                cur.execute("UPDATE CACHED_BORROWERS SET Active_loans = Active_loans + 1 WHERE Card_id = ?", (card_id,))
+                cur.execute("""
+                    INSERT INTO CACHED_LOANS (Loan_id, Isbn, Card_id, Date_out, Due_date)
+                    VALUES (?, ?, ?, ?, ?)
+                """, (-seq, isbn, card_id, date_out, due_date))
+                conn.commit()
+            finally:
+                conn.close()
+        return True, (f"Offline: checked out book '{book['Title']}' (ISBN: {isbn}). Due date: {due_date}. "
+                      f"Provisional loan ID {-seq}; it is confirmed when the library database is reachable again.")
+
+    def checkin_offline(self, loan_ids):
+        """Close the loans in the cache and queue the check-in"""
+        with self.lock:
+            conn = self._local()
+            cur = conn.cursor()
+            try:
+                found = []
+                errors = []
+                for loan_id in (int(loan_id) for loan_id in loan_ids):
+                    if not self._close_cached_loan(cur, loan_id):
+                        errors.append(f"Loan ID {loan_id} is not an open loan")
+                        continue
+                    found.append(loan_id)
+                if found:
+                    self._queue(cur, 'CHECKIN', {'loan_ids': found, 'date': date.today().isoformat()})
+                conn.commit()
+            finally:
+                conn.close()
+
+        note = "Fines are accrued when the library database is reachable again."
+        if errors:
+            return False, f"Errors: {'; '.join(errors)}. Checked in {len(found)} book(s) offline. {note}"
+        return True, f"Offline: checked in {len(found)} book(s). {note}"
+
+    def _close_cached_loan(self, cur, loan_id):
+        """Remove an open loan from the cache and free its copy; returns the loan or None"""
+        cur.execute("SELECT Loan_id, Isbn, Card_id FROM CACHED_LOANS WHERE Loan_id = ?", (loan_id,))
+        loan = cur.fetchone()
+        if loan:
+            cur.execute("DELETE FROM CACHED_LOANS WHERE Loan_id = ?", (loan_id,))
+            cur.execute("UPDATE CACHED_BOOKS SET Available = Available + 1 WHERE Isbn = ?", (loan['Isbn'],))
+            cur.execute("UPDATE CACHED_BORROWERS SET Active_loans = MAX(Active_loans - 1, 0) WHERE Card_id = ?",
+                        (loan['Card_id'],))
+        return loan
+
+    def batch_checkin(self, items):
+        """Book-drop check-in; same signature and result as loans.batch_checkin"""
+        if not items:
+            return False, "Error: No loan IDs or ISBNs provided.", []
+        if not self.offline:
+            try:
+                conn = self._library()
+                try:
+                    outcomes = loans.batch_checkin_in_transaction(conn.cursor(), items)
+                    conn.commit()
+                    loans.count_committed('CHECKIN', True, outcomes)
+                finally:
+                    conn.close()
+                success, message = loans.summarize_batch(outcomes)
+                return success, message, outcomes
+            except sqlite3.Error as e:
+                if not is_unreachable(e):
+                    return False, f"Database error: {str(e)}", []
+                self.go_offline(e)
+        return self.batch_checkin_offline(items)
+
+    def batch_checkin_offline(self, items):
+        """
+        Resolve loan IDs and ISBNs against the cache, close those loans and queue one check-in.
+
+        As in loans.batch_checkin, an ISBN takes the open loan of that title
+        due first. Fines are accrued when the check-in is replayed.
+        """
+        outcomes = []
+        with self.lock:
+            conn = self._local()
+            cur = conn.cursor()
+            try:
+                found = []
+                for item in items:
+                    outcome = {'Item': item, 'Loan_id': None, 'ISBN': None, 'Card_id': None, 'Success': False,
+                               'Message': "", 'Fine': Decimal('0.00'), 'Hold': None}
+                    outcomes.append(outcome)
+                    loan_id = item
+                    if not isinstance(item, int):
+                        cur.execute("SELECT Loan_id FROM CACHED_LOANS WHERE Isbn = ? ORDER BY Due_date, Loan_id LIMIT 1",
+                                    (item,))
+                        row = cur.fetchone()
+                        if not row:
+                            outcome['Message'] = f"ISBN {item} has no open loan to check in."
+                            continue
+                        loan_id = row['Loan_id']
+                    loan = self._close_cached_loan(cur, loan_id)
+                    if not loan:
+                        outcome['Message'] = f"Loan ID {loan_id} not found or already checked in."
+                        continue
+                    found.append(loan_id)
+                    outcome.update({'Loan_id': loan_id, 'ISBN': loan['Isbn'], 'Card_id': loan['Card_id'],
+                                    'Success': True, 'Message': f"Checked in loan {loan_id} offline."})
+                if found:
+                    self._queue(cur, 'CHECKIN', {'loan_ids': found, 'date': date.today().isoformat()})
+                conn.commit()
+            finally:
+                conn.close()
+
+        success, message = loans.summarize_batch(outcomes)
+        return success, f"Offline: {message} Fines are accrued when the library database is reachable again.", outcomes
+
+    def _queue(self, cur, event, payload):
+        cur.execute("""
+            INSERT INTO OFFLINE_QUEUE (Event, Payload, Queued_at) VALUES (?, ?, ?)
+        """, (event, json.dumps(payload), datetime.now().isoformat(timespec='seconds')))
+        return cur.lastrowid
+
+    def sync(self):
+        """
+        Replay queued events onto library.db, then go back online if the queue is empty.
+
+        Returns:
+            tuple: (success: bool, message: str, counts: dict with Applied, Conflicts, Pending)
+        """
+        counts = {'Applied': 0, 'Conflicts': 0, 'Pending': 0}
+        with self.sync_lock:
+            try:
+                while True:
+                    conn = self._local()
+                    batch = conn.execute("""
+                        SELECT Seq, Event, Payload FROM OFFLINE_QUEUE
+                        WHERE Status = 'PENDING' ORDER BY Seq LIMIT ?
+                    """, (REPLAY_BATCH,)).fetchall()
+                    conn.close()
+                    if not batch:
+                        # Back online; the desk writes to library.db again from here on
+                        with self.lock:
+                            if not self.pending_count():
+                                self.offline = False
+                                self.last_error = None
+                                break
+                        continue
+                    for status in self.replay_batch(batch):
+                        counts['Applied' if status == 'APPLIED' else 'Conflicts'] += 1
+
+                self.refresh()
+            except sqlite3.Error as e:
+                # The failed batch was rolled back; it stays queued for the next retry
+                counts['Pending'] = self.pending_count()
+                if not is_unreachable(e):
+                    self.last_error = str(e)
+                    return False, f"Database error: {str(e)}; {counts['Pending']} event(s) queued.", counts
+                self.go_offline(e)
+                return False, f"Library database not reachable ({e}); {counts['Pending']} event(s) queued.", counts
+
+        return True, f"Replayed {counts['Applied']} event(s); {counts['Conflicts']} conflict(s).", counts
+
+    def replay_batch(self, batch):
+        """Apply one batch in a single library.db transaction; returns the status of each event"""
+        library = self._library(isolation_level=None)
+        cur = library.cursor()
+        outcomes = []
+        applied = []  # (event, success, per-loan outcomes), counted once committed
+        try:
+            cur.execute("BEGIN IMMEDIATE")
+            cur.execute("SELECT Last_seq FROM OFFLINE_TERMINALS WHERE Terminal_id = ?", (self.terminal_id,))
+            row = cur.fetchone()
+            last_seq = row[0] if row else 0
+
+            provisional = self._applied_loans()
+            for entry in batch:
+                if entry['Seq'] <= last_seq:
+                    # Committed by an earlier replay whose local update was lost
+                    outcomes.append((entry['Seq'], 'APPLIED', "Already applied.", None))
+                    continue
+                payload = json.loads(entry['Payload'])
+                loan_id = None
+                loan_outcomes = []
+                if entry['Event'] == 'CHECKIN':
+                    success, message = self._replay_checkin(cur, payload, provisional, loan_outcomes)
+                else:
+                    seq = journal.append_entry(cur, entry['Event'], payload)
+                    success, message = journal.apply_entry(cur, seq, entry['Event'], payload)
+                    if success:
+                        cur.execute("""
+                            SELECT MAX(Loan_id) FROM ACTIVE_LOANS WHERE Isbn = ? AND Card_id = ?
+                        """, (payload['isbn'], payload['card_id']))
+                        loan_id = cur.fetchone()[0]
+                    provisional[-entry['Seq']] = loan_id
+                outcomes.append((entry['Seq'], 'APPLIED' if success else 'CONFLICT', message, loan_id))
+                applied.append((entry['Event'], success, loan_outcomes))
+
+            cur.execute("""
+                INSERT INTO OFFLINE_TERMINALS (Terminal_id, Last_seq, Synced_at) VALUES (?, ?, ?)
+                ON CONFLICT (Terminal_id) DO UPDATE SET Last_seq = excluded.Last_seq, Synced_at = excluded.Synced_at
+            """, (self.terminal_id, max(last_seq, batch[-1]['Seq']), datetime.now().isoformat(timespec='seconds')))
+            cur.execute("COMMIT")
+        except sqlite3.Error:
+            if library.in_transaction:
+                cur.execute("ROLLBACK")
+            raise
+        finally:
+            library.close()
+        for event, success, loan_outcomes in applied:
+            loans.count_committed(event, success, loan_outcomes)
+
+        with self.lock:
+            conn = self._local()
+            conn.executemany("UPDATE OFFLINE_QUEUE SET Status = ?, Message = ?, Loan_id = ? WHERE Seq = ?",
+                             [(status, message, loan_id, seq) for seq, status, message, loan_id in outcomes])
+            conn.commit()
+            conn.close()
+        return [status for seq, status, message, loan_id in outcomes]
+
+    def _applied_loans(self):
+        """Provisional loan ID -> real loan ID (None if the checkout conflicted) for replayed checkouts"""
+        conn = self._local()
+        rows = conn.execute("""
+            SELECT Seq, Loan_id FROM OFFLINE_QUEUE WHERE Event = 'CHECKOUT' AND Status != 'PENDING'
+        """).fetchall()
+        conn.close()
+        return {-row['Seq']: row['Loan_id'] for row in rows}
+
+    def _replay_checkin(self, cur, payload, provisional, outcomes=None):
+        """Apply a queued check-in, translating provisional loan IDs to the real ones"""
+        loan_ids = []
+        errors = []
+        for loan_id in payload['loan_ids']:
+            if loan_id >= 0:
+                loan_ids.append(loan_id)
+            elif provisional.get(loan_id):
+                loan_ids.append(provisional[loan_id])
+            else:
+                errors.append(f"Provisional loan {loan_id} was never checked out (its checkout conflicted).")
+        if not loan_ids:
+            return False, f"Errors: {'; '.join(errors)}."
+
+        payload = dict(payload, loan_ids=loan_ids)
+        seq = journal.append_entry(cur, 'CHECKIN', payload)
+        success, message = journal.apply_entry(cur, seq, 'CHECKIN', payload, outcomes)
+        if errors:
+            return False, f"{message} Errors: {'; '.join(errors)}."
+        return success, message
+
+    def get_conflicts(self):
+        """
+        Return queued events library.db refused, for staff to resolve.
+
+        Returns:
+            list: Dictionaries with keys Seq, Event, Payload (dict), Queued_at, Message
+        """
+        conn = self._local()
+        rows = conn.execute("""
+            SELECT Seq, Event, Payload, Queued_at, Message FROM OFFLINE_QUEUE
+            WHERE Status = 'CONFLICT' ORDER BY Seq
+        """).fetchall()
+        conn.close()
+        return [{'Seq': row['Seq'], 'Event': row['Event'], 'Payload': json.loads(row['Payload']),
+                 'Queued_at': row['Queued_at'], 'Message': row['Message']} for row in rows]
+
+    def find_loans_by_search(self, search_term, limit=None, offset=0):
+        """loans.find_loans_by_search(), answered from the cache while offline"""
+        if not self.offline:
+            try:
+                conn = self._library()
+                conn.close()
+                return loans.find_loans_by_search(search_term, limit, offset, db_path=self.db_path)
+            except sqlite3.OperationalError as e:
+                if not is_unreachable(e):
+                    raise
+                self.go_offline(e)
+
+        search_pattern = f"%{search_term.lower()}%"
+        conn = self._local()
+        rows = conn.execute("""
+            SELECT l.Loan_id, l.Isbn, b.Title, l.Card_id, br.Bname, l.Date_out, l.Due_date
+            FROM CACHED_LOANS l
+            JOIN CACHED_BOOKS b ON b.Isbn = l.Isbn
+            JOIN CACHED_BORROWERS br ON br.Card_id = l.Card_id
+            WHERE LOWER(l.Isbn) LIKE ? OR LOWER(l.Card_id) LIKE ? OR LOWER(br.Bname) LIKE ?
+            ORDER BY l.Due_date, l.Loan_id
+            LIMIT ? OFFSET ?
+        """, (search_pattern, search_pattern, search_pattern, -1 if limit is None else limit, offset)).fetchall()
+        conn.close()
+        return [{'Loan_id': row['Loan_id'], 'ISBN': row['Isbn'], 'Title': row['Title'], 'Card_id': row['Card_id'],
+                 'Borrower_name': row['Bname'], 'Date_out': row['Date_out'], 'Due_date': row['Due_date'],
+                 'Date_in': None} for row in rows]
+
+    def count_loans_by_search(self, search_term):
+        """loans.count_loans_by_search(), answered from the cache while offline"""
+        if not self.offline:
+            try:
+                conn = self._library()
+                conn.close()
+                return loans.count_loans_by_search(search_term, db_path=self.db_path)
+            except sqlite3.OperationalError as e:
+                if not is_unreachable(e):
+                    raise
+                self.go_offline(e)
+
+        search_pattern = f"%{search_term.lower()}%"
+        conn = self._local()
+        count = conn.execute("""
+            SELECT COUNT(*)
+            FROM CACHED_LOANS l
+            JOIN CACHED_BORROWERS br ON br.Card_id = l.Card_id
+            WHERE LOWER(l.Isbn) LIKE ? OR LOWER(l.Card_id) LIKE ? OR LOWER(br.Bname) LIKE ?
+        """, (search_pattern, search_pattern, search_pattern)).fetchone()[0]
+        conn.close()
+        return count
+
+
+_terminal = None
+_terminal_lock = threading.Lock()
+
+
+def get_terminal():
+    """Return the process-wide offline-capable terminal, starting it on first use"""
+    global _terminal
+    with _terminal_lock:
+        if _terminal is None:
+            _terminal = OfflineTerminal().start()
+        return _terminal
+
+
+if __name__ == "__main__":
+    # Usage: python offline.py [sync | refresh | conflicts]
+    terminal = OfflineTerminal()
+    command = sys.argv[1] if len(sys.argv) > 1 else "sync"
+    if command == "refresh":
+        terminal.refresh()
+        print("Cache refreshed." if not terminal.offline else f"Library database not reachable: {terminal.last_error}")
+    elif command == "conflicts":
+        for conflict in terminal.get_conflicts():
+            print(f"{conflict['Seq']:<6} {conflict['Queued_at']} {conflict['Event']:<9} "
+                  f"{json.dumps(conflict['Payload'])}  {conflict['Message']}")
+    else:
+        terminal.offline = True
+        success, message, counts = terminal.sync()
+        print(message)
+        sys.exit(0 if success else 1)
@@ -0,0 +1,176 @@
+import re
+import sqlite3
+import sys
+import tempfile
+from datetime import date, timedelta
+from pathlib import Path
+import init_db
+import copies
+import standing
+import search
+import loans
+import fines
+import fuzzy
+import holds
+
+# Hot statements and the tables (as named in the plan, i.e. by alias) each
+# one may scan. Any other SCAN, or an automatic index (SQLite building a
+# throwaway index because a real one is missing), is a regression.
+HOT_QUERIES = [
+    # Substring matches cannot use an index: the title match scans BOOK and
+    # the author match walks BOOK_AUTHORS; everything joined to them is a seek
+    ("search", search.SEARCH_QUERY, {"BOOK", "ba2"}),
+    # Ranking reads the matches back from its subquery (m) to add popularity
+    ("ranked search", search.RANKED_QUERY, {"BOOK", "ba", "m"}),
+    # Facets read every ranked match (r) once, with key lookups for their values
+    ("search facets", search.MATCH_FACETS_QUERY, {"BOOK", "ba", "m", "r"}),
+    ("checkout eligibility", loans.BORROWER_ELIGIBILITY_QUERY, set()),
+    # ACTIVE_LOANS only holds the open loans, so the substring search scans it
+    ("active loan search", loans.LOAN_SEARCH_QUERY, {"al"}),
+    ("active loans by ISBN", loans.OPEN_LOANS_BY_ISBN.format(placeholders="?,?,?"), set()),
+    ("fine accrual", fines.FINE_LOOKUP_QUERY.format(placeholders="?,?,?"), set()),
+    # The fines report lists every fine
+    ("fines by borrower", fines.FINES_BY_BORROWER_QUERY.format(paid_filter="AND f.Paid = 0"), {"f"}),
+    ("unpaid fines", fines.UNPAID_FINES_QUERY, set()),
+    ("pay_fines", fines.PAYABLE_FINES_QUERY, set()),
+    ("unpaid fine check", fines.HAS_UNPAID_QUERY, set()),
+    # Walks the waiting-hold index in queue order; no sort, no scan
+    ("hold dispatch", holds.DISPATCH_HOLD_QUERY, set()),
+    ("fuzzy author books", fuzzy.AUTHOR_BOOKS_QUERY.format(placeholders="?,?,?"), set()),
+]
+
+SCAN_PATTERN = re.compile(r"^SCAN (\w+)")
+
+
+def build_sample_db(path, books=2000, borrowers=300, loan_count=600):
+    """
+    Create a database with the full schema and a representative mix of rows:
+    books with authors, borrowers, returned and open loans, and fines.
+
+    ANALYZE is not run, as on a library database, so the planner decides
+    the same way it does in production.
+    """
+    conn = sqlite3.connect(path)
+    conn.row_factory = sqlite3.Row
+    init_db.create_tables(conn)
+    cur = conn.cursor()
+
+    isbns = [f"978{i:010d}" for i in range(books)]
+    card_ids = [f"ID{i:06d}" for i in range(1, borrowers + 1)]
+    cur.executemany("INSERT INTO BOOK (Isbn, Title) VALUES (?, ?)",
+                    [(isbn, f"Sample Title {i}") for i, isbn in enumerate(isbns)])
+    cur.executemany("INSERT INTO AUTHORS (Author_id, Name) VALUES (?, ?)",
+                    [(i, f"Author {i}") for i in range(1, books // 10 + 1)])
+    cur.executemany("INSERT INTO BOOK_AUTHORS (Isbn, Author_id) VALUES (?, ?)",
+                    [(isbn, i % (books // 10) + 1) for i, isbn in enumerate(isbns)])
+    cur.executemany("INSERT INTO BORROWER (Card_id, Ssn, Bname, Address, Phone) VALUES (?, ?, ?, ?, ?)",
+                    [(card_id, f"{i:09d}", f"Borrower {i}", f"{i} Main St", f"555-{i:04d}")
+                     for i, card_id in enumerate(card_ids)])
+    conn.commit()
+    copies.create_default_copies(conn)
+    copies.rebuild_availability(conn)
+    standing.rebuild_standing(conn)
+
+    # Loans taken out over the last two months; every other one is returned
+    today = date.today()
+    for i in range(loan_count):
+        loans.checkout_in_transaction(cur, isbns[i % books], card_ids[i % borrowers], override=True,
+                                      date_out=today - timedelta(days=60 - i % 60))
+    cur.execute("SELECT Loan_id FROM BOOK_LOANS WHERE Loan_id % 2 = 0")
+    loans.batch_checkin_in_transaction(cur, [row[0] for row in cur.fetchall()], today)
+    cur.execute("SELECT Loan_id, Card_id, Due_date, Date_in FROM BOOK_LOANS WHERE Due_date < ?", (today,))
+    fines.accrue_fines(cur, cur.fetchall())
+    conn.commit()
+    conn.close()
+
+
+def explain(cur, sql):
+    """Return the EXPLAIN QUERY PLAN detail lines of a statement, indented by depth"""
+    names = re.findall(r":(\w+)", sql)
+    cur.execute("EXPLAIN QUERY PLAN " + sql, dict.fromkeys(names) if names else [None] * sql.count("?"))
+    depth = {0: -1}
+    lines = []
+    for node_id, parent, _, detail in cur.fetchall():
+        depth[node_id] = depth.get(parent, -1) + 1
+        lines.append("  " * depth[node_id] + detail)
+    return lines
+
+
+def plan_problems(plan, allowed_scans):
+    """Return the plan lines that scan a table not in allowed_scans or build an automatic index"""
+    problems = []
+    for line in plan:
+        detail = line.strip()
+        match = SCAN_PATTERN.match(detail)
+        if match and match.group(1) not in allowed_scans and match.group(1) != "CONSTANT":
+            problems.append(detail)
+        elif "AUTOMATIC" in detail:
+            problems.append(detail)
+    return problems
+
+
+def check_plans(db_path=None, queries=HOT_QUERIES):
+    """
+    Run EXPLAIN QUERY PLAN on every hot statement and flag unexpected scans.
+
+    Args:
+        db_path (str): Database to check (default: a freshly built sample database)
+        queries (list): (name, sql, allowed scans) entries
+
+    Returns:
+        tuple: (success: bool, message: str, plans: dict name -> {'Plan': lines, 'Problems': lines})
+    """
+    with tempfile.TemporaryDirectory() as tmp:
+        if db_path is None:
+            db_path = str(Path(tmp) / "plans.db")
+            build_sample_db(db_path)
+        elif not Path(db_path).exists():
+            return False, f"Error: Database not found: {db_path}", {}
+
+        conn = sqlite3.connect(db_path)
+        cur = conn.cursor()
+        plans = {}
+        try:
+            for name, sql, allowed_scans in queries:
+                plan = explain(cur, sql)
+                plans[name] = {'Plan': plan, 'Problems': plan_problems(plan, allowed_scans)}
+        except sqlite3.Error as e:
+            conn.close()
+            return False, f"Database error: {str(e)}", plans
+        conn.close()
+
+    failed = [name for name, result in plans.items() if result['Problems']]
+    if failed:
+        return False, f"Error: Unexpected full scans in {', '.join(failed)}.", plans
+    return True, f"All {len(plans)} hot statements use their indexes.", plans
+
+
+def format_plans(plans):
+    """Return the plans as plain text for review, with problems marked"""
+    lines = []
+    for name, result in plans.items():
+        lines.append(f"== {name}" + (" (REGRESSION)" if result['Problems'] else ""))
+        for line in result['Plan']:
+            marker = "!!" if line.strip() in result['Problems'] else "  "
+            lines.append(f"{marker} {line}")
+        lines.append("")
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    # Usage: python query_plans.py [database] [--out plans.txt]
+    # Exits with status 1 if a hot statement falls back to a scan
+    args = sys.argv[1:]
+    out = None
+    if "--out" in args:
+        i = args.index("--out")
+        out = args[i + 1] if i + 1 < len(args) else None
+        del args[i:i + 2]
+    success, message, plans = check_plans(args[0] if args else None)
+    report = format_plans(plans)
+    if out:
+        Path(out).write_text(report)
+    else:
+        print(report)
+    print(message)
+    sys.exit(0 if success else 1)
@@ -1,23 +1,168 @@
 import sqlite3
 from datetime import datetime
 from config import DB_PATH
+import memprofile
+import metrics
 
-def search(search_term):
+# ISBNs matching by ISBN, Title, or Author name (three LIKE parameters)
+MATCHING_ISBNS = """
+    SELECT DISTINCT Isbn 
+    FROM BOOK 
+    WHERE LOWER(Isbn) LIKE ? OR LOWER(Title) LIKE ?
+    UNION
+    SELECT DISTINCT ba2.Isbn
+    FROM BOOK_AUTHORS ba2
+    JOIN AUTHORS a2 ON ba2.Author_id = a2.Author_id
+    WHERE LOWER(a2.Name) LIKE ?
+"""
+
+# Matching books with their authors and availability (three LIKE parameters, limit, offset)
+SEARCH_QUERY = f"""
+    SELECT 
+        b.Isbn,
+        b.Title,
+        COALESCE(GROUP_CONCAT(a.Name, ', '), 'Unknown') as Authors,
+        COALESCE(av.Copies, 0) as Copies,
+        COALESCE(av.Available, 0) as Available,
+        al.Card_id as Borrower_id
+    FROM BOOK b
+    LEFT JOIN BOOK_AUTHORS ba ON b.Isbn = ba.Isbn
+    LEFT JOIN AUTHORS a ON ba.Author_id = a.Author_id
+    LEFT JOIN BOOK_AVAILABILITY av ON b.Isbn = av.Isbn
+    LEFT JOIN ACTIVE_LOANS al ON b.Isbn = al.Isbn AND av.Copies = 1
+    WHERE b.Isbn IN ({MATCHING_ISBNS})
+    GROUP BY b.Isbn, b.Title, av.Copies, av.Available, al.Card_id
+    ORDER BY b.Isbn
+    LIMIT ? OFFSET ?
+"""
+
+# The same columns for specific books (format with the IN placeholders)
+BOOK_DETAILS_QUERY = """
+    SELECT 
+        b.Isbn,
+        b.Title,
+        COALESCE(GROUP_CONCAT(a.Name, ', '), 'Unknown') as Authors,
+        COALESCE(av.Copies, 0) as Copies,
+        COALESCE(av.Available, 0) as Available,
+        al.Card_id as Borrower_id
+    FROM BOOK b
+    LEFT JOIN BOOK_AUTHORS ba ON b.Isbn = ba.Isbn
+    LEFT JOIN AUTHORS a ON ba.Author_id = a.Author_id
+    LEFT JOIN BOOK_AVAILABILITY av ON b.Isbn = av.Isbn
+    LEFT JOIN ACTIVE_LOANS al ON b.Isbn = al.Isbn AND av.Copies = 1
+    WHERE b.Isbn IN ({placeholders})
+    GROUP BY b.Isbn, b.Title, av.Copies, av.Available, al.Card_id
+"""
+
+# Relevance of every matching book, best first. Title and ISBN matches come
+# from one pass over BOOK, author matches from one pass over AUTHORS; the
+# sorter only keeps the first limit + offset rows. Popularity adds up to 50.
+RANKED_QUERY = """
+    SELECT m.Isbn, SUM(m.Score) + COALESCE(50.0 * p.Loans / (p.Loans + 5), 0) AS Score
+    FROM (
+        SELECT Isbn,
+            CASE WHEN LOWER(Isbn) = :term THEN 1000
+                 WHEN LOWER(Isbn) LIKE :substring THEN 50
+                 ELSE 0 END
+          + CASE WHEN LOWER(Title) LIKE :prefix THEN 300
+                 WHEN ' ' || LOWER(Title) || ' ' LIKE :word THEN 200
+                 WHEN LOWER(Title) LIKE :substring THEN 100
+                 ELSE 0 END AS Score
+        FROM BOOK
+        WHERE LOWER(Isbn) LIKE :substring OR LOWER(Title) LIKE :substring
+        UNION ALL
+        SELECT ba.Isbn, MAX(CASE WHEN ' ' || LOWER(a.Name) || ' ' LIKE :word THEN 150 ELSE 100 END)
+        FROM AUTHORS a
+        JOIN BOOK_AUTHORS ba ON ba.Author_id = a.Author_id
+        WHERE LOWER(a.Name) LIKE :substring
+        GROUP BY ba.Isbn
+    ) m
+    LEFT JOIN BOOK_POPULARITY p ON p.Isbn = m.Isbn
+    GROUP BY m.Isbn
+    ORDER BY Score DESC, m.Isbn
+    LIMIT :limit OFFSET :offset
+"""
+
+# Facets offered on search results: (name, value expression over the joins
+# in MATCH_FACETS_QUERY). A book may have several values for a facet, e.g.
+# one per author. New catalog attributes become facets by adding them here
+# (and their table to the joins if needed).
+FACETS = [
+    ("Status", "CASE WHEN COALESCE(av.Available, 0) > 0 THEN 'IN' ELSE 'OUT' END"),
+    ("Author", "a.Name"),
+]
+FACET_NAMES = tuple(name for name, expression in FACETS)
+FACET_TOP = 10  # values listed per facet, most frequent first
+
+# Every matching book in relevance order with its facet values: one row per
+# book and author, from the same scan that finds the matches
+MATCH_FACETS_QUERY = f"""
+    SELECT r.Isbn, r.Score, {', '.join(f'{expression} AS "{name}"' for name, expression in FACETS)}
+    FROM ({RANKED_QUERY}) r
+    LEFT JOIN BOOK_AVAILABILITY av ON av.Isbn = r.Isbn
+    LEFT JOIN BOOK_AUTHORS ba ON ba.Isbn = r.Isbn
+    LEFT JOIN AUTHORS a ON a.Author_id = ba.Author_id
+    ORDER BY r.Score DESC, r.Isbn
+"""
+
+
+def book_result(row):
+    """Turn a SEARCH_QUERY / BOOK_DETAILS_QUERY row into a search result dictionary"""
+    # Availability is a key lookup on the maintained BOOK_AVAILABILITY counts;
+    # the borrower is only shown for single-copy titles
+    return {
+        'ISBN': row['Isbn'],
+        'Title': row['Title'],
+        'Authors': row['Authors'],  # Already handled by COALESCE in query
+        'Status': "IN" if row['Available'] > 0 else "OUT",
+        'Borrower_id': row['Borrower_id'] if row['Borrower_id'] is not None else "NULL",
+        'Copies': row['Copies'],
+        'Available': row['Available'],
+        'Availability': f"{row['Available']} of {row['Copies']} available"
+    }
+
+
+def get_books(cur, isbns):
+    """
+    Look up search result dictionaries for specific books.
+    
+    Args:
+        cur: Cursor with the sqlite3.Row row factory
+        isbns (list): ISBNs to look up (at most a few hundred)
+    
+    Returns:
+        dict: ISBN -> search result dictionary, for the ISBNs that exist
+    """
+    if not isbns:
+        return {}
+    placeholders = ",".join(["?"] * len(isbns))
+    cur.execute(BOOK_DETAILS_QUERY.format(placeholders=placeholders), list(isbns))
+    return {row['Isbn']: book_result(row) for row in cur.fetchall()}
+
+
+@metrics.timed("library_search_seconds", labels=("substring",))
+@memprofile.profiled("search.search")
+def search(search_term, limit=None, offset=0, db_path=None):
     """
     Search for books by ISBN, title, or author(s) with case-insensitive substring matching.
     
     Args:
         search_term (str): Search query (case-insensitive, substring matching)
+        limit (int): Maximum number of results to return (None for all)
+        offset (int): Number of results to skip, for paging with limit
+        db_path (str): Database to search (default: config.DB_PATH)
     
     Returns:
-        list: List of dictionaries with keys: ISBN, Title, Authors, Status
-              Status is "IN" if available, "OUT" if checked out
+        list: List of dictionaries with keys: ISBN, Title, Authors, Status,
+              Borrower_id, Copies, Available, Availability
+              Status is "IN" if any copy is available, "OUT" if all are checked out;
+              Availability reads e.g. "3 of 5 available"
     """
     # Handle empty or whitespace-only search terms
     if not search_term or not search_term.strip():
         return []
     
-    conn = sqlite3.connect(DB_PATH)
+    conn = sqlite3.connect(db_path or DB_PATH)
     conn.row_factory = sqlite3.Row
     cur = conn.cursor()
     
@@ -26,64 +171,201 @@ def search(search_term):
     
     # Find all ISBNs that match by ISBN, Title, or Author name
     # Then get all authors for those books
-    query = """
-    SELECT 
-        b.Isbn,
-        b.Title,
-        COALESCE(GROUP_CONCAT(a.Name, ', '), 'Unknown') as Authors
-    FROM BOOK b
-    LEFT JOIN BOOK_AUTHORS ba ON b.Isbn = ba.Isbn
-    LEFT JOIN AUTHORS a ON ba.Author_id = a.Author_id
-    WHERE b.Isbn IN (
-        SELECT DISTINCT Isbn 
-        FROM BOOK 
-        WHERE LOWER(Isbn) LIKE ? OR LOWER(Title) LIKE ?
-        UNION
-        SELECT DISTINCT ba2.Isbn
-        FROM BOOK_AUTHORS ba2
-        JOIN AUTHORS a2 ON ba2.Author_id = a2.Author_id
-        WHERE LOWER(a2.Name) LIKE ?
-    )
-    GROUP BY b.Isbn, b.Title
-    ORDER BY b.Isbn
+    cur.execute(SEARCH_QUERY, (search_pattern, search_pattern, search_pattern,
+                        -1 if limit is None else limit, offset))
+    search_results = [book_result(row) for row in cur.fetchall()]
+    
+    conn.close()
+    return search_results
+
+
+@metrics.timed("library_search_seconds", labels=("ranked",))
+def ranked_search(search_term, limit=20, offset=0, db_path=None):
     """
+    Search like search(), but return only the k most relevant books.
     
-    cur.execute(query, (search_pattern, search_pattern, search_pattern))
-    results = cur.fetchall()
+    Scoring: exact ISBN 1000; title starting with the term 300, containing
+    it as a whole word 200, anywhere 100; author name containing it as a
+    whole word 150, anywhere 100; ISBN containing it 50; plus up to 50 for
+    popularity (loans recorded in BOOK_POPULARITY). Ties go by ISBN.
     
-    # Check availability for each book
-    search_results = []
-    for row in results:
-        isbn = row['Isbn']
-        title = row['Title']
-        authors = row['Authors']  # Already handled by COALESCE in query
-        
-        # Check if book is currently checked out (Date_in is NULL)
-        availability_query = """
-        SELECT Card_id
-        FROM BOOK_LOANS
-        WHERE Isbn = ? AND Date_in IS NULL
-        """
-        cur.execute(availability_query, (isbn,))
-        loan_info = cur.fetchone()
-        
-        if loan_info:
-            status = "OUT"
-            borrower_id = loan_info['Card_id']
-        else:
-            status = "IN"
-            borrower_id = "NULL"
-        
-        search_results.append({
-            'ISBN': isbn,
-            'Title': title,
-            'Authors': authors,
-            'Status': status,
-            'Borrower_id': borrower_id
-        })
+    Matching still reads every title and author name (substring matches
+    cannot use an index), but only the top limit + offset books are kept
+    while sorting, and authors and availability are looked up for the
+    returned books alone.
     
+    Args:
+        search_term (str): Search query (case-insensitive, substring matching)
+        limit (int): Number of books to return (k)
+        offset (int): Number of top-ranked books to skip, for paging with limit
+        db_path (str): Database to search (default: config.DB_PATH)
+    
+    Returns:
+        list: search() dictionaries with an added Score key, best first
+    """
+    if not search_term or not search_term.strip():
+        return []
+    
+    conn = sqlite3.connect(db_path or DB_PATH)
+    conn.row_factory = sqlite3.Row
+    cur = conn.cursor()
+    
+    term = search_term.strip().lower()
+    cur.execute(RANKED_QUERY, {
+        'term': term,
+        'substring': f"%{term}%",
+        'prefix': f"{term}%",
+        'word': f"% {term} %",
+        'limit': -1 if limit is None else limit,
+        'offset': offset
+    })
+    ranked = cur.fetchall()
+    books = get_books(cur, [row['Isbn'] for row in ranked])
     conn.close()
-    return search_results
+    
+    return [{**books[row['Isbn']], 'Score': round(row['Score'], 1)} for row in ranked if row['Isbn'] in books]
+
+
+@metrics.timed("library_search_seconds", labels=("faceted",))
+@memprofile.profiled("search.search_matches")
+def search_matches(search_term, db_path=None):
+    """
+    Find every book matching a search term, with its facet values, in one query.
+    
+    The result is the input to facet_counts() and filter_matches(), so
+    narrowing a search by facet never re-scans the catalog; result pages
+    are then looked up with lookup_books(). Matches are compact tuples
+    because broad terms can match a large part of the catalog.
+    
+    Args:
+        search_term (str): Search query (case-insensitive, substring matching)
+        db_path (str): Database to search (default: config.DB_PATH)
+    
+    Returns:
+        list: (isbn, score, values) tuples in ranked_search() order, where
+              values holds a tuple of facet values per entry of FACET_NAMES
+    """
+    if not search_term or not search_term.strip():
+        return []
+    
+    conn = sqlite3.connect(db_path or DB_PATH)
+    cur = conn.cursor()
+    
+    term = search_term.strip().lower()
+    cur.execute(MATCH_FACETS_QUERY, {
+        'term': term,
+        'substring': f"%{term}%",
+        'prefix': f"{term}%",
+        'word': f"% {term} %",
+        'limit': -1,
+        'offset': 0
+    })
+    
+    # Rows of one book are adjacent; values are shared so repeated
+    # authors are stored once
+    matches = []
+    shared = {}
+    isbn = score = values = None
+    for row in cur:
+        if row[0] != isbn:
+            if isbn is not None:
+                matches.append((isbn, score, tuple(tuple(facet) for facet in values)))
+            isbn, score = row[0], round(row[1], 1)
+            values = [[] for _ in FACETS]
+        for facet, value in zip(values, row[2:]):
+            if value is not None and value not in facet:
+                facet.append(shared.setdefault(value, value))
+    if isbn is not None:
+        matches.append((isbn, score, tuple(tuple(facet) for facet in values)))
+    
+    conn.close()
+    return matches
+
+
+def facet_counts(matches, facet_names=FACET_NAMES, top=FACET_TOP):
+    """
+    Count matching books per facet value in one pass over the matches.
+    
+    Args:
+        matches (list): Tuples from search_matches() (or filter_matches())
+        facet_names (tuple): Facet name for each position of the values
+        top (int): Number of values kept per facet
+    
+    Returns:
+        dict: Facet name -> list of (value, count), most books first, then by value
+    """
+    counts = {name: {} for name in facet_names}
+    tallies = [counts[name] for name in facet_names]
+    for isbn, score, values in matches:
+        for tally, facet in zip(tallies, values):
+            for value in facet:
+                tally[value] = tally.get(value, 0) + 1
+    return {
+        name: sorted(tally.items(), key=lambda item: (-item[1], item[0]))[:top]
+        for name, tally in counts.items()
+    }
+
+
+def filter_matches(matches, filters, facet_names=FACET_NAMES):
+    """
+    Keep the matches that have every selected facet value.
+    
+    Args:
+        matches (list): Tuples from search_matches()
+        filters (dict): Facet name -> value the book must have
+        facet_names (tuple): Facet name for each position of the values
+    
+    Returns:
+        list: The matching tuples, in their original order
+    """
+    wanted = [(facet_names.index(name), value) for name, value in filters.items()]
+    if not wanted:
+        return list(matches)
+    return [match for match in matches if all(value in match[2][i] for i, value in wanted)]
+
+
+def lookup_books(isbns, db_path=None):
+    """
+    Return search() dictionaries for a page of ISBNs, in the given order.
+    
+    Args:
+        isbns (list): ISBNs, e.g. one page of search_matches()
+        db_path (str): Database to read (default: config.DB_PATH)
+    
+    Returns:
+        list: search() dictionaries for the ISBNs that exist
+    """
+    conn = sqlite3.connect(db_path or DB_PATH)
+    conn.row_factory = sqlite3.Row
+    books = get_books(conn.cursor(), list(isbns))
+    conn.close()
+    return [books[isbn] for isbn in isbns if isbn in books]
+
+
+def count_search(search_term, db_path=None):
+    """
+    Count the books that search() would return for a search term.
+    
+    Args:
+        search_term (str): Search query (case-insensitive, substring matching)
+        db_path (str): Database to search (default: config.DB_PATH)
+    
+    Returns:
+        int: Number of matching books
+    """
+    if not search_term or not search_term.strip():
+        return 0
+    
+    conn = sqlite3.connect(db_path or DB_PATH)
+    cur = conn.cursor()
+    
+    search_pattern = f"%{search_term.strip().lower()}%"
+    cur.execute(f"SELECT COUNT(*) FROM ({MATCHING_ISBNS})",
+                (search_pattern, search_pattern, search_pattern))
+    count = cur.fetchone()[0]
+    
+    conn.close()
+    return count
 
 
 def display_search_results(results):
@@ -98,7 +380,7 @@ def display_search_results(results):
         return
     
     # Print header
-    print(f"\n{'NO':<4} {'ISBN':<15} {'TITLE':<50} {'AUTHORS':<40} {'STATUS':<6}")
+    print(f"\n{'NO':<4} {'ISBN':<15} {'TITLE':<50} {'AUTHORS':<40} {'AVAILABILITY':<20}")
     print("-" * 120)
     
     # Print results
@@ -106,9 +388,9 @@ def display_search_results(results):
         isbn = result['ISBN'][:14]  # Truncate if too long
         title = result['Title'][:49]  # Truncate if too long
         authors = result['Authors'][:39]  # Truncate if too long
-        status = result['Status']
+        availability = result['Availability']
         
-        print(f"{idx:<4} {isbn:<15} {title:<50} {authors:<40} {status:<6}")
+        print(f"{idx:<4} {isbn:<15} {title:<50} {authors:<40} {availability:<20}")
     
     print()
 
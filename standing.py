@@ -0,0 +1,151 @@
+import sqlite3
+from decimal import Decimal
+from config import DB_PATH
+
+# Recomputes every borrower's standing from BOOK_LOANS/ACTIVE_LOANS/FINES.
+# Shared by rebuild_standing() and verify_standing().
+STANDING_FROM_SCRATCH = """
+SELECT
+    br.Card_id,
+    COALESCE(al.Active_loans, 0) as Active_loans,
+    COALESCE(uf.Unpaid_total, 0) as Unpaid_total,
+    CASE WHEN uf.Card_id IS NULL THEN 0 ELSE 1 END as Has_unpaid
+FROM BORROWER br
+LEFT JOIN (
+    SELECT Card_id, COUNT(*) as Active_loans
+    FROM ACTIVE_LOANS
+    GROUP BY Card_id
+) al ON br.Card_id = al.Card_id
+LEFT JOIN (
+    SELECT bl.Card_id, ROUND(SUM(f.Fine_amt), 2) as Unpaid_total
+    FROM FINES f
+    JOIN BOOK_LOANS bl ON f.Loan_id = bl.Loan_id
+    WHERE f.Paid = 0
+    GROUP BY bl.Card_id
+) uf ON br.Card_id = uf.Card_id
+"""
+
+
+def adjust_standing(cur, card_id, loans_delta=0, fine_delta=Decimal('0.00'), has_unpaid=None):
+    """
+    Incrementally update a borrower's standing row inside the caller's transaction.
+
+    Args:
+        cur: Cursor on the connection that owns the current transaction
+        card_id (str): Borrower card ID
+        loans_delta (int): Change in the number of active loans
+        fine_delta (Decimal): Change in the unpaid fine total
+        has_unpaid (bool): New value of the unpaid flag, or None to leave it unchanged
+    """
+    flag = None if has_unpaid is None else int(has_unpaid)
+    cur.execute("""
+        INSERT INTO BORROWER_STANDING (Card_id, Active_loans, Unpaid_total, Has_unpaid)
+        VALUES (?, MAX(?, 0), MAX(ROUND(?, 2), 0), COALESCE(?, 0))
+        ON CONFLICT (Card_id) DO UPDATE SET
+            Active_loans = MAX(Active_loans + ?, 0),
+            Unpaid_total = MAX(ROUND(Unpaid_total + ?, 2), 0),
+            Has_unpaid = COALESCE(?, Has_unpaid)
+    """, (card_id, loans_delta, str(fine_delta), flag, loans_delta, str(fine_delta), flag))
+
+
+def get_standing(card_id):
+    """
+    Get a borrower's checkout eligibility with a single primary-key read.
+
+    Args:
+        card_id (str): Borrower card ID
+
+    Returns:
+        dict: Keys Card_id, Active_loans, Unpaid_total, Has_unpaid,
+              or None if the borrower does not exist
+    """
+    conn = sqlite3.connect(DB_PATH)
+    conn.row_factory = sqlite3.Row
+    cur = conn.cursor()
+
+    cur.execute("""
+        SELECT
+            br.Card_id,
+            COALESCE(s.Active_loans, 0) as Active_loans,
+            COALESCE(s.Unpaid_total, 0) as Unpaid_total,
+            COALESCE(s.Has_unpaid, 0) as Has_unpaid
+        FROM BORROWER br
+        LEFT JOIN BORROWER_STANDING s ON br.Card_id = s.Card_id
+        WHERE br.Card_id = ?
+    """, (card_id,))
+    row = cur.fetchone()
+    conn.close()
+
+    if not row:
+        return None
+
+    return {
+        'Card_id': row['Card_id'],
+        'Active_loans': row['Active_loans'],
+        'Unpaid_total': Decimal(str(row['Unpaid_total'])).quantize(Decimal('0.01')),
+        'Has_unpaid': bool(row['Has_unpaid'])
+    }
+
+
+def rebuild_standing(conn):
+    """
+    Rebuild BORROWER_STANDING from scratch.
+
+    Args:
+        conn: Open database connection
+    """
+    cur = conn.cursor()
+    cur.execute("DELETE FROM BORROWER_STANDING")
+    cur.execute(f"""
+        INSERT INTO BORROWER_STANDING (Card_id, Active_loans, Unpaid_total, Has_unpaid)
+        {STANDING_FROM_SCRATCH}
+    """)
+    conn.commit()
+
+
+def verify_standing(repair=False):
+    """
+    Compare BORROWER_STANDING with a from-scratch recomputation.
+
+    Args:
+        repair (bool): If True, rebuild the table when mismatches are found
+
+    Returns:
+        list: One dictionary per mismatched borrower with the stored and
+              expected values (empty if the table is consistent)
+    """
+    conn = sqlite3.connect(DB_PATH)
+    conn.row_factory = sqlite3.Row
+    cur = conn.cursor()
+
+    cur.execute(f"""
+        SELECT
+            e.Card_id,
+            s.Active_loans as Stored_loans,
+            e.Active_loans as Expected_loans,
+            s.Unpaid_total as Stored_total,
+            e.Unpaid_total as Expected_total,
+            s.Has_unpaid as Stored_flag,
+            e.Has_unpaid as Expected_flag
+        FROM ({STANDING_FROM_SCRATCH}) e
+        LEFT JOIN BORROWER_STANDING s ON e.Card_id = s.Card_id
+        WHERE COALESCE(s.Active_loans, 0) != e.Active_loans
+           OR ROUND(COALESCE(s.Unpaid_total, 0), 2) != ROUND(e.Unpaid_total, 2)
+           OR COALESCE(s.Has_unpaid, 0) != e.Has_unpaid
+        ORDER BY e.Card_id
+    """)
+    mismatches = [dict(row) for row in cur.fetchall()]
+
+    if mismatches and repair:
+        rebuild_standing(conn)
+
+    conn.close()
+    return mismatches
+
+
+if __name__ == "__main__":
+    problems = verify_standing(repair=True)
+    if problems:
+        print(f"Rebuilt BORROWER_STANDING ({len(problems)} mismatched borrower(s)).")
+    else:
+        print("BORROWER_STANDING is consistent.")
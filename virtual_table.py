@@ -0,0 +1,206 @@
+import tkinter as tk
+from tkinter import ttk
+from collections import OrderedDict
+import memprofile
+
+PAGE_SIZE = 200
+MAX_CACHED_PAGES = 10
+DEFAULT_ROW_HEIGHT = 20
+
+
+class VirtualTable(ttk.Frame):
+    """
+    A Treeview that only holds the rows currently on screen.
+
+    Rows come from a paged backend: count_fn() returns the total number of
+    rows and fetch_fn(offset, limit) returns a list of value tuples. Pages
+    are cached (and the next page prefetched) so scrolling only hits the
+    backend when it reaches rows it has not seen yet. Each row's key, by
+    default its first value, keeps the selection while scrolling; pass
+    key_fn when the first value alone is not unique.
+    """
+
+    def __init__(self, parent, columns, widths=None, height=20, selectmode=tk.BROWSE, page_size=PAGE_SIZE,
+                 key_fn=None):
+        super().__init__(parent)
+        self.columns = columns
+        self.key_fn = key_fn or (lambda row: row[0])
+        self.page_size = page_size
+        self.visible_rows = height
+        self.count_fn = None
+        self.fetch_fn = None
+        self.total = 0
+        self.offset = 0
+        self.pages = OrderedDict()
+        self.selected = OrderedDict()  # key -> values, includes rows scrolled out of view
+        self.rendering = False
+        self.item_rows = {}  # Treeview item id -> row values for the rows on screen
+
+        self.tree = ttk.Treeview(self, columns=columns, show="headings", height=height, selectmode=selectmode)
+        for col in columns:
+            self.tree.heading(col, text=col)
+            if widths and col in widths:
+                self.tree.column(col, width=widths[col])
+
+        self.scrollbar = ttk.Scrollbar(self, orient=tk.VERTICAL, command=self.on_scrollbar)
+        self.tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        self.scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+
+        self.tree.bind('<Configure>', self.on_resize)
+        self.tree.bind('<<TreeviewSelect>>', self.on_select)
+        self.tree.bind('<MouseWheel>', lambda e: self.scroll_rows(-1 if e.delta > 0 else 1) or "break")
+        self.tree.bind('<Button-4>', lambda e: self.scroll_rows(-1) or "break")
+        self.tree.bind('<Button-5>', lambda e: self.scroll_rows(1) or "break")
+        self.tree.bind('<Prior>', lambda e: self.scroll_rows(-self.visible_rows) or "break")
+        self.tree.bind('<Next>', lambda e: self.scroll_rows(self.visible_rows) or "break")
+        self.tree.bind('<Up>', self.on_key_up)
+        self.tree.bind('<Down>', self.on_key_down)
+
+    def set_source(self, count_fn, fetch_fn):
+        """
+        Point the table at a new paged backend and show its first rows.
+
+        Returns:
+            int: Total number of rows
+        """
+        self.count_fn = count_fn
+        self.fetch_fn = fetch_fn
+        self.pages.clear()
+        self.selected.clear()
+        self.offset = 0
+        self.total = count_fn()
+        self.render()
+        return self.total
+
+    def refresh(self):
+        """Re-query the current backend, keeping the scroll position if possible"""
+        if not self.count_fn:
+            return
+        self.pages.clear()
+        self.total = self.count_fn()
+        self.offset = max(0, min(self.offset, self.total - self.visible_rows))
+        self.render()
+
+    def clear(self):
+        """Remove all rows and detach the backend"""
+        self.count_fn = None
+        self.fetch_fn = None
+        self.pages.clear()
+        self.selected.clear()
+        self.total = 0
+        self.offset = 0
+        self.render()
+
+    def selected_values(self):
+        """Return the value tuples of all selected rows, including ones scrolled out of view"""
+        return list(self.selected.values())
+
+    def get_page(self, page_no):
+        """Return one page of rows, fetching it from the backend if not cached"""
+        if page_no in self.pages:
+            self.pages.move_to_end(page_no)
+            return self.pages[page_no]
+        rows = [tuple(row) for row in self.fetch_fn(page_no * self.page_size, self.page_size)]
+        self.pages[page_no] = rows
+        if len(self.pages) > MAX_CACHED_PAGES:
+            self.pages.popitem(last=False)
+        return rows
+
+    def get_rows(self, start, count):
+        """Return rows start..start+count from the page cache"""
+        rows = []
+        index = start
+        end = min(start + count, self.total)
+        while index < end:
+            page_no, page_offset = divmod(index, self.page_size)
+            page = self.get_page(page_no)
+            chunk = page[page_offset:page_offset + (end - index)]
+            if not chunk:
+                break
+            rows.extend(chunk)
+            index += len(chunk)
+        return rows
+
+    @memprofile.profiled("VirtualTable.render")
+    def render(self):
+        """Replace the Treeview items with the rows in the current window"""
+        self.rendering = True
+        self.tree.delete(*self.tree.get_children())
+
+        rows = self.get_rows(self.offset, self.visible_rows) if self.fetch_fn else []
+        self.item_rows = {}
+        reselect = []
+        for row in rows:
+            item = self.tree.insert("", tk.END, values=row)
+            self.item_rows[item] = row
+            if self.key_fn(row) in self.selected:
+                reselect.append(item)
+        self.tree.selection_set(reselect)
+
+        # Prefetch the next page so steady scrolling does not stall on the backend
+        if self.fetch_fn and self.offset + self.visible_rows < self.total:
+            self.get_page((self.offset + self.visible_rows) // self.page_size)
+
+        if self.total:
+            self.scrollbar.set(self.offset / self.total, min(1.0, (self.offset + self.visible_rows) / self.total))
+        else:
+            self.scrollbar.set(0.0, 1.0)
+        self.tree.update_idletasks()
+        self.rendering = False
+
+    def scroll_to(self, offset):
+        offset = max(0, min(offset, self.total - self.visible_rows))
+        if offset != self.offset:
+            self.offset = offset
+            self.render()
+
+    def scroll_rows(self, delta):
+        self.scroll_to(self.offset + delta)
+
+    def on_scrollbar(self, action, amount, unit=None):
+        if action == tk.MOVETO:
+            self.scroll_to(int(float(amount) * self.total))
+        elif action == tk.SCROLL:
+            step = self.visible_rows if unit == tk.PAGES else 1
+            self.scroll_rows(int(amount) * step)
+
+    def on_resize(self, event):
+        style = ttk.Style()
+        row_height = int(style.lookup('Treeview', 'rowheight') or DEFAULT_ROW_HEIGHT)
+        visible = max(1, (event.height - row_height) // row_height)  # minus the heading row
+        if visible != self.visible_rows:
+            self.visible_rows = visible
+            self.tree.configure(height=visible)
+            self.offset = max(0, min(self.offset, self.total - visible))
+            self.render()
+
+    def on_select(self, event):
+        if self.rendering:
+            return
+        if str(self.tree.cget('selectmode')) == tk.BROWSE:
+            # An empty selection here just means the selected row scrolled away
+            if not self.tree.selection():
+                return
+            self.selected.clear()
+        else:
+            for row in self.item_rows.values():
+                self.selected.pop(self.key_fn(row), None)
+        for item in self.tree.selection():
+            row = self.item_rows[item]
+            self.selected[self.key_fn(row)] = row
+
+    def on_key_up(self, event):
+        focus = self.tree.focus()
+        children = self.tree.get_children()
+        if children and focus == children[0] and self.offset > 0:
+            self.scroll_rows(-1)
+            self.tree.focus(self.tree.get_children()[0])
+            return "break"
+
+    def on_key_down(self, event):
+        focus = self.tree.focus()
+        children = self.tree.get_children()
+        if children and focus == children[-1] and self.offset + self.visible_rows < self.total:
+            self.scroll_rows(1)
+            self.tree.focus(self.tree.get_children()[-1])
+            return "break"